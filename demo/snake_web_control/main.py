@@ -1,4 +1,4 @@
-from microdot import Microdot, send_file
+from miniweb import Miniweb, send_file
 from ssd1306 import SSD1306_I2C
 from machine import Pin, SoftI2C, Timer
 from snake import Snake
@@ -14,7 +14,7 @@ def update(timer):
 
 Timer(0).init(period=300, mode=Timer.PERIODIC, callback=update)
 
-app = Microdot()
+app = Miniweb()
 
 @app.get('/')
 async def index(request):
@@ -36,6 +36,19 @@ async def index(request):
     snake = Snake(screen)
     return 'reseted'
 
+@app.websocket('/ws')
+async def control(request, ws):
+    global snake
+    while True:
+        cmd = await ws.receive()
+        if cmd == 'left':
+            snake.left()
+        elif cmd == 'right':
+            snake.right()
+        elif cmd == 'reset':
+            snake = Snake(screen)
+        await ws.send(cmd)
+
 
 
 app.run(port=80)
\ No newline at end of file
@@ -1,10 +1,10 @@
-from microdot import Microdot, send_file
+from miniweb import Miniweb, send_file
 from machine import Pin
 from neopixel import NeoPixel
 
 
 strip = NeoPixel(Pin(20), 30)
-app = Microdot()
+app = Miniweb()
 
 
 @app.get('/')
@@ -28,7 +28,7 @@ async def set_color(request):
     data = request.json
     color = [data['r'], data['g'], data['b']]
     strip.fill(color)
-    strip.write()
+    request.defer(strip.write)
     return 'test'
 
 app.run(port=80)
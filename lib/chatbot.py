@@ -1,4 +1,5 @@
-import requests
+import asyncio
+from miniclient import HTTPClient
 
 def escape_unicode(s):
     return ''.join(c if ord(c) < 128 else '\\u%04x' % ord(c) for c in s)
@@ -12,56 +13,77 @@ class ChatBot:
                         prompt="reply in Chinese, within 20 words",
                         ready_message='我准备好了， 一起来聊天吧！',
                         bot_avatar='🤖',
-                        user_avatar='🤔'):
+                        user_avatar='🤔',
+                        url="https://api.deepseek.com/v1/chat/completions"):
         self.bot_avatar = bot_avatar
         self.user_avatar = user_avatar
         self.ready_message = ready_message or "聊天机器人已就绪，请输入您的问题。"
         self.api_key = api_key
-        self.url = "https://api.deepseek.com/v1/chat/completions"
+        self.url = url
+        self.client = HTTPClient(timeout=30)  # 连接池：多轮对话复用同一连接，不用每次重新握手
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
         self.messages = [{"role": "system", "content": escape_unicode(prompt)}]
         
-        # 验证 API Key 是否有效
-        print(f"{self.bot_avatar}: 聊天机器人创建成功，正在验证 API Key...")
-        self.is_valid = self.validate()
-        
+        # API Key 在调用 validate() 或第一次对话时验证，
+        # 这样在 asyncio 程序中也可以创建聊天机器人
+        self.is_valid = None
+        print(f"{self.bot_avatar}: 聊天机器人创建成功。")
+
     def validate(self):
+        # 同步调用都在 HTTPClient 的同一个事件循环中执行，连接在多次调用之间保持
+        return self.client.run(self.validate_async())
+
+    async def validate_async(self):
+        print(f"{self.bot_avatar}: 正在验证 API Key...")
+        self.is_valid = await self._check_key()
+        return self.is_valid
+
+    async def _check_key(self):
         payload = {"model": "deepseek-chat", "messages": [{"role": "user", "content":"hello, reply shortly"}]}
         try:
-            response = requests.post(self.url, json=payload, headers=self.headers)
+            response = await self.client.post(self.url, json=payload, headers=self.headers)
+            body = await response.read()
             
-            if response.status_code == 200:
+            if response.status == 200:
                 print(f"{self.bot_avatar}: {self.ready_message}")
                 return True
-            elif response.status_code == 401:
+            elif response.status == 401:
                 print(f"{self.bot_avatar}: 401 - API 密钥无效，请检查密钥是否正确。")
                 return False
-            elif response.status_code == 402:
+            elif response.status == 402:
                 print(f"{self.bot_avatar}: 402 - 账户余额不足，请充值后再试。")
                 return False
-            elif response.status_code == 429:
+            elif response.status == 429:
                 print(f"{self.bot_avatar}: 429 - 您的请求速率已达到上限，请稍后再试。")
                 return False
-            elif response.status_code == 500:
+            elif response.status == 500:
                 print(f"{self.bot_avatar}: 500 - 服务器内部错误，请稍后再试。")
                 return False
-            elif response.status_code == 503:
+            elif response.status == 503:
                 print(f"{self.bot_avatar}: 503 - 服务器繁忙，请稍后再试。")
                 return False
             else:
-                print(f"{self.bot_avatar}: 请求失败，状态码: {response.status_code}, 响应内容: {response.text}")
+                print(f"{self.bot_avatar}: 请求失败，状态码: {response.status}, 响应内容: {body.decode()}")
                 return False
-        except requests.exceptions.ConnectionError as e:
+        except asyncio.TimeoutError:
+            print(f"{self.bot_avatar}: 请求超时，请稍后再试。")
+            return False
+        except OSError as e:
             print(f"{self.bot_avatar}: 请求失败，网络未连接。")
             return False
-        except requests.exceptions.RequestException as e:
+        except Exception as e:
             print(f"{self.bot_avatar}: API Key 验证失败: {e}")
             return False
 
     def chat(self, message):
+        return self.client.run(self.chat_async(message))
+
+    async def chat_async(self, message):
+        if self.is_valid is None:
+            await self.validate_async()
         if not self.is_valid:
             answer  = f"{self.bot_avatar}: 请检查网络是否正常连接、 API 密钥是否正确、账户余额是否充足。"
             print(answer)
@@ -73,14 +95,18 @@ class ChatBot:
         
         
         payload = {"model": "deepseek-chat", "messages": self.messages}
-        response = requests.post(self.url, json=payload, headers=self.headers)
-        response_json = response.json()
+        response = await self.client.post(self.url, json=payload, headers=self.headers)
+        response_json = await response.json()
         if 'choices' in response_json and len(response_json['choices']) > 0:
             answer = response_json["choices"][0]["message"]["content"]
             self.messages.append({"role": "assistant", "content": answer})
             print(f"{self.bot_avatar}: {answer}")
             return answer
 
+    def close(self):
+        """关闭同步调用留下的连接，asyncio 程序中请使用 await bot.client.close()"""
+        self.client.run(self.client.close())
+
     def reset(self):
         self.messages = [{"role": "system", "content": "reply in Chinese, within 20 words"}]
         print(f"{self.bot_avatar}: 已重置聊天记录和提示词。")
@@ -100,7 +126,7 @@ class ChatBot:
             return
         
         bot = cls(api_key=api_key)
-        if not bot.is_valid:
+        if not bot.validate():
             print("❌ API Key 无效或网络连接失败，测试终止。")
             return
         
@@ -109,6 +135,7 @@ class ChatBot:
             user_input = input("你: ").strip()
             if user_input.lower() == 'exit':
                 print("👋 测试结束，感谢使用！")
+                bot.close()
                 break
             bot.chat(user_input)
     
@@ -128,11 +155,16 @@ class ChatBot:
     # ready_message : 机器人就绪提示语，默认为 "我准备好了， 一起来聊天吧！"
     # bot_avatar    : 机器人头像符号，默认为 '🤖'
     # user_avatar   : 用户头像符号，默认为 '🤔'
+    # url           : 接口地址，默认为 DeepSeek 官方地址
 [方法]:
     chat(message)      → 发送消息并获取回复
     reset()            → 重置聊天记录和提示词
     set_prompt(prompt) → 设置新的提示词
-    validate()        → 验证 API Key 是否有效
+    validate()        → 验证 API Key 是否有效（不调用时在第一次对话前自动验证）
+    close()            → 关闭连接
+    await chat_async(message) → 在 asyncio 程序（如 miniweb）中使用，不阻塞其它任务
+    await validate_async()    → validate() 的异步版本
+    同步方法之间复用同一个连接；在 asyncio 程序中只能使用异步方法
 --------------------
 [使用示例]:
     from chatbot import ChatBot
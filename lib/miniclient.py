@@ -0,0 +1,493 @@
+import asyncio
+from json import dumps, loads
+
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:  # 电脑上的 CPython 没有 ticks 系列函数
+    import time
+
+    def ticks_ms():
+        return int(time.perf_counter() * 1000)
+
+    def ticks_diff(end, start):
+        return end - start
+
+
+def urlsplit(url):
+    """把 URL 拆成 (scheme, host, port, path)"""
+    scheme, sep, rest = url.partition('://')
+    if not sep:
+        scheme, rest = 'http', url
+    host, sep, path = rest.partition('/')
+    path = '/' + path
+    if ':' in host:
+        host, port = host.rsplit(':', 1)
+        port = int(port)
+    else:
+        port = 443 if scheme == 'https' else 80
+    return scheme, host, port, path
+
+
+_NO_KEY = object()
+_SPACE = (0x20, 0x09, 0x0d, 0x0a)
+_DELIMITERS = _SPACE + (0x2c, 0x5d, 0x7d)  # 空白和 , ] }
+
+
+class JSONParser:
+    """
+    增量 JSON 解析器：数据可以分成任意大小的块依次送入 feed()，
+    不需要先拼出完整的响应体，内存占用只有解析结果加上一块数据
+    """
+    def __init__(self):
+        self.stack = []       # 尚未结束的 list / dict
+        self.keys = []        # 外层 dict 等待赋值的键
+        self.key = _NO_KEY    # 当前 dict 等待赋值的键
+        self.names = {}       # 重复出现的键共用同一个字符串对象
+        self.token = None     # 跨块未完成的字符串、数字或 true/false/null
+        self.string = False   # token 是否为字符串
+        self.escaped = False  # 字符串中是否有转义字符
+        self.value = None
+        self.done = False
+
+    def feed(self, data):
+        i = 0
+        n = len(data)
+        if self.token is not None:
+            i = self.read_token(data, 0)
+        while i < n:
+            c = data[i]
+            if c in _SPACE:
+                i += 1
+            elif self.done:
+                raise ValueError('extra data')
+            elif c == 0x22:  # "
+                self.token = bytearray()
+                self.string = True
+                self.escaped = False
+                i = self.read_token(data, i + 1)
+            elif c == 0x7b or c == 0x5b:  # { [
+                self.keys.append(self.key)
+                self.key = _NO_KEY
+                self.stack.append({} if c == 0x7b else [])
+                i += 1
+            elif c == 0x7d or c == 0x5d:  # } ]
+                if not self.stack or \
+                        isinstance(self.stack[-1], dict) != (c == 0x7d):
+                    raise ValueError('unexpected ' + chr(c))
+                self.key = self.keys.pop()
+                self.emit(self.stack.pop())
+                i += 1
+            elif c == 0x2c or c == 0x3a:  # , :
+                i += 1
+            else:
+                self.token = bytearray()
+                self.string = False
+                i = self.read_token(data, i)
+
+    def read_token(self, data, i):
+        """继续读取未完成的 token，返回下一个待处理的位置"""
+        token = self.token
+        if self.string:
+            while True:
+                j = data.find(b'"', i)
+                end = len(data) if j < 0 else j
+                token += data[i:end]
+                if data.find(b'\\', i, end) >= 0:
+                    self.escaped = True
+                if j < 0:
+                    return end
+                # 前面有奇数个反斜杠时引号是被转义的
+                k = len(token)
+                while k and token[k - 1] == 0x5c:
+                    k -= 1
+                if (len(token) - k) % 2 == 0:
+                    break
+                token += b'"'
+                i = j + 1
+            self.token = None
+            if self.escaped:
+                self.emit(loads(b'"' + bytes(token) + b'"'))
+            else:
+                self.emit(str(token, 'utf-8'))
+            return j + 1
+        j = i
+        n = len(data)
+        while j < n and data[j] not in _DELIMITERS:
+            j += 1
+        token += data[i:j]
+        if j < n:
+            self.end_literal()
+        return j
+
+    def end_literal(self):
+        token = self.token
+        self.token = None
+        try:
+            value = loads(bytes(token))
+        except ValueError:
+            raise ValueError('invalid literal ' + repr(bytes(token)))
+        self.emit(value)
+
+    def emit(self, value):
+        if not self.stack:
+            self.value = value
+            self.done = True
+        elif isinstance(self.stack[-1], list):
+            self.stack[-1].append(value)
+        elif self.key is _NO_KEY:
+            self.key = self.names.setdefault(value, value)
+        else:
+            self.stack[-1][self.key] = value
+            self.key = _NO_KEY
+
+    def result(self):
+        """所有数据送入后调用，返回解析结果"""
+        if self.token is not None and not self.string and not self.stack:
+            self.end_literal()  # 顶层是单独的数字等，结尾没有分隔符
+        if not self.done:
+            raise ValueError('incomplete JSON')
+        return self.value
+
+
+class ClientResponse:
+    """
+    HTTP 响应，响应体可以一次读完（read/text/json），也可以分块流式读取
+    """
+    def __init__(self, client, key, reader, writer, method):
+        self.client = client
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.method = method
+        self.version = ''
+        self.status = 0
+        self.reason = ''
+        self.headers = {}
+        self.length = None       # Content-Length 剩余字节数，None 表示未知
+        self.chunked = False
+        self.chunk_left = 0      # 当前 chunk 剩余字节数
+        self.keep_alive = False
+        self.done = False
+
+    async def read_head(self):
+        line = await self.client.wait(self.reader.readline())
+        if not line:
+            raise OSError('connection closed')
+        parts = line.decode().strip().split(' ', 2)
+        self.version = parts[0]
+        self.status = int(parts[1])
+        self.reason = parts[2] if len(parts) > 2 else ''
+        while True:
+            line = await self.client.wait(self.reader.readline())
+            if line in (b'\r\n', b'\n', b''):
+                break
+            header, _, value = line.decode().partition(':')
+            self.headers[header.strip().lower()] = value.strip()
+
+        # 根据响应头判断响应体的长度和连接能否复用
+        if self.method == 'HEAD' or self.status in (204, 304) or \
+                100 <= self.status < 200:
+            self.length = 0
+        elif self.headers.get('transfer-encoding', '').lower() == 'chunked':
+            self.chunked = True
+        elif 'content-length' in self.headers:
+            self.length = int(self.headers['content-length'])
+        self.keep_alive = self.version == 'HTTP/1.1' and \
+            'close' not in self.headers.get('connection', '').lower() and \
+            (self.chunked or self.length is not None)
+        if self.length == 0:
+            await self.finish()
+
+    async def read_chunk(self, size=1024):
+        """读取最多 size 字节的响应体，读完后返回 b''"""
+        if self.done:
+            return b''
+        reader = self.reader
+        if self.chunked:
+            if not self.chunk_left:
+                line = await self.client.wait(reader.readline())
+                self.chunk_left = int(line.split(b';')[0].strip(), 16)
+                if not self.chunk_left:
+                    # 最后一个 chunk，跳过 trailer 头部
+                    while (await self.client.wait(reader.readline())) \
+                            not in (b'\r\n', b'\n', b''):
+                        pass
+                    await self.finish()
+                    return b''
+            data = await self.client.wait(
+                reader.read(min(size, self.chunk_left)))
+            if not data:
+                raise OSError('connection closed')
+            self.chunk_left -= len(data)
+            if not self.chunk_left:
+                await self.client.wait(reader.readexactly(2))
+            return data
+        if self.length is None:
+            # 没有长度信息，一直读到对方关闭连接
+            data = await self.client.wait(reader.read(size))
+            if not data:
+                await self.finish()
+            return data
+        data = await self.client.wait(reader.read(min(size, self.length)))
+        if not data:
+            raise OSError('connection closed')
+        self.length -= len(data)
+        if not self.length:
+            await self.finish()
+        return data
+
+    async def readinto(self, buf):
+        """把响应体读入 buf（bytearray 或 memoryview），返回读到的字节数"""
+        if self.done:
+            return 0
+        if self.length and not self.chunked and \
+                hasattr(self.reader, 'readinto'):
+            # MicroPython 的 Stream 可以直接读入缓冲区，省去一次复制
+            n = await self.client.wait(
+                self.reader.readinto(memoryview(buf)[:self.length]))
+            if not n:
+                raise OSError('connection closed')
+            self.length -= n
+            if not self.length:
+                await self.finish()
+            return n
+        data = await self.read_chunk(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    async def read(self):
+        """读取完整的响应体，已知长度时预先分配好缓冲区"""
+        if self.length is not None and not self.chunked:
+            buf = bytearray(self.length)
+            view = memoryview(buf)
+            pos = 0
+            while pos < len(buf):
+                pos += await self.readinto(view[pos:])
+            return buf
+        buf = bytearray()
+        while True:
+            data = await self.read_chunk(1024)
+            if not data:
+                return buf
+            buf += data
+
+    async def text(self, encoding='utf-8'):
+        return (await self.read()).decode(encoding)
+
+    async def json(self, chunk_size=512):
+        """边接收边解析 JSON，不需要先把完整的响应体读入内存"""
+        parser = JSONParser()
+        while True:
+            data = await self.read_chunk(chunk_size)
+            if not data:
+                return parser.result()
+            parser.feed(data)
+
+    async def finish(self):
+        """响应体读完后把连接放回连接池"""
+        if not self.done:
+            self.done = True
+            if self.keep_alive:
+                self.client.release(self.key, self.reader, self.writer)
+            else:
+                await self.client.close_connection(self.writer)
+
+    async def close(self):
+        """提前放弃剩余的响应体，直接关闭连接"""
+        if not self.done:
+            self.done = True
+            await self.client.close_connection(self.writer)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        data = await self.read_chunk()
+        if not data:
+            raise StopAsyncIteration
+        return data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+class HTTPClient:
+    """
+    异步 HTTP/1.1 客户端，同一主机的连接会保持并复用（keep-alive 连接池）
+    """
+    max_idle = 2           # 每个主机最多保留的空闲连接数
+    idle_timeout = 30      # 空闲连接保留的秒数
+
+    def __init__(self, timeout=10, headers=None):
+        self.timeout = timeout
+        self.headers = headers or {}
+        self.pool = {}
+        self.pool_loop = None   # 连接池中的连接所属的事件循环
+        self.loop = None        # run() 使用的事件循环
+        self.connections = 0    # 实际新建的连接数，用于统计复用效果
+
+    async def wait(self, coro, timeout=None):
+        timeout = timeout or self.timeout
+        if timeout:
+            return await asyncio.wait_for(coro, timeout)
+        return await coro
+
+    async def connect(self, key):
+        # 连接只能在创建它的事件循环中使用，换了事件循环（如再次调用
+        # asyncio.run）就丢弃旧的空闲连接
+        loop = asyncio.get_event_loop()
+        if loop is not self.pool_loop:
+            for idle in self.pool.values():
+                while idle:
+                    try:
+                        idle.pop()[1].close()
+                    except Exception:
+                        pass
+            self.pool_loop = loop
+        idle = self.pool.get(key)
+        while idle:
+            reader, writer, since = idle.pop()
+            if ticks_diff(ticks_ms(), since) < self.idle_timeout * 1000:
+                return reader, writer, True
+            await self.close_connection(writer)
+        scheme, host, port = key
+        reader, writer = await self.wait(asyncio.open_connection(
+            host, port, ssl=True if scheme == 'https' else None))
+        self.connections += 1
+        return reader, writer, False
+
+    def release(self, key, reader, writer):
+        idle = self.pool.setdefault(key, [])
+        if len(idle) < self.max_idle:
+            idle.append((reader, writer, ticks_ms()))
+        else:
+            writer.close()
+
+    async def close_connection(self, writer):
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except Exception:
+            pass
+
+    async def request(self, method, url, headers=None, data=None,
+                      json=None):
+        """
+        发送请求并返回 ClientResponse，响应头已读取，响应体需要继续读取
+
+        :param data: 请求体（str 或 bytes）
+        :param json: 要以 JSON 格式发送的对象
+        """
+        scheme, host, port, path = urlsplit(url)
+        all_headers = {'Host': host if port in (80, 443)
+                       else '{}:{}'.format(host, port)}
+        all_headers.update(self.headers)
+        all_headers.update(headers or {})
+        if json is not None:
+            data = dumps(json)
+            all_headers.setdefault('Content-Type', 'application/json')
+        if isinstance(data, str):
+            data = data.encode()
+        if data is not None or method in ('POST', 'PUT', 'PATCH'):
+            all_headers['Content-Length'] = str(len(data or b''))
+
+        # 请求行、请求头和较小的请求体合并成一次写入
+        head = ['{} {} HTTP/1.1\r\n'.format(method, path)]
+        for header, value in all_headers.items():
+            head.append('{}: {}\r\n'.format(header, value))
+        head.append('\r\n')
+        head = ''.join(head).encode()
+        if data and len(data) <= 1024:
+            head += data
+            data = None
+
+        key = (scheme, host, port)
+        while True:
+            reader, writer, reused = await self.connect(key)
+            response = ClientResponse(self, key, reader, writer, method)
+            try:
+                writer.write(head)
+                if data:
+                    writer.write(data)
+                await self.wait(writer.drain())
+                await response.read_head()
+                return response
+            except Exception as exc:
+                await self.close_connection(writer)
+                # 复用的连接可能已被服务器关闭，换一个新连接重试一次
+                if not reused or not isinstance(exc, (OSError, EOFError)) \
+                        or isinstance(exc, asyncio.TimeoutError):
+                    raise
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def close(self):
+        """关闭连接池中的所有空闲连接"""
+        for idle in self.pool.values():
+            while idle:
+                await self.close_connection(idle.pop()[1])
+
+    def run(self, coro):
+        """
+        在同步代码中执行协程并返回结果。多次调用使用同一个事件循环，
+        连接池中的连接可以继续复用；不能在运行中的事件循环里调用
+        """
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        return self.loop.run_until_complete(coro)
+
+    @staticmethod
+    def help():
+        print("""
+【异步 HTTP 客户端 HTTPClient】
+--------------------
+[功能]:
+    - 基于 asyncio 的 HTTP/1.1 客户端，不会阻塞同一事件循环中的 miniweb 服务器
+    - 同一主机的连接自动保持并复用（keep-alive 连接池）
+    - 支持 Content-Length 和 chunked 两种响应体，支持超时和流式读取
+    - JSONParser 增量 JSON 解析器，数据可以分块送入 parser.feed(data)
+
+--------------------
+[创建实例]:
+    client = HTTPClient(timeout=10, headers=None)
+    # timeout: 连接、发送和每次读取的超时时间（秒）
+    # headers: 每个请求都会带上的请求头（可选）
+[方法]:
+    - await client.get(url, headers=None)
+    - await client.post(url, headers=None, data=None, json=None)
+    - await client.request(method, url, headers=None, data=None, json=None)
+      以上方法返回响应对象 response，然后读取响应体：
+    - await response.read()       读取全部内容（bytearray）
+    - await response.text()       读取全部内容并解码为字符串
+    - await response.json()       边接收边解析 JSON（增量解析，不缓存完整响应体）
+    - await response.read_chunk() 流式读取一块内容，读完返回 b''
+    - await client.close()        关闭所有空闲连接
+    - client.run(coro)            在同步代码中执行协程，多次调用之间复用连接
+
+--------------------
+[使用示例]:
+    import asyncio
+    from miniclient import HTTPClient
+
+    client = HTTPClient()
+
+    async def main():
+        response = await client.get('http://example.com/')
+        print(response.status, await response.text())
+
+        # 流式读取大文件
+        response = await client.get('http://example.com/big.bin')
+        async for chunk in response:
+            print(len(chunk))
+
+    asyncio.run(main())
+--------------------
+""")
+
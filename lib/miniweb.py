@@ -1,10 +1,12 @@
 import asyncio
+import binascii
+import hashlib
 import io
+import os
 import re
+import struct
 import time
-
-MAX_ROUTES = 3
-
+from collections import OrderedDict
 
 try:
     import orjson as json
@@ -32,6 +34,54 @@ except ImportError:
             ret = await ret
         return ret
 
+try:
+    from time import ticks_us, ticks_ms, ticks_diff
+except ImportError:  
+    def ticks_us():
+        return int(time.perf_counter() * 1000000)
+
+    def ticks_ms():
+        return int(time.perf_counter() * 1000)
+
+    def ticks_diff(end, start):
+        return end - start
+
+try:
+    import zlib
+
+    def compressobj(encoding, level, wbits):
+        return zlib.compressobj(level, zlib.DEFLATED,
+                                wbits + 16 if encoding == 'gzip' else wbits)
+except ImportError:  
+    try:
+        import deflate
+
+        class compressobj(io.IOBase):
+            def __init__(self, encoding, level, wbits):
+                self.chunks = []
+                self.stream = deflate.DeflateIO(
+                    self, deflate.GZIP if encoding == 'gzip'
+                    else deflate.ZLIB, wbits)
+
+            def write(self, data):
+                self.chunks.append(bytes(data))
+                return len(data)
+
+            def compress(self, data):
+                self.stream.write(data)
+                return self.take()
+
+            def flush(self):
+                self.stream.close()
+                return self.take()
+
+            def take(self):
+                data = b''.join(self.chunks)
+                self.chunks = []
+                return data
+    except ImportError:
+        compressobj = None
+
 try:
     from sys import print_exception
 except ImportError:  
@@ -66,6 +116,62 @@ def urldecode(s):
     return b''.join(result).decode()
 
 
+def iter_json(obj, chunk_size=512, dumps=None):
+    dumps = dumps or Response.json_dumps
+    leaves = (str, int, float, bool)
+
+    def encode(value):
+        data = dumps(value)
+        return data.encode() if isinstance(data, str) else data
+
+    def walk(obj):
+        if obj is None or isinstance(obj, leaves):
+            yield encode(obj)
+        elif isinstance(obj, dict):
+            for value in obj.values():
+                if value is not None and not isinstance(value, leaves):
+                    break
+            else:
+                yield encode(obj)
+                return
+            separator = b'{'
+            for key, value in obj.items():
+                yield separator + encode(str(key)) + b':'
+                yield from walk(value)
+                separator = b','
+            yield b'}' if separator == b',' else b'{}'
+        elif hasattr(obj, '__iter__') and not isinstance(
+                obj, (bytes, bytearray)):
+            separator = b'['
+            for item in obj:
+                yield separator
+                yield from walk(item)
+                separator = b','
+            yield b']' if separator == b',' else b'[]'
+        else:
+            yield encode(obj)
+
+    buffer = []
+    size = 0
+    for data in walk(obj):
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def http_date(secs):
+    t = time.gmtime(secs)
+    return '{}, {:02d} {} {} {:02d}:{:02d}:{:02d} GMT'.format(
+        ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')[t[6]], t[2],
+        ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep',
+         'Oct', 'Nov', 'Dec')[t[1] - 1], t[0], t[3], t[4], t[5])
+
+
 def urlencode(s):
     return s.replace('+', '%2B').replace(' ', '+').replace(
         '%', '%25').replace('?', '%3F').replace('#', '%23').replace(
@@ -183,10 +289,63 @@ class AsyncBytesIO:
         pass
 
 
+class ChunkedReader:
+    def __init__(self, stream, max_length=None):
+        self.stream = stream
+        self.size = 0
+        self.done = False
+        self.buffer = b''
+        self.length = 0
+        self.max_length = max_length
+
+    async def read(self, n=-1):
+        if n < 0:
+            data = b''
+            while True:
+                chunk = await self.read(Request.max_body_length)
+                if not chunk:
+                    return data
+                data += chunk
+        if self.buffer:
+            data = self.buffer[:n]
+            self.buffer = self.buffer[n:]
+            return data
+        if self.done or n == 0:
+            return b''
+        if self.size == 0:
+            line = await Request._safe_readline(self.stream)
+            self.size = int(line.split(b';', 1)[0].strip(), 16)
+            if self.size == 0:
+                while (await Request._safe_readline(self.stream)).strip():
+                    pass
+                self.done = True
+                return b''
+        data = await self.stream.read(min(n, self.size))
+        if not data:
+            raise ValueError('incomplete chunked body')
+        self.length += len(data)
+        if self.max_length is not None and self.length > self.max_length:
+            raise HTTPException(413, 'Payload too large')
+        self.size -= len(data)
+        if self.size == 0:
+            await self.stream.readexactly(2)
+        return data
+
+    async def readexactly(self, n):
+        data = b''
+        while len(data) < n:
+            chunk = await self.read(n - len(data))
+            if not chunk:
+                raise ValueError('incomplete chunked body')
+            data += chunk
+        return data
+
+
 class Request: 
     max_content_length = 16 * 1024
     max_body_length = 16 * 1024
     max_readline = 2 * 1024
+    _framing_lengths = (10, 12, 14, 17)
 
     class G:
         pass
@@ -208,38 +367,41 @@ class Request:
         
         
         self.subapp = subapp
+        self.subapps = (subapp,) if subapp else ()
         
         self.path = url
         
         self.query_string = None
         
         
-        self.args = {}
+        self._args = None
         
-        self.headers = headers
+        self._headers = headers
+        self._header_lines = None
         
-        self.cookies = {}
+        self._cookies = None
         
         self.content_length = 0
         
         self.content_type = None
         
+        self.connection = ''
+        
         
         self.g = Request.G()
 
         self.http_version = http_version
-        if '?' in self.path:
-            self.path, self.query_string = self.path.split('?', 1)
-            self.args = self._parse_urlencoded(self.query_string)
-
-        if 'Content-Length' in self.headers:
-            self.content_length = int(self.headers['Content-Length'])
-        if 'Content-Type' in self.headers:
-            self.content_type = self.headers['Content-Type']
-        if 'Cookie' in self.headers:
-            for cookie in self.headers['Cookie'].split(';'):
-                c = cookie.strip().split('=', 1)
-                self.cookies[c[0]] = c[1] if len(c) > 1 else ''
+        i = url.find('?')
+        if i != -1:
+            self.path = url[:i]
+            self.query_string = url[i + 1:]
+
+        if headers is not None:
+            if 'Content-Length' in headers:
+                self.content_length = int(headers['Content-Length'])
+            if 'Content-Type' in headers:
+                self.content_type = headers['Content-Type']
+            self.connection = headers.get('Connection', '')
 
         self._body = body
         self.body_used = False
@@ -249,42 +411,80 @@ class Request:
         self._form = None
         self._files = None
         self.after_request_handlers = []
+        self.route = None
+        self.cache_key = None
+        self.deferred = None
+        self.started = None
+        self.head_length = 0
 
     @staticmethod
     async def create(app, client_reader, client_writer, client_addr):
         
-        line = (await Request._safe_readline(client_reader)).strip().decode()
+        line = await Request._safe_readline(client_reader)
+        started = ticks_us()
+        head_length = len(line)
+        line = line.strip().decode()
         if not line:  
             return None
         method, url, http_version = line.split()
         http_version = http_version.split('/', 1)[1]
 
         
-        headers = NoCaseDict()
+        
+        lines = []
         content_length = 0
+        content_type = None
+        connection = ''
+        chunked = False
         while True:
-            line = (await Request._safe_readline(
-                client_reader)).strip().decode()
-            if line == '':
+            line = await Request._safe_readline(client_reader)
+            head_length += len(line)
+            if line == b'\r\n' or line == b'\n' or not line:
                 break
-            header, value = line.split(':', 1)
-            value = value.strip()
-            headers[header] = value
-            if header.lower() == 'content-length':
-                content_length = int(value)
+            i = line.find(b':')
+            if i == -1:
+                raise ValueError('invalid header')
+            lines.append(line)
+            if i in Request._framing_lengths:
+                header = line[:i].lower()
+                if header == b'content-length':
+                    content_length = int(line[i + 1:].strip())
+                elif header == b'content-type':
+                    content_type = line[i + 1:].strip().decode()
+                elif header == b'connection':
+                    connection = line[i + 1:].strip().decode()
+                elif header == b'transfer-encoding':
+                    chunked = line[i + 1:].strip().lower() == b'chunked'
 
         
         body = b''
-        if content_length and content_length <= Request.max_body_length:
+        stream = None
+        if chunked:
+            stream = ChunkedReader(client_reader)
+            while len(body) <= Request.max_body_length and not stream.done:
+                body += await stream.read(
+                    Request.max_body_length + 1 - len(body))
+            if stream.done:
+                stream = None
+            else:
+                stream.buffer = body
+                stream.max_length = Request.max_content_length
+                body = b''
+        elif content_length and content_length <= Request.max_body_length:
             body = await client_reader.readexactly(content_length)
-            stream = None
-        else:
-            body = b''
+        elif content_length:
             stream = client_reader
 
-        return Request(app, client_addr, method, url, http_version, headers,
-                       body=body, stream=stream,
-                       sock=(client_reader, client_writer))
+        req = Request(app, client_addr, method, url, http_version, None,
+                      body=body, stream=stream,
+                      sock=(client_reader, client_writer))
+        req._header_lines = lines
+        req.content_length = content_length or len(body)
+        req.content_type = content_type
+        req.connection = connection
+        req.started = started
+        req.head_length = head_length
+        return req
 
     def _parse_urlencoded(self, urlencoded):
         data = MultiDict()
@@ -301,6 +501,33 @@ class Request:
                         if len(kv) > 1 else b''
         return data
 
+    @property
+    def headers(self):
+        if self._headers is None:
+            self._headers = NoCaseDict()
+            for line in self._header_lines or ():
+                header, value = line.decode().split(':', 1)
+                self._headers[header.strip()] = value.strip()
+            self._header_lines = None
+        return self._headers
+
+    @property
+    def args(self):
+        if self._args is None:
+            self._args = self._parse_urlencoded(self.query_string) \
+                if self.query_string else MultiDict()
+        return self._args
+
+    @property
+    def cookies(self):
+        if self._cookies is None:
+            self._cookies = {}
+            for cookie in self.headers.get('Cookie', '').split(';'):
+                c = cookie.strip().split('=', 1)
+                if c[0]:
+                    self._cookies[c[0]] = c[1] if len(c) > 1 else ''
+        return self._cookies
+
     @property
     def body(self):
         return self._body
@@ -341,6 +568,17 @@ class Request:
         self.after_request_handlers.append(f)
         return f
 
+    def defer(self, f, *args):
+        if self.deferred is None:
+            self.deferred = []
+        if self.app and len(self.app.background) + len(self.deferred) >= \
+                self.app.max_background_tasks:
+            if iscoroutine(f):
+                f.close()
+            raise HTTPException(503, 'Busy')
+        self.deferred.append((f, args))
+        return f
+
     @staticmethod
     async def _safe_readline(stream):
         line = (await stream.readline())
@@ -349,6 +587,197 @@ class Request:
         return line
 
 
+class FormDataIter:
+    chunk_size = 512
+
+    def __init__(self, request):
+        mime_type, _, params = request.content_type.partition(';') \
+            if request.content_type else ('', '', '')
+        if mime_type.strip() != 'multipart/form-data':
+            raise ValueError('not multipart/form-data')
+        boundary = None
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'boundary':
+                boundary = value.strip('"')
+        if not boundary:
+            raise ValueError('missing multipart boundary')
+        self.stream = request.stream
+        self.remaining = request.content_length or None
+        self.delimiter = b'\r\n--' + boundary.encode()
+        self.buffer = b'\r\n'
+        self.in_part = True
+        self.done = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while self.in_part:
+            await self.read_part(self.chunk_size)
+        if self.done:
+            raise StopAsyncIteration
+        self.buffer = self.buffer[len(self.delimiter):]
+        while len(self.buffer) < 2:
+            await self.fill()
+        if self.buffer[:2] == b'--':
+            self.done = True
+            while self.remaining:
+                self.buffer = b''
+                await self.fill()
+            raise StopAsyncIteration
+        self.buffer = self.buffer[2:]
+
+        headers = NoCaseDict()
+        while True:
+            line = (await self.readline()).decode()
+            if line == '':
+                break
+            header, value = line.split(':', 1)
+            headers[header] = value.strip()
+        params = {}
+        for param in headers.get('Content-Disposition', '').split(';')[1:]:
+            key, _, value = param.strip().partition('=')
+            params[key] = value.strip('"')
+        self.in_part = True
+        if 'filename' in params:
+            return params.get('name'), FileUpload(
+                params['filename'], headers.get('Content-Type'), headers,
+                source=self)
+        value = b''
+        while self.in_part:
+            value += await self.read_part(self.chunk_size)
+            if len(value) > Request.max_body_length:
+                raise ValueError('form field too long')
+        return params.get('name'), value.decode()
+
+    async def fill(self):
+        n = self.chunk_size if self.remaining is None \
+            else min(self.chunk_size, self.remaining)
+        data = await self.stream.read(n) if n else b''
+        if not data:
+            raise ValueError('incomplete multipart body')
+        if self.remaining is not None:
+            self.remaining -= len(data)
+        self.buffer += data
+
+    async def readline(self):
+        while True:
+            i = self.buffer.find(b'\r\n')
+            if i != -1:
+                line = self.buffer[:i]
+                self.buffer = self.buffer[i + 2:]
+                return line
+            if len(self.buffer) > Request.max_readline:
+                raise ValueError('line too long')
+            await self.fill()
+
+    async def read_part(self, n=-1):
+        if not self.in_part:
+            return b''
+        while True:
+            end = self.buffer.find(self.delimiter)
+            if end == -1:
+                end = len(self.buffer) - len(self.delimiter) + 1
+            elif end == 0:
+                self.in_part = False
+                return b''
+            if end > 0:
+                if n >= 0:
+                    end = min(end, n)
+                data = self.buffer[:end]
+                self.buffer = self.buffer[end:]
+                return data
+            await self.fill()
+
+
+class FileUpload:
+    spool_prefix = '/upload'
+
+    def __init__(self, filename, content_type, headers, source=None,
+                 path=None):
+        self.filename = filename
+        self.content_type = content_type
+        self.headers = headers
+        self.source = source
+        self.path = path
+        self.file = None
+
+    async def read(self, n=-1):
+        if self.path is None:
+            if n < 0:
+                data = b''
+                while True:
+                    chunk = await self.source.read_part(
+                        FormDataIter.chunk_size)
+                    if not chunk:
+                        return data
+                    data += chunk
+            return await self.source.read_part(n)
+        if self.file is None:
+            self.file = open(self.path, 'rb')
+        return self.file.read(n)
+
+    async def copy_to(self, stream):
+        while True:
+            if self.path is None:
+                chunk = await self.source.read_part(FormDataIter.chunk_size)
+            else:
+                chunk = await self.read(FormDataIter.chunk_size)
+            if not chunk:
+                break
+            result = stream.write(chunk)
+            if iscoroutine(result):
+                await result
+
+    async def save(self, path):
+        if self.path is not None:
+            self.close()
+            os.rename(self.path, path)
+        else:
+            with open(path, 'wb') as f:
+                await self.copy_to(f)
+        self.path = path
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def with_form_data(f):
+    async def wrapper(request, *args, **kwargs):
+        form = MultiDict()
+        files = MultiDict()
+        spooled = []
+        try:
+            try:
+                async for name, value in FormDataIter(request):
+                    if isinstance(value, FileUpload):
+                        path = '{}{}.tmp'.format(FileUpload.spool_prefix,
+                                                 len(spooled))
+                        spooled.append(path)
+                        await value.save(path)
+                        files[name] = value
+                    else:
+                        form[name] = value
+            except ValueError:
+                raise HTTPException(400, 'Bad request')
+            request._form = form
+            request._files = files
+            return await invoke_handler(f, request, *args, **kwargs)
+        finally:
+            for values in files.values():
+                for upload in values:
+                    upload.close()
+            for path in spooled:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+    return wrapper
+
+
 class Response:
     types_map = {
         'css': 'text/css',
@@ -366,6 +795,17 @@ class Response:
 
     
     
+    max_merged_body = 1024
+
+    status_lines = {}
+    encoded_headers = {}
+
+    
+    
+    json_dumps = staticmethod(json.dumps)
+
+    
+    
     default_content_type = 'text/plain'
 
     
@@ -384,7 +824,7 @@ class Response:
         self.headers = NoCaseDict(headers or {})
         self.reason = reason
         if isinstance(body, (dict, list)):
-            body = json.dumps(body)
+            body = self.json_dumps(body)
             self.headers['Content-Type'] = 'application/json; charset=UTF-8'
         if isinstance(body, str):
             self.body = body.encode()
@@ -392,6 +832,8 @@ class Response:
             
             self.body = body
         self.is_head = False
+        self.keep_alive = False
+        self.chunked = False
 
     def set_cookie(self, cookie, value, path=None, domain=None, expires=None,
                    max_age=None, secure=False, http_only=False,
@@ -437,28 +879,34 @@ class Response:
 
     async def write(self, stream):
         self.complete()
+        if self.keep_alive:
+            self.headers['Connection'] = 'keep-alive'
+        if self.chunked:
+            self.headers['Transfer-Encoding'] = 'chunked'
 
         try:
-            
-            reason = self.reason if self.reason is not None else \
-                ('OK' if self.status_code == 200 else 'N/A')
-            await stream.awrite('HTTP/1.0 {status_code} {reason}\r\n'.format(
-                status_code=self.status_code, reason=reason).encode())
+            head = self.serialize_head()
 
             
-            for header, value in self.headers.items():
-                values = value if isinstance(value, list) else [value]
-                for value in values:
-                    await stream.awrite('{header}: {value}\r\n'.format(
-                        header=header, value=value).encode())
-            await stream.awrite(b'\r\n')
-
-            
-            if not self.is_head:
+            if self.is_head:
+                await stream.awrite(head)
+                if hasattr(self.body, 'close'):
+                    self.body.close()
+            elif isinstance(self.body, bytes) and \
+                    len(self.body) <= self.max_merged_body:
+                head += self.body
+                await stream.awrite(head)
+            else:
+                await stream.awrite(head)
                 iter = self.body_iter()
                 async for body in iter:
                     if isinstance(body, str):  
                         body = body.encode()
+                    if self.chunked:
+                        if not body:
+                            continue
+                        body = '{:x}\r\n'.format(len(body)).encode() + \
+                            body + b'\r\n'
                     try:
                         await stream.awrite(body)
                     except OSError as exc:  
@@ -469,6 +917,8 @@ class Response:
                         raise
                 if hasattr(iter, 'aclose'):  
                     await iter.aclose()
+                if self.chunked:
+                    await stream.awrite(b'0\r\n\r\n')
 
         except OSError as exc:  
             if exc.errno in MUTED_SOCKET_ERRORS or \
@@ -477,6 +927,34 @@ class Response:
             else:
                 raise
 
+    def serialize_head(self):
+        head = bytearray(b'HTTP/1.1 ' if self.keep_alive else b'HTTP/1.0 ')
+        if self.reason is None:
+            status = self.status_lines.get(self.status_code)
+            if status is None:
+                status = self.status_lines[self.status_code] = \
+                    '{} {}\r\n'.format(self.status_code, 'OK'
+                                        if self.status_code == 200
+                                        else 'N/A').encode()
+            head += status
+        else:
+            head += '{} {}\r\n'.format(self.status_code, self.reason).encode()
+        for header, value in self.headers.items():
+            if isinstance(value, list):
+                for value in value:
+                    head += '{}: {}\r\n'.format(header, value).encode()
+                continue
+            line = self.encoded_headers.get(header)
+            line = line.get(value) if line else None
+            head += line or '{}: {}\r\n'.format(header, value).encode()
+        head += b'\r\n'
+        return head
+
+    @classmethod
+    def encode_header(cls, header, value):
+        cls.encoded_headers.setdefault(header, {})[value] = \
+            '{}: {}\r\n'.format(header, value).encode()
+
     def body_iter(self):
         if hasattr(self.body, '__anext__'):
             
@@ -495,6 +973,9 @@ class Response:
                     self.i = self.ITER_UNKNOWN  
                 else:
                     self.i = self.ITER_NO_BODY
+                self.buf = None
+                self.remaining = int(response.headers.get(
+                    'Content-Length', -1))
                 return self
 
             async def __anext__(self):
@@ -516,10 +997,22 @@ class Response:
                     except StopIteration:
                         await self.aclose()
                         raise StopAsyncIteration
-                buf = response.body.read(response.send_file_buffer_size)
-                if iscoroutine(buf):  
-                    buf = await buf
-                if len(buf) < response.send_file_buffer_size:
+                size = response.send_file_buffer_size
+                if self.remaining >= 0:
+                    size = min(size, self.remaining)
+                if hasattr(response.body, 'readinto'):
+                    if self.buf is None:
+                        self.buf = memoryview(
+                            bytearray(response.send_file_buffer_size))
+                    buf = self.buf[:response.body.readinto(
+                        self.buf[:size]) or 0]
+                else:
+                    buf = response.body.read(size)
+                    if iscoroutine(buf):  
+                        buf = await buf
+                if self.remaining >= 0:
+                    self.remaining -= len(buf)
+                if len(buf) < size or self.remaining == 0:
                     self.i = self.ITER_NO_BODY
                 return buf
 
@@ -540,7 +1033,7 @@ class Response:
     @classmethod
     def send_file(cls, filename, status_code=200, content_type=None,
                   stream=None, max_age=None, compressed=False,
-                  file_extension=''):
+                  file_extension='', request=None):
         if content_type is None:
             if compressed and filename.endswith('.gz'):
                 ext = filename[:-3].split('.')[-1]
@@ -561,9 +1054,86 @@ class Response:
             headers['Content-Encoding'] = compressed \
                 if isinstance(compressed, str) else 'gzip'
 
-        f = stream or open(filename + file_extension, 'rb')
+        if stream is not None:
+            return cls(body=stream, status_code=status_code, headers=headers)
+
+        path = filename + file_extension
+        stat = None
+        if request is not None:
+            headers['Accept-Ranges'] = 'bytes'
+            if not compressed:
+                headers['Vary'] = 'Accept-Encoding'
+                if 'gzip' in request.headers.get('Accept-Encoding', ''):
+                    try:
+                        stat = os.stat(path + '.gz')
+                        path += '.gz'
+                        headers['Content-Encoding'] = 'gzip'
+                    except OSError:
+                        compression = request.app.compression \
+                            if request.app else None
+                        cached = compression.cached_file(path) \
+                            if compression else None
+                        if cached:
+                            stat = os.stat(cached)
+                            path = cached
+                            headers['Content-Encoding'] = 'gzip'
+        stat = stat or os.stat(path)
+        size = stat[6]
+        headers['Content-Length'] = str(size)
+        headers['ETag'] = '"{:x}-{:x}"'.format(int(stat[8]), size)
+        headers['Last-Modified'] = http_date(stat[8])
+
+        start = 0
+        if request is not None and status_code == 200:
+            if_none_match = request.headers.get('If-None-Match')
+            if (if_none_match is not None and
+                    (if_none_match.strip() == '*' or
+                     headers['ETag'] in if_none_match)) or \
+                    (if_none_match is None and
+                     request.headers.get('If-Modified-Since') ==
+                     headers['Last-Modified']):
+                return cls(body=b'', status_code=304, headers=headers)
+            byte_range = cls._parse_range(request.headers.get('Range'), size)
+            if byte_range == ():
+                return cls(body=b'', status_code=416, headers={
+                    'Content-Range': 'bytes */{}'.format(size)})
+            elif byte_range:
+                start, end = byte_range
+                status_code = 206
+                headers['Content-Length'] = str(end - start + 1)
+                headers['Content-Range'] = 'bytes {}-{}/{}'.format(
+                    start, end, size)
+
+        f = open(path, 'rb')
+        if start:
+            f.seek(start)
         return cls(body=f, status_code=status_code, headers=headers)
 
+    @classmethod
+    def stream_json(cls, obj, status_code=200, headers=None, chunk_size=512):
+        headers = NoCaseDict(headers or {})
+        headers['Content-Type'] = 'application/json; charset=UTF-8'
+        return cls(body=iter_json(obj, chunk_size), status_code=status_code,
+                   headers=headers)
+
+    @staticmethod
+    def _parse_range(value, size):
+        if not value or not value.startswith('bytes=') or ',' in value:
+            return None
+        start, _, end = value[6:].strip().partition('-')
+        try:
+            if start:
+                start = int(start)
+                end = min(int(end), size - 1) if end else size - 1
+            else:
+                start = max(size - int(end), 0)
+                end = size - 1
+        except ValueError:
+            return None
+        if start > end or start >= size:
+            return ()
+        return start, end
+
 
 class URLPattern():
     segment_patterns = {
@@ -585,8 +1155,8 @@ class URLPattern():
         self.segments = []
         self.regex = None
 
-    def compile(self):
-        pattern = ''
+    def parse(self):
+        segments = []
         for segment in self.url_pattern.lstrip('/').split('/'):
             if segment and segment[0] == '<':
                 if segment[-1] != '>':
@@ -597,6 +1167,16 @@ class URLPattern():
                 else:
                     type_ = 'string'
                     name = segment
+                segments.append((type_, name))
+            else:
+                segments.append(segment)
+        return segments
+
+    def compile(self):
+        pattern = ''
+        for segment in self.parse():
+            if isinstance(segment, tuple):
+                type_, name = segment
                 parser = None
                 if type_.startswith('re:'):
                     pattern += '/({pattern})'.format(pattern=type_[3:])
@@ -635,6 +1215,98 @@ class URLPattern():
         return 'URLPattern: {}'.format(self.url_pattern)
 
 
+class RouteIndex():
+    simple_patterns = {
+        'string': '/([^/]+)',
+        'int': '/(-?\\d+)',
+    }
+    int_regex = re.compile('^-?\\d+$')
+
+    def __init__(self, url_map):
+        self.root = self.new_node()
+        for index, route in enumerate(url_map):
+            self.add(index, route)
+
+    @staticmethod
+    def new_node():
+        return {'static': {}, 'string': None, 'int': None, 'routes': [],
+                'methods': {}, 'regex': []}
+
+    def is_simple(self, segment):
+        if isinstance(segment, str):
+            return True
+        type_ = segment[0]
+        if not type_.startswith('re:') and \
+                type_ not in URLPattern.segment_patterns:
+            raise ValueError('invalid URL segment type')
+        return type_ in self.simple_patterns and \
+            URLPattern.segment_patterns[type_] == self.simple_patterns[type_]
+
+    def add(self, index, route):
+        methods, pattern = route[0], route[1]
+        segments = pattern.parse()
+        node = self.root
+        if not all(self.is_simple(segment) for segment in segments):
+            for segment in segments:
+                if not isinstance(segment, str):
+                    break
+                node = node['static'].setdefault(segment, self.new_node())
+            node['regex'].append((index, route))
+            return
+        names = []
+        for segment in segments:
+            if isinstance(segment, str):
+                node = node['static'].setdefault(segment, self.new_node())
+            else:
+                type_, name = segment
+                if node[type_] is None:
+                    node[type_] = self.new_node()
+                node = node[type_]
+                names.append((name, URLPattern.segment_parsers.get(type_)))
+        entry = (index, route, names)
+        node['routes'].append(entry)
+        for method in methods:
+            if method not in node['methods']:
+                node['methods'][method] = entry
+
+    def find(self, path, method=None):
+        found = []
+        if not path.startswith('/'):
+            return found
+        segments = path[1:].split('/')
+        stack = [(self.root, 0, ())]
+        while stack:
+            node, i, values = stack.pop()
+            for index, route in node['regex']:
+                args = route[1].match(path)
+                if args is not None:
+                    found.append((index, route, None, args))
+            if i == len(segments):
+                entry = node['methods'].get(method)
+                for index, route, names in \
+                        [entry] if entry else node['routes']:
+                    found.append((index, route, names, values))
+                continue
+            segment = segments[i]
+            if segment in node['static']:
+                stack.append((node['static'][segment], i + 1, values))
+            if segment and node['string']:
+                stack.append((node['string'], i + 1, values + (segment,)))
+            if node['int'] and self.int_regex.match(segment):
+                stack.append((node['int'], i + 1, values + (segment,)))
+        return found
+
+    @staticmethod
+    def args(entry):
+        index, route, names, values = entry
+        if names is None:
+            return values
+        args = {}
+        for (name, parser), value in zip(names, values):
+            args[name] = parser(value) if parser else value
+        return args
+
+
 class HTTPException(Exception):
     def __init__(self, status_code, reason=None):
         self.status_code = status_code
@@ -644,9 +1316,541 @@ class HTTPException(Exception):
         return 'HTTPException: {}'.format(self.status_code)
 
 
+class WebSocketError(Exception):
+    pass
+
+
+class WebSocket:
+    GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+    CONT = 0
+    TEXT = 1
+    BINARY = 2
+    CLOSE = 8
+    PING = 9
+    PONG = 10
+
+    max_message_length = 4 * 1024
+
+    def __init__(self, request):
+        self.request = request
+        self.reader, self.writer = request.sock
+        self.closed = False
+
+    async def handshake(self):
+        key = self.request.headers.get('Sec-WebSocket-Key')
+        if 'websocket' not in self.request.headers.get(
+                'Upgrade', '').lower() or not key:
+            raise HTTPException(400, 'Bad request')
+        accept = binascii.b2a_base64(
+            hashlib.sha1(key.encode() + self.GUID).digest()).strip()
+        await self.writer.awrite(
+            b'HTTP/1.1 101 Switching Protocols\r\n'
+            b'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+            b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+
+    async def receive(self):
+        message = b''
+        message_opcode = None
+        while True:
+            fin, opcode, payload = await self.read_frame()
+            if opcode == self.CLOSE:
+                await self.close()
+                raise WebSocketError('Websocket connection closed')
+            elif opcode == self.PING:
+                await self.send(payload, self.PONG)
+                continue
+            elif opcode == self.PONG:
+                continue
+            elif opcode != self.CONT:
+                message_opcode = opcode
+                message = payload
+            else:
+                message += payload
+            if len(message) > self.max_message_length:
+                await self.close(1009)
+                raise WebSocketError('Websocket message too large')
+            if fin:
+                return message.decode() if message_opcode == self.TEXT \
+                    else message
+
+    async def read_frame(self):
+        try:
+            header = await self.reader.readexactly(2)
+            length = header[1] & 0x7f
+            if length == 126:
+                length = struct.unpack(
+                    '!H', await self.reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack(
+                    '!Q', await self.reader.readexactly(8))[0]
+            if length > self.max_message_length:
+                await self.close(1009)
+                raise WebSocketError('Websocket message too large')
+            mask = await self.reader.readexactly(4) \
+                if header[1] & 0x80 else None
+            payload = await self.reader.readexactly(length) \
+                if length else b''
+        except EOFError:
+            self.closed = True
+            raise WebSocketError('Websocket connection closed')
+        if mask:
+            payload = bytearray(payload)
+            for i in range(length):
+                payload[i] ^= mask[i & 3]
+            payload = bytes(payload)
+        return header[0] & 0x80, header[0] & 0x0f, payload
+
+    async def send(self, data, opcode=None):
+        if isinstance(data, str):
+            data = data.encode()
+            opcode = opcode or self.TEXT
+        opcode = 0x80 | (opcode or self.BINARY)
+        length = len(data)
+        if length < 126:
+            header = struct.pack('!BB', opcode, length)
+        elif length < 65536:
+            header = struct.pack('!BBH', opcode, 126, length)
+        else:
+            header = struct.pack('!BBQ', opcode, 127, length)
+        await self.writer.awrite(header + data)
+
+    async def close(self, code=1000):
+        if not self.closed:
+            self.closed = True
+            try:
+                await self.send(struct.pack('!H', code), self.CLOSE)
+            except OSError:
+                pass
+
+
+def with_websocket(f):
+    async def wrapper(request, *args, **kwargs):
+        ws = WebSocket(request)
+        await ws.handshake()
+        try:
+            await invoke_handler(f, request, ws, *args, **kwargs)
+        except WebSocketError:
+            pass
+        except OSError as exc:
+            if exc.errno not in MUTED_SOCKET_ERRORS:
+                raise
+        await ws.close()
+        return Response.already_handled
+    return wrapper
+
+
+class SSE:
+    def __init__(self, request):
+        self.writer = request.sock[1]
+
+    async def start(self):
+        await self.writer.awrite(
+            b'HTTP/1.0 200 OK\r\nContent-Type: text/event-stream\r\n'
+            b'Cache-Control: no-cache\r\n\r\n')
+
+    async def send(self, data, event=None, event_id=None):
+        if isinstance(data, (dict, list)):
+            data = Response.json_dumps(data)
+        if isinstance(data, bytes):
+            data = data.decode()
+        message = ''
+        if event_id is not None:
+            message += 'id: {}\n'.format(event_id)
+        if event is not None:
+            message += 'event: {}\n'.format(event)
+        for line in str(data).split('\n'):
+            message += 'data: {}\n'.format(line)
+        await self.writer.awrite((message + '\n').encode())
+
+
+def with_sse(f):
+    async def wrapper(request, *args, **kwargs):
+        sse = SSE(request)
+        await sse.start()
+        try:
+            await invoke_handler(f, request, sse, *args, **kwargs)
+        except OSError as exc:
+            if exc.errno not in MUTED_SOCKET_ERRORS:
+                raise
+        return Response.already_handled
+    return wrapper
+
+
+class Metrics:
+    buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+    phases = ('parse', 'handler', 'write')
+
+    def __init__(self, app=None):
+        self.app = app
+        self.requests = {}
+        self.errors = {}
+        self.histograms = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.hooks = []
+
+    def hook(self, f):
+        self.hooks.append(f)
+        return f
+
+    def record(self, req, res, timings):
+        route = req.route if req and req.route else '-'
+        key = (req.method if req else '-', route, res.status_code)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        if res.status_code >= 500:
+            self.errors[route] = self.errors.get(route, 0) + 1
+        if req:
+            self.bytes_in += req.head_length + req.content_length
+        for phase, seconds in zip(self.phases, timings):
+            histogram = self.histograms.get((route, phase))
+            if histogram is None:
+                histogram = self.histograms[(route, phase)] = \
+                    [0] * (len(self.buckets) + 1) + [0.0]
+            i = 0
+            while i < len(self.buckets) and seconds > self.buckets[i]:
+                i += 1
+            histogram[i] += 1
+            histogram[-1] += seconds
+        for hook in self.hooks:
+            hook(req, res, timings)
+
+    def render(self):
+        yield '# TYPE miniweb_requests_total counter\n'
+        for (method, route, status), count in self.requests.items():
+            yield 'miniweb_requests_total{{method="{}",route="{}",' \
+                'status="{}"}} {}\n'.format(method, route, status, count)
+        yield '# TYPE miniweb_errors_total counter\n'
+        for route, count in self.errors.items():
+            yield 'miniweb_errors_total{{route="{}"}} {}\n'.format(
+                route, count)
+        yield '# TYPE miniweb_request_duration_seconds histogram\n'
+        for (route, phase), histogram in self.histograms.items():
+            labels = 'route="{}",phase="{}"'.format(route, phase)
+            count = 0
+            for le, n in zip(self.buckets + ('+Inf',), histogram):
+                count += n
+                yield 'miniweb_request_duration_seconds_bucket{{{},le="{}"}}' \
+                    ' {}\n'.format(labels, le, count)
+            yield 'miniweb_request_duration_seconds_sum{{{}}} {}\n'.format(
+                labels, histogram[-1])
+            yield 'miniweb_request_duration_seconds_count{{{}}} {}\n'.format(
+                labels, count)
+        yield '# TYPE miniweb_received_bytes_total counter\n'
+        yield 'miniweb_received_bytes_total {}\n'.format(self.bytes_in)
+        yield '# TYPE miniweb_sent_bytes_total counter\n'
+        yield 'miniweb_sent_bytes_total {}\n'.format(self.bytes_out)
+        yield '# TYPE miniweb_active_connections gauge\n'
+        yield 'miniweb_active_connections {}\n'.format(
+            self.app.connections if self.app else 0)
+
+
+class CachedResponse(Response):
+    def __init__(self, entry, status_code=200):
+        self.entry = entry
+        self.status_code = status_code
+        self.headers = entry[2]
+        self.reason = None
+        self.body = entry[4]
+        self.is_head = False
+        self.keep_alive = False
+        self.chunked = False
+
+    def complete(self):
+        pass
+
+    async def write(self, stream):
+        head, body = self.entry[3], self.body
+        if self.status_code == 304:
+            head = '304 Not Modified\r\nETag: {}\r\n'.format(
+                self.entry[1]).encode()
+            body = b''
+        elif self.is_head:
+            body = b''
+        try:
+            await stream.awrite(b''.join((
+                b'HTTP/1.1 ' if self.keep_alive else b'HTTP/1.0 ', head,
+                b'Connection: keep-alive\r\n\r\n' if self.keep_alive
+                else b'\r\n', body)))
+        except OSError as exc:  
+            if exc.errno in MUTED_SOCKET_ERRORS or \
+                    exc.args[0] == 'Connection lost':
+                pass
+            else:
+                raise
+
+
+class ResponseCache:
+    """
+    缓存 GET/HEAD 路由的完整响应，包括 after_request 处理函数设置的响应头。
+    命中缓存时 before_request 处理函数照常执行，路由函数和 after_request
+    处理函数都不执行：第一次请求时添加的响应头（如 CORS、计时）原样返回，
+    有副作用的 after_request 处理函数不会再被调用。设置了 Cookie 的响应
+    不会被缓存。
+    """
+    max_bytes = 16 * 1024
+
+    def __init__(self, max_bytes=None):
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        self.routes = {}
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def route(self, f, ttl, key=None):
+        self.routes[f] = (int(ttl * 1000), key)
+        return f
+
+    def lookup(self, req, f):
+        if f not in self.routes or req.method not in ('GET', 'HEAD'):
+            return None
+        ttl, key = self.routes[f]
+        key = req.url if key is None else (req.path, key(req))
+        if req.app and req.app.compression:
+            key = (key, req.app.compression.negotiate(req))
+        entry = self.entries.pop(key, None)
+        if entry is not None and ticks_diff(ticks_ms(), entry[0]) < ttl:
+            self.entries[key] = entry
+            self.hits += 1
+            return self.response(req, entry)
+        if entry is not None:
+            self.size -= len(entry[3]) + len(entry[4])
+        self.misses += 1
+        req.cache_key = key
+        return None
+
+    def store(self, req, res):
+        key = req.cache_key
+        req.cache_key = None
+        if res.status_code != 200 or not isinstance(res.body, bytes) or \
+                'Set-Cookie' in res.headers:
+            return res
+        res.complete()
+        if 'ETag' not in res.headers:
+            res.headers['ETag'] = '"{:08x}"'.format(
+                binascii.crc32(res.body) & 0xffffffff)
+        head = ['200 OK\r\n']
+        for header, value in res.headers.items():
+            head.append('{header}: {value}\r\n'.format(
+                header=header, value=value))
+        head = ''.join(head).encode()
+        size = len(head) + len(res.body)
+        if size > self.max_bytes:
+            return res
+        entry = (ticks_ms(), res.headers['ETag'], res.headers, head, res.body)
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old[3]) + len(old[4])
+        self.entries[key] = entry
+        self.size += size
+        while self.size > self.max_bytes:
+            old = self.entries.pop(next(iter(self.entries)))
+            self.size -= len(old[3]) + len(old[4])
+        return self.response(req, entry)
+
+    def response(self, req, entry):
+        return CachedResponse(entry, 304 if entry[1] in req.headers.get(
+            'If-None-Match', '') else 200)
+
+    def clear(self):
+        self.entries = OrderedDict()
+        self.size = 0
+
+
+class CompressedBody:
+    def __init__(self, source, compressor):
+        self.source = source.body_iter().__aiter__()
+        self.compressor = compressor
+        self.done = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.done:
+            raise StopAsyncIteration
+        while True:
+            try:
+                data = await self.source.__anext__()
+            except StopAsyncIteration:
+                await self.aclose()
+                return self.compressor.flush()
+            data = self.compressor.compress(
+                data.encode() if isinstance(data, str) else data)
+            if data:
+                return data
+
+    async def aclose(self):
+        if not self.done:
+            self.done = True
+            if hasattr(self.source, 'aclose'):
+                await self.source.aclose()
+
+
+class Compression:
+    encodings = ('gzip', 'deflate') if compressobj else ()
+    types = ('text/html', 'text/plain', 'text/css', 'text/csv',
+             'application/json', 'application/javascript', 'application/xml',
+             'image/svg+xml')
+    min_size = 512
+    level = 6
+    wbits = 10
+
+    def __init__(self, min_size=None, cache_dir=None):
+        if min_size is not None:
+            self.min_size = min_size
+        self.cache_dir = cache_dir
+
+    def negotiate(self, req):
+        accepted = []
+        for item in req.headers.get('Accept-Encoding', '').split(','):
+            name, _, q = item.partition(';')
+            q = q.strip()
+            try:
+                if q[:2] == 'q=' and float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+            accepted.append(name.strip())
+        for encoding in self.encodings:
+            if encoding in accepted:
+                return encoding
+
+    def filter(self, req, res):
+        if isinstance(res, CachedResponse) or res.status_code != 200 or \
+                not res.body or 'Content-Encoding' in res.headers:
+            return res
+        mime_type = res.headers.get(
+            'Content-Type', res.default_content_type).split(';')[0]
+        if mime_type.strip() not in self.types:
+            return res
+        streamed = not isinstance(res.body, bytes)
+        size = int(res.headers.get('Content-Length', -1)) if streamed \
+            else len(res.body)
+        if 0 <= size < self.min_size or (streamed and req.method == 'HEAD'):
+            return res
+        if 'Vary' not in res.headers:
+            res.headers['Vary'] = 'Accept-Encoding'
+        encoding = self.negotiate(req)
+        if encoding is None:
+            return res
+        res.headers['Content-Encoding'] = encoding
+        if 'ETag' in res.headers:
+            etag = res.headers['ETag'] = res.headers['ETag'].rstrip('"') + \
+                '-' + encoding + '"'
+            if etag in req.headers.get('If-None-Match', ''):
+                if hasattr(res.body, 'close'):
+                    res.body.close()
+                res.headers.pop('Content-Length', None)
+                return Response(body=b'', status_code=304,
+                                headers=res.headers)
+        compressor = compressobj(encoding, self.level, self.wbits)
+        if streamed:
+            if 'Content-Length' in res.headers:
+                del res.headers['Content-Length']
+            res.body = CompressedBody(Response(res.body), compressor)
+        else:
+            res.body = compressor.compress(res.body) + compressor.flush()
+            res.headers['Content-Length'] = str(len(res.body))
+        return res
+
+    def cached_file(self, path):
+        if not self.cache_dir or 'gzip' not in self.encodings or \
+                Response.types_map.get(path.split('.')[-1]) not in self.types:
+            return None
+        stat = os.stat(path)
+        if stat[6] < self.min_size:
+            return None
+        cached = '{}/{:08x}-{}.gz'.format(
+            self.cache_dir.rstrip('/'),
+            binascii.crc32(path.encode()) & 0xffffffff, path.split('/')[-1])
+        try:
+            if os.stat(cached)[8] >= stat[8]:
+                return cached
+        except OSError:
+            pass
+        try:
+            os.mkdir(self.cache_dir)
+        except OSError:
+            pass
+        compressor = compressobj('gzip', self.level, self.wbits)
+        try:
+            with open(path, 'rb') as src:
+                with open(cached + '.tmp', 'wb') as dst:
+                    while True:
+                        data = src.read(Response.send_file_buffer_size)
+                        if not data:
+                            break
+                        dst.write(compressor.compress(data))
+                    dst.write(compressor.flush())
+            try:
+                os.remove(cached)
+            except OSError:
+                pass
+            os.rename(cached + '.tmp', cached)
+        except OSError:
+            return None
+        return cached
+
+
+class RateLimiter:
+    max_clients = 256
+
+    def __init__(self, rate, burst=None, per_route=False, max_clients=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.per_route = per_route
+        if max_clients is not None:
+            self.max_clients = max_clients
+        self.routes = {}
+        self.buckets = OrderedDict()
+        self.limited = 0
+
+    def limit(self, url_pattern, rate, burst=None):
+        self.routes[url_pattern] = (rate, burst or rate)
+
+    def acquire(self, key, rate, burst, now=None):
+        if now is None:
+            now = ticks_ms()
+        bucket = self.buckets.pop(key, None)
+        if bucket is None:
+            if len(self.buckets) >= self.max_clients:
+                self.buckets.pop(next(iter(self.buckets)))
+            bucket = [burst, now]
+        else:
+            bucket[0] = min(burst, bucket[0] +
+                            ticks_diff(now, bucket[1]) * rate / 1000)
+            bucket[1] = now
+        self.buckets[key] = bucket
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0
+        self.limited += 1
+        return (1 - bucket[0]) / rate
+
+    async def check(self, req):
+        addr = req.client_addr
+        key = addr[0] if isinstance(addr, (tuple, list)) else addr
+        if req.route in self.routes:
+            rate, burst = self.routes[req.route]
+            key = (key, req.route)
+        else:
+            rate, burst = self.rate, self.burst
+            if self.per_route:
+                key = (key, req.route)
+        wait = self.acquire(key, rate, burst)
+        if wait:
+            return 'Too many requests', 429, {
+                'Retry-After': str(int(wait) + (wait % 1 > 0))}
+
+
 class Miniweb:
     def __init__(self):
         self.url_map = []
+        self.route_index = None
+        self.mounts = []
+        self.mount_index = {}
         self.before_request_handlers = []
         self.after_request_handlers = []
         self.after_error_request_handlers = []
@@ -654,14 +1858,28 @@ class Miniweb:
         self.options_handler = self.default_options_handler
         self.debug = False
         self.server = None
+        self.keep_alive_timeout = 5
+        self.max_keep_alive_requests = 100
+        self.max_connections = 8
+        self.connections = 0
+        self.idle_connections = []
+        self.backlog = 5
+        self.read_timeout = 10
+        self.write_timeout = 30
+        self.metrics = None
+        self.response_cache = None
+        self.compression = None
+        self.background = []
+        self.background_event = None
+        self.max_background_tasks = 16
+        self.executor = None
 
     def route(self, url_pattern, methods=None):
-        if len(self.url_map) >= MAX_ROUTES:
-                raise RuntimeError(f'不能注册更多路由，达到上限 {MAX_ROUTES} 个')
         def decorated(f):
             self.url_map.append(
                 ([m.upper() for m in (methods or ['GET'])],
                  URLPattern(url_pattern), f, '', None))
+            self.route_index = None
             return f
         return decorated
 
@@ -675,6 +1893,78 @@ class Miniweb:
 
     def delete(self, url_pattern):return self.route(url_pattern, methods=['DELETE'])
 
+    def static(self, url_prefix, directory, max_age=None):
+        async def handler(request, path):
+            if '..' in path.split('/'):
+                self.abort(404, 'Not found')
+            try:
+                return Response.send_file(directory.rstrip('/') + '/' + path,
+                                          max_age=max_age, request=request)
+            except OSError:
+                self.abort(404, 'Not found')
+        self.route(url_prefix.rstrip('/') + '/<path:path>')(handler)
+
+    def enable_metrics(self, url_pattern='/metrics'):
+        self.metrics = Metrics(self)
+        if url_pattern:
+            @self.get(url_pattern)
+            async def metrics(request):
+                return self.metrics.render(), 200, {
+                    'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+        return self.metrics
+
+    def cached(self, ttl, key=None):
+        if self.response_cache is None:
+            self.response_cache = ResponseCache()
+
+        def decorated(f):
+            return self.response_cache.route(f, ttl, key)
+        return decorated
+
+    def rate_limit(self, rate, burst=None, per_route=False, max_clients=None):
+        limiter = RateLimiter(rate, burst, per_route, max_clients)
+        self.before_request(limiter.check)
+        return limiter
+
+    def enable_compression(self, min_size=None, cache_dir=None):
+        self.compression = Compression(min_size, cache_dir)
+        return self.compression
+
+    def defer(self, f, *args):
+        if len(self.background) >= self.max_background_tasks:
+            if iscoroutine(f):
+                f.close()
+            raise HTTPException(503, 'Busy')
+        self.background.append((f, args))
+        if self.background_event:
+            self.background_event.set()
+        return f
+
+    async def run_in_executor(self, f, *args):
+        if self.executor is not None:
+            return await self.executor(f, *args)
+        return await invoke_handler(f, *args)
+
+    async def background_worker(self):
+        while True:
+            if not self.background:
+                self.background_event.clear()
+                await self.background_event.wait()
+                continue
+            f, args = self.background.pop(0)
+            try:
+                if iscoroutine(f):
+                    await f
+                else:
+                    await self.run_in_executor(f, *args)
+            except Exception as exc:
+                print_exception(exc)
+
+    def websocket(self, url_pattern):
+        def decorated(f):
+            return self.route(url_pattern)(with_websocket(f))
+        return decorated
+
     def before_request(self, f):
         self.before_request_handlers.append(f)
         return f
@@ -694,10 +1984,9 @@ class Miniweb:
         return decorated
 
     def mount(self, subapp, url_prefix='', local=False):
-        for methods, pattern, handler, _prefix, _subapp in subapp.url_map:
-            self.url_map.append(
-                (methods, URLPattern(url_prefix + pattern.url_pattern),
-                 handler, url_prefix + _prefix, _subapp or subapp))
+        self.mounts.append((url_prefix.rstrip('/'), subapp,
+                            len(self.url_map)))
+        self.route_index = None
         if not local:
             for handler in subapp.before_request_handlers:
                 self.before_request_handlers.append(handler)
@@ -720,12 +2009,14 @@ class Miniweb:
     async def start_server(self, host='0.0.0.0', port=5000, debug=False,
                            ssl=None):
         self.debug = debug
+        self.compile_routes()
 
         async def serve(reader, writer):
             if not hasattr(writer, 'awrite'):  
                 
                 async def awrite(self, data):
-                    self.write(data)
+                    self.write(bytes(data) if isinstance(data, memoryview)
+                               else data)
                     await self.drain()
 
                 async def aclose(self):
@@ -736,17 +2027,41 @@ class Miniweb:
                 writer.awrite = MethodType(awrite, writer)
                 writer.aclose = MethodType(aclose, writer)
 
-            await self.handle_request(reader, writer)
+            if self.metrics:
+                metrics = self.metrics
+                write = writer.awrite
+
+                async def awrite(data):
+                    metrics.bytes_out += len(data)
+                    await write(data)
+
+                writer.awrite = awrite
+
+            if self.max_connections and \
+                    self.connections >= self.max_connections:
+                if not self.idle_connections:
+                    await self.reject_request(reader, writer)
+                    return
+                self.idle_connections.pop(0).cancel()
+            self.connections += 1
+            try:
+                await self.handle_request(reader, writer)
+            finally:
+                self.connections -= 1
 
         if self.debug:  
             print('Starting async server on {host}:{port}...'.format(
                 host=host, port=port))
 
+        self.background_event = asyncio.Event()
+        worker = asyncio.create_task(self.background_worker())
+
         try:
-            self.server = await asyncio.start_server(serve, host, port,
-                                                     ssl=ssl)
+            self.server = await asyncio.start_server(
+                serve, host, port, backlog=self.backlog, ssl=ssl)
         except TypeError:  
-            self.server = await asyncio.start_server(serve, host, port)
+            self.server = await asyncio.start_server(
+                serve, host, port, backlog=self.backlog)
 
         while True:
             try:
@@ -761,6 +2076,7 @@ class Miniweb:
                 
                 
                 await asyncio.sleep(0.1)
+        worker.cancel()
 
     def run(self, host='0.0.0.0', port=5000, debug=False, ssl=None):
         
@@ -770,73 +2086,219 @@ class Miniweb:
     def shutdown(self):
         self.server.close()
 
+    def compile_routes(self):
+        self.route_index = RouteIndex(self.url_map)
+        self.mount_index = {}
+        for position, (url_prefix, subapp, routes) in enumerate(self.mounts):
+            self.mount_index.setdefault(url_prefix[1:].split('/')[0], []) \
+                .append((position, url_prefix, subapp, routes))
+            subapp.compile_routes()
+        return self.route_index
+
+    def find_mounts(self, path):
+        i = path.find('/', 1)
+        mounts = self.mount_index.get(path[1:i] if i > 0 else path[1:], [])
+        if '' in self.mount_index:
+            mounts = sorted(mounts + self.mount_index[''],
+                            key=lambda mount: mount[0])
+        for _, url_prefix, subapp, routes in mounts:
+            if path.startswith(url_prefix):
+                subpath = path[len(url_prefix):]
+                if not subpath or subpath[0] == '/':
+                    yield url_prefix, subapp, subpath or '/', routes
+
+    def match_route(self, path, method):
+        best = None
+        result = (404, '', ())
+        for entry in (self.route_index or self.compile_routes()).find(
+                path, method):
+            if method in entry[1][0]:
+                if best is None or entry[0] < best[0]:
+                    best = entry
+            elif result[0] == 404:
+                result = (405, '', ())
+        for url_prefix, subapp, subpath, routes in self.find_mounts(path):
+            if best is not None and best[0] < routes:
+                break
+            found, prefix, subapps = subapp.match_route(subpath, method)
+            if not isinstance(found, int):
+                return found, url_prefix + prefix, (subapp,) + subapps
+            if result[0] == 404:
+                result = (found, url_prefix + prefix, (subapp,) + subapps)
+        if best is not None:
+            return best, '', ()
+        return result
+
     def find_route(self, req):
         method = req.method.upper()
         if method == 'OPTIONS' and self.options_handler:
             return self.options_handler(req), '', None
         if method == 'HEAD':
             method = 'GET'
-        f = 404
-        p = ''
-        s = None
-        for route_methods, route_pattern, route_handler, url_prefix, subapp \
-                in self.url_map:
-            req.url_args = route_pattern.match(req.path)
-            if req.url_args is not None:
-                p = url_prefix
-                s = subapp
-                if method in route_methods:
-                    f = route_handler
-                    break
-                else:
-                    f = 405
-        return f, p, s
+        req.url_args = None
+        found, prefix, subapps = self.match_route(req.path, method)
+        req.subapps = subapps
+        if isinstance(found, int):
+            return found, prefix, subapps[-1] if subapps else None
+        req.route = prefix + found[1][1].url_pattern if prefix \
+            else found[1][1].url_pattern
+        req.url_args = RouteIndex.args(found)
+        return found[1][2], prefix, subapps[-1] if subapps else None
+
+    def allowed_methods(self, path):
+        allow = []
+        for entry in sorted((self.route_index or self.compile_routes()).find(
+                path), key=lambda entry: entry[0]):
+            allow.extend(entry[1][0])
+        for _, subapp, subpath, _ in self.find_mounts(path):
+            allow.extend(subapp.allowed_methods(subpath))
+        return allow
 
     def default_options_handler(self, req):
-        allow = []
-        for route_methods, route_pattern, _, _, _ in self.url_map:
-            if route_pattern.match(req.path) is not None:
-                allow.extend(route_methods)
+        allow = self.allowed_methods(req.path)
         if 'GET' in allow:
             allow.append('HEAD')
         allow.append('OPTIONS')
         return {'Allow': ', '.join(allow)}
 
     async def handle_request(self, reader, writer):
-        req = None
+        count = 0
+        task = asyncio.current_task() if self.max_connections else None
+        while True:
+            req = None
+            evicted = False
+            try:
+                create = Request.create(self, reader, writer,
+                                        writer.get_extra_info('peername'))
+                timeout = self.keep_alive_timeout if count \
+                    else self.read_timeout
+                if count and task:
+                    self.idle_connections.append(task)
+                try:
+                    if timeout:
+                        req = await asyncio.wait_for(create, timeout)
+                    else:
+                        req = await create
+                finally:
+                    if count and task:
+                        if task in self.idle_connections:
+                            self.idle_connections.remove(task)
+                        else:
+                            evicted = True
+            except asyncio.CancelledError:
+                if not evicted:
+                    raise
+                break
+            except asyncio.TimeoutError:
+                break
+            except OSError as exc:  
+                if exc.errno in MUTED_SOCKET_ERRORS:
+                    pass
+                else:
+                    raise
+            except Exception as exc:  
+                print_exception(exc)
+            if req is None and count:
+                break
+            count += 1
+
+            parsed = ticks_us()
+            res = await self.dispatch_request(req)
+            handled = ticks_us()
+            keep_alive = self.should_keep_alive(req, res, count)
+            try:
+                if res != Response.already_handled:  
+                    res.keep_alive = keep_alive
+                    if self.write_timeout:
+                        await asyncio.wait_for(res.write(writer),
+                                               self.write_timeout)
+                    else:
+                        await res.write(writer)
+            except asyncio.TimeoutError:
+                keep_alive = False
+            except OSError as exc:  
+                if exc.errno in MUTED_SOCKET_ERRORS:
+                    keep_alive = False
+                else:
+                    raise
+            if req and req.deferred:
+                self.background.extend(req.deferred)
+                if self.background_event:
+                    self.background_event.set()
+            if self.metrics:
+                self.metrics.record(req, res, (
+                    ticks_diff(parsed, req.started) / 1000000 if req else 0,
+                    ticks_diff(handled, parsed) / 1000000,
+                    ticks_diff(ticks_us(), handled) / 1000000))
+            if self.debug and req:  
+                print('{method} {path} {status_code}'.format(
+                    method=req.method, path=req.path,
+                    status_code=res.status_code))
+            if not keep_alive:
+                break
+
         try:
-            req = await Request.create(self, reader, writer,
-                                       writer.get_extra_info('peername'))
+            await writer.aclose()
         except OSError as exc:  
             if exc.errno in MUTED_SOCKET_ERRORS:
                 pass
             else:
                 raise
-        except Exception as exc:  
-            print_exception(exc)
 
-        res = await self.dispatch_request(req)
+    async def reject_request(self, reader, writer):
+        try:
+            await asyncio.wait_for(writer.awrite(
+                b'HTTP/1.0 503 Service Unavailable\r\nRetry-After: 1\r\n'
+                b'Content-Length: 0\r\n\r\n'), self.write_timeout)
+        except (asyncio.TimeoutError, OSError, ValueError):
+            pass
         try:
-            if res != Response.already_handled:  
-                await res.write(writer)
             await writer.aclose()
-        except OSError as exc:  
-            if exc.errno in MUTED_SOCKET_ERRORS:
-                pass
-            else:
-                raise
-        if self.debug and req:  
-            print('{method} {path} {status_code}'.format(
-                method=req.method, path=req.path,
-                status_code=res.status_code))
+        except OSError:  
+            pass
+
+    def should_keep_alive(self, req, res, count):
+        if req is None or res == Response.already_handled or \
+                not self.keep_alive_timeout or \
+                count >= self.max_keep_alive_requests:
+            return False
+        if req.content_length > req.max_body_length or \
+                (isinstance(req._stream, ChunkedReader) and
+                 not req._stream.done):
+            return False
+        connection = req.connection.lower()
+        if 'close' in connection:
+            return False
+        if req.http_version != '1.1' and 'keep-alive' not in connection:
+            return False
+        res.complete()
+        if 'close' in res.headers.get('Connection', '').lower():
+            return False
+        if 'Content-Length' not in res.headers:
+            if req.http_version != '1.1' or \
+                    'Transfer-Encoding' in res.headers:
+                return False
+            res.chunked = True
+        return True
 
     def get_request_handlers(self, req, attr, local_first=True):
         handlers = getattr(self, attr + '_handlers')
-        local_handlers = getattr(req.subapp, attr + '_handlers') \
-            if req and req.subapp else []
+        if not req or not req.subapps:
+            return handlers
+        local_handlers = []
+        for subapp in req.subapps:
+            local_handlers = getattr(subapp, attr + '_handlers') + \
+                local_handlers if local_first else \
+                local_handlers + getattr(subapp, attr + '_handlers')
         return local_handlers + handlers if local_first \
             else handlers + local_handlers
 
+    def get_response_cache(self, req):
+        cache = self.response_cache
+        for subapp in req.subapps:
+            cache = subapp.response_cache or cache
+        return cache
+
     async def error_response(self, req, status_code, reason=None):
         if req and req.subapp and status_code in req.subapp.error_handlers:
             return await invoke_handler(
@@ -848,7 +2310,9 @@ class Miniweb:
     async def dispatch_request(self, req):
         after_request_handled = False
         if req:
-            if req.content_length > req.max_content_length:
+            if req.content_length > req.max_content_length or \
+                    (isinstance(req._stream, ChunkedReader) and
+                     req._stream.length > req.max_content_length):
                 res = await self.error_response(req, 413, 'Payload too large')
             else:
                 f, req.url_prefix, req.subapp = self.find_route(req)
@@ -860,6 +2324,9 @@ class Miniweb:
                             res = await invoke_handler(handler, req)
                             if res:
                                 break
+                        cache = self.get_response_cache(req)
+                        if res is None and cache:
+                            res = cache.lookup(req, f)
                         if res is None:
                             res = await invoke_handler(f, req, **req.url_args)
                         if isinstance(res, int):
@@ -882,13 +2349,14 @@ class Miniweb:
                             res = Response(body, status_code, headers)
                         elif not isinstance(res, Response):
                             res = Response(res)
-                        for handler in self.get_request_handlers(
-                                req, 'after_request', True):
-                            res = await invoke_handler(
-                                handler, req, res) or res
-                        for handler in req.after_request_handlers:
-                            res = await invoke_handler(
-                                handler, req, res) or res
+                        if not isinstance(res, CachedResponse):
+                            for handler in self.get_request_handlers(
+                                    req, 'after_request', True):
+                                res = await invoke_handler(
+                                    handler, req, res) or res
+                            for handler in req.after_request_handlers:
+                                res = await invoke_handler(
+                                    handler, req, res) or res
                         after_request_handled = True
                     elif isinstance(f, dict):
                         res = Response(headers=f)
@@ -937,6 +2405,10 @@ class Miniweb:
                     req, 'after_error_request', True):
                 res = await invoke_handler(
                     handler, req, res) or res
+        if req and self.compression:
+            res = self.compression.filter(req, res)
+        if req and req.cache_key is not None:
+            res = self.get_response_cache(req).store(req, res)
         res.is_head = (req and req.method == 'HEAD')
         return res
 
@@ -954,6 +2426,9 @@ class Miniweb:
     async def func(request):
         return send_file('index.html', max_age=3600)
 
+    # 静态文件目录（支持 304 缓存、Range 断点续传、自动使用 .gz 压缩文件）
+    app.static('/static', '/static', max_age=3600)
+
     # 带参数的 GET 请求    
     @app.get('/hello/<name>')
     async def func(request, name):
@@ -965,6 +2440,59 @@ class Miniweb:
         json_data = request.json
         return {'received': json_data}
 
+    # 上传文件（multipart/form-data），大文件需先调大 Request.max_content_length
+    @app.post('/upload')
+    @with_form_data
+    async def func(request):
+        await request.files['file'].save('/firmware.bin')
+        return 'ok'
+
+    # WebSocket 双向通信
+    @app.websocket('/ws')
+    async def func(request, ws):
+        while True:
+            message = await ws.receive()
+            await ws.send('echo: ' + message)
+
+    # 响应缓存：2 秒内重复请求直接返回缓存内容，支持 ETag/304
+    # 命中缓存时不执行 after_request，返回第一次请求时它们设置的响应头
+    @app.get('/status')
+    @app.cached(ttl=2)
+    async def func(request):
+        return {'temp': 25}
+
+    # 后台任务：先返回响应，再执行耗时的硬件操作
+    @app.post('/strip/color')
+    async def func(request):
+        strip.fill(request.json['color'])
+        request.defer(strip.write)
+        return 'ok'
+
+    # 限流：每个客户端每秒 5 次、最多连发 10 次，/strip/color 单独限制每秒 2 次，
+    # 超出返回 429
+    limiter = app.rate_limit(5, burst=10)
+    limiter.limit('/strip/color', 2)
+
+    # 流式返回大量 JSON 数据（如 tinydb 表），边生成边发送，不占用大块内存
+    @app.get('/logs')
+    async def func(request):
+        return stream_json(db.table('log'))
+
+    # SSE 服务器推送
+    @app.get('/events')
+    @with_sse
+    async def func(request, sse):
+        while True:
+            await sse.send({'temp': 25}, event='sensor')
+            await asyncio.sleep(1)
+
+    # 响应压缩：客户端支持 gzip/deflate 且内容超过 512 字节时自动压缩，
+    # 静态文件的压缩副本缓存在 /gz 目录
+    app.enable_compression(min_size=512, cache_dir='/gz')
+
+    # 性能统计：访问 /metrics 查看各路由请求数、耗时分布、流量等
+    app.enable_metrics('/metrics')
+
     if __name__ == '__main__':
         app.run(port=80, debug=True)
 
@@ -972,8 +2500,20 @@ class Miniweb:
 """)
 
 Response.already_handled = Response()
+for _content_type in list(Response.types_map.values()) + [
+        Response.default_content_type]:
+    Response.encode_header('Content-Type', _content_type)
+    Response.encode_header('Content-Type', _content_type + '; charset=UTF-8')
+for _header, _value in (('Connection', 'keep-alive'),
+                        ('Transfer-Encoding', 'chunked'),
+                        ('Accept-Ranges', 'bytes'),
+                        ('Vary', 'Accept-Encoding'),
+                        ('Content-Encoding', 'gzip'),
+                        ('Content-Encoding', 'deflate')):
+    Response.encode_header(_header, _value)
 
 abort = Miniweb.abort
 redirect = Response.redirect
 send_file = Response.send_file
+stream_json = Response.stream_json
 
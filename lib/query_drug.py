@@ -1,94 +1,46 @@
-import usocket
-import json
+from miniclient import HTTPClient
 
-def http_post(host, path, headers, body=None):
-    sock = usocket.socket(usocket.AF_INET, usocket.SOCK_STREAM)
-    try:
-        addr_info = usocket.getaddrinfo(host, 80)
-        addr = addr_info[0][4]
-        sock.connect(addr)
-        if body is None:
-            body = ''
-        request = f"POST {path} HTTP/1.1\r\n"
-        request += f"Host: {host}\r\n"
-        for k, v in headers.items():
-            request += f"{k}: {v}\r\n"
-        request += "Connection: close\r\n"
-        request += f"Content-Length: {len(body)}\r\n"
-        request += "\r\n"
-        request += body
-        
-        sock.send(request.encode('utf-8'))
-        response = b''
-        while True:
-            chunk = sock.recv(1024)
-            if not chunk:
-                break
-            response += chunk
-        sock.close()
-        
-        header_body = response.split(b'\r\n\r\n', 1)
-        if len(header_body) < 2:
-            raise ValueError("No body in response")
-        
-        header, body = header_body
-        if b'Transfer-Encoding: chunked' in header or b'transfer-encoding: chunked' in header:
-            return parse_chunked_body(body)
-        else:
-            return body.decode('utf-8')
-    
-    finally:
-        sock.close()
+# 模块级客户端：多次查询复用同一个连接。同步函数都在 client.run() 的同一个
+# 事件循环中执行；在 asyncio 程序中请使用 *_async 版本
+client = HTTPClient(timeout=10)
+
+
+async def http_post_async(host, path, headers, body=None, port=80):
+    """发送 POST 请求并返回响应体字符串，chunked 编码由 HTTPClient 解码"""
+    url = 'http://{}:{}{}'.format(host, port, path)
+    response = await client.post(url, headers=headers, data=body or '')
+    return (await response.read()).decode('utf-8')
+
+
+def http_post(host, path, headers, body=None, port=80):
+    return client.run(http_post_async(host, path, headers, body, port))
 
-def parse_chunked_body(body_data):
-    """解析 chunked 编码的 body"""
-    body_str = body_data.decode('utf-8')
-    full_body = ''
-    lines = body_str.split('\r\n')
-    
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        if not line:
-            i += 1
-            continue
-        try:
-            chunk_size = int(line, 16)
-        except ValueError:
-            raise ValueError(f"Invalid chunk size: {line}")
-        if chunk_size == 0:
-            break  
-        i += 1
-        if i >= len(lines):
-            break
-        chunk_data = lines[i]
-        if len(chunk_data) >= chunk_size:
-            full_body += chunk_data[:chunk_size]
-        else:
-            full_body += chunk_data
-        i += 1
-    
-    return full_body
 
+APPCODE = 'b4f58e2b4aba4b2c9a1eb9667df7ac04'
+HOST = 'gwgp-w8ah4tjhazs.n.bdcloudapi.com'
+HEADERS = {
+    'Content-Type': 'application/json;charset=UTF-8',
+    'X-Bce-Signature': f'AppCode/{APPCODE}'
+}
 
-def query_drug(code):
-    APPCODE = 'b4f58e2b4aba4b2c9a1eb9667df7ac04'
-    host = 'gwgp-w8ah4tjhazs.n.bdcloudapi.com'
-    path = f'/v4/drug_shape_code/query?code={code}'
-    headers = {
-        'Content-Type': 'application/json;charset=UTF-8',
-        'X-Bce-Signature': f'AppCode/{APPCODE}'
-    }
-    
+
+async def query_drug_async(code, host=HOST, port=80):
+    url = f'http://{host}:{port}/v4/drug_shape_code/query?code={code}'
     try:
-        raw_body = http_post(host, path, headers, '{}')
-        data = json.loads(raw_body)
+        # 响应体边接收边解析，不用先拼出完整的文本
+        response = await client.post(url, headers=HEADERS, data='{}')
+        data = await response.json()
         print("✅ JSON 解析成功")
         return data
     except Exception as e:
         print("❌ JSON 解析失败：", e)
         return None
 
+
+def query_drug(code, host=HOST, port=80):
+    return client.run(query_drug_async(code, host, port))
+
+
 if __name__ == '__main__':
     info= query_drug("6921793020362")
     print(info['data']['info']['name'])
@@ -0,0 +1,465 @@
+"""
+The record format of :class:`~tinydb.storages.BinaryStorage`.
+
+Documents are stored as typed binary values instead of JSON text. Most
+documents of a table have the same fields with values of the same types,
+e.g. ``{'ts': 1700000000, 'temp': 21.5, 'sensor': 's7'}``, so the field names
+and types of a document are stored only once as a *shape*. A document of a
+known shape stores its shape number followed by its values: booleans
+packed using ``struct``, then ints, floats, strings and all other values.
+Int and float fields have the same type whatever the width of their values,
+so documents only get a new shape when their field names or types change.
+Documents that don't fit a shape are stored as a generic typed value.
+
+A :class:`LazyTable` holds the documents of a table and only decodes a
+document when it's accessed.
+"""
+
+import struct
+
+__all__ = ('Codec', 'LazyTable')
+
+# Value types. A generic value starts with its type, a shape stores the type
+# of each field.
+NONE = 0
+FALSE = 1
+TRUE = 2
+INT8 = 3
+INT16 = 4
+INT32 = 5
+INT64 = 6
+BIGINT = 7      # Decimal digits, for ints that don't fit into 64 bits
+FLOAT32 = 8     # Floats that single precision stores exactly
+FLOAT64 = 9
+STR = 10
+LIST = 11
+DICT = 12
+BOOL = 13       # Only used in shapes, generic values use FALSE and TRUE
+GENERIC = 14    # Only used in shapes, the field holds a generic value
+VARINT = 15     # Only used in shapes, an int of any size as a zigzag varint
+FLOAT = 16      # Only used in shapes, a FLOAT32 or FLOAT64 generic value
+
+# The types packed using ``struct``
+_STRUCT = {
+    BOOL: 'B', INT8: 'b', INT16: 'h', INT32: 'i', INT64: 'q',
+    FLOAT32: 'f', FLOAT64: 'd',
+}
+
+
+def put_varint(buf, n):
+    """
+    Append an unsigned int to a ``bytearray`` using 7 bits per byte.
+    """
+    while n > 0x7f:
+        buf.append(n & 0x7f | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+def get_varint(data, pos):
+    """
+    Read an unsigned int written by :func:`put_varint`.
+
+    :returns: the int and the position after it
+    """
+    n = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _int_type(value):
+    if -0x80 <= value < 0x80:
+        return INT8
+    if -0x8000 <= value < 0x8000:
+        return INT16
+    if -0x80000000 <= value < 0x80000000:
+        return INT32
+    if -0x8000000000000000 <= value < 0x8000000000000000:
+        return INT64
+
+    return BIGINT
+
+
+def _float_type(value):
+    try:
+        if struct.unpack('<f', struct.pack('<f', value))[0] == value:
+            return FLOAT32
+    except OverflowError:
+        pass
+
+    return FLOAT64
+
+
+def _put_zigzag(buf, value):
+    put_varint(buf, value << 1 if value >= 0 else (-value << 1) - 1)
+
+
+def _get_zigzag(data, pos):
+    n, pos = get_varint(data, pos)
+    return (n >> 1) ^ -(n & 1), pos
+
+
+def _put_str(buf, value):
+    data = value.encode()
+    put_varint(buf, len(data))
+    buf += data
+
+
+def _get_str(data, pos):
+    n, pos = get_varint(data, pos)
+    return str(data[pos:pos + n], 'utf-8'), pos + n
+
+
+def encode_value(buf, value):
+    """
+    Append a generic value to a ``bytearray``.
+    """
+    if value is None:
+        buf.append(NONE)
+    elif value is True or value is False:
+        buf.append(TRUE if value else FALSE)
+    elif isinstance(value, int):
+        kind = _int_type(value)
+        buf.append(kind)
+        if kind == BIGINT:
+            _put_str(buf, str(value))
+        else:
+            buf += struct.pack('<' + _STRUCT[kind], value)
+    elif isinstance(value, float):
+        kind = _float_type(value)
+        buf.append(kind)
+        buf += struct.pack('<' + _STRUCT[kind], value)
+    elif isinstance(value, str):
+        buf.append(STR)
+        _put_str(buf, value)
+    elif isinstance(value, (list, tuple)):
+        buf.append(LIST)
+        put_varint(buf, len(value))
+        for item in value:
+            encode_value(buf, item)
+    elif isinstance(value, dict):
+        buf.append(DICT)
+        put_varint(buf, len(value))
+        for key, item in value.items():
+            if not isinstance(key, str):
+                raise TypeError('keys must be str')
+            _put_str(buf, key)
+            encode_value(buf, item)
+    else:
+        raise TypeError('Object of type {} is not serializable'.format(
+            type(value).__name__))
+
+
+def decode_value(data, pos):
+    """
+    Read a generic value written by :func:`encode_value`.
+
+    :returns: the value and the position after it
+    """
+    kind = data[pos]
+    pos += 1
+
+    if kind == NONE:
+        return None, pos
+    if kind == FALSE:
+        return False, pos
+    if kind == TRUE:
+        return True, pos
+    if kind == STR:
+        return _get_str(data, pos)
+    if kind == LIST:
+        n, pos = get_varint(data, pos)
+        items = []
+        for _ in range(n):
+            item, pos = decode_value(data, pos)
+            items.append(item)
+        return items, pos
+    if kind == DICT:
+        n, pos = get_varint(data, pos)
+        items = {}
+        for _ in range(n):
+            key, pos = _get_str(data, pos)
+            items[key], pos = decode_value(data, pos)
+        return items, pos
+    if kind == BIGINT:
+        digits, pos = _get_str(data, pos)
+        return int(digits), pos
+
+    fmt = '<' + _STRUCT[kind]
+    return struct.unpack_from(fmt, data, pos)[0], pos + struct.calcsize(fmt)
+
+
+class Codec:
+    """
+    Encode and decode documents, keeping track of the known shapes.
+
+    A shape is a tuple of ``(field, type)`` pairs. Shapes are numbered from
+    1 in the order they have been added, 0 marks a document stored as a
+    generic value.
+    """
+
+    def __init__(self, max_shapes=256):
+        #: Documents of new shapes are stored as generic values once this
+        #: many shapes are known
+        self.max_shapes = max_shapes
+
+        self.shapes = []
+        self._numbers = {}
+
+        # The ``struct`` format of the packed fields of each shape and its
+        # size
+        self._formats = []
+
+    def add_shape(self, shape) -> int:
+        """
+        Add a shape read from the storage or created by :meth:`encode`.
+
+        :returns: the number of the shape
+        """
+        shape = tuple((field, kind) for field, kind in shape)
+        self.shapes.append(shape)
+        self._numbers[shape] = len(self.shapes)
+
+        fmt = '<' + ''.join([_STRUCT[kind] for _, kind in shape
+                             if kind in _STRUCT])
+        self._formats.append((fmt, struct.calcsize(fmt)))
+
+        return len(self.shapes)
+
+    def shape_of(self, document):
+        """
+        Get the shape of a document or ``None`` if it has none.
+        """
+        shape = []
+        for field, value in document.items():
+            if not isinstance(field, str):
+                return None
+
+            if value is None:
+                kind = NONE
+            elif value is True or value is False:
+                kind = BOOL
+            elif isinstance(value, int):
+                kind = VARINT
+            elif isinstance(value, float):
+                kind = FLOAT
+            elif isinstance(value, str):
+                kind = STR
+            else:
+                kind = GENERIC
+            shape.append((field, kind))
+
+        return tuple(shape)
+
+    def encode(self, document):
+        """
+        Encode a document.
+
+        :returns: the encoded document and the shape it has added, if any,
+                  which has to be stored along with it
+        """
+        buf = bytearray()
+        new_shape = None
+
+        shape = self.shape_of(document)
+        number = self._numbers.get(shape) if shape is not None else None
+        if number is None and shape is not None and \
+                len(self.shapes) < self.max_shapes:
+            number = self.add_shape(shape)
+            new_shape = shape
+
+        if number is None:
+            put_varint(buf, 0)
+            encode_value(buf, document)
+            return buf, None
+
+        put_varint(buf, number)
+
+        fmt, _ = self._formats[number - 1]
+        buf += struct.pack(fmt, *[value for (_, kind), value
+                                  in zip(shape, document.values())
+                                  if kind in _STRUCT])
+
+        for (_, kind), value in zip(shape, document.values()):
+            if kind == VARINT:
+                _put_zigzag(buf, value)
+            elif kind == STR:
+                _put_str(buf, value)
+            elif kind == GENERIC or kind == FLOAT:
+                encode_value(buf, value)
+
+        return buf, new_shape
+
+    def decode(self, data):
+        """
+        Decode a document written by :meth:`encode`.
+        """
+        number, pos = get_varint(data, 0)
+        if not number:
+            return decode_value(data, pos)[0]
+
+        fmt, size = self._formats[number - 1]
+        packed = struct.unpack_from(fmt, data, pos)
+        pos += size
+
+        document = {}
+        i = 0
+        for field, kind in self.shapes[number - 1]:
+            if kind in _STRUCT:
+                value = packed[i]
+                i += 1
+                if kind == BOOL:
+                    value = bool(value)
+            elif kind == NONE:
+                value = None
+            elif kind == VARINT:
+                value, pos = _get_zigzag(data, pos)
+            elif kind == STR:
+                value, pos = _get_str(data, pos)
+            else:
+                value, pos = decode_value(data, pos)
+            document[field] = value
+
+        return document
+
+
+class LazyTable:
+    """
+    A table of documents that decodes them when they are accessed.
+
+    It acts like the ``{doc_id: document}`` dict of a table. The stored value
+    of a document is either the document or, until it has been decoded, any
+    other value that ``load(doc_id, value)`` decodes it from (e.g. its
+    position in a file).
+
+    Documents that are read by ``get``, ``items`` or ``values`` are decoded
+    every time, so iterating a table doesn't keep all documents in memory.
+    ``table[doc_id]`` keeps the decoded document as it may be changed in
+    place.
+
+    :param load: Decodes a document.
+    :param entries: The stored values by document ID.
+    :param str_keys: Whether the document IDs are used as strings (the
+                     ``entries`` are always stored by ``int`` ID).
+    """
+
+    def __init__(self, load, entries=None, str_keys=False):
+        self._load = load
+        self._entries = {} if entries is None else entries
+        self._str_keys = str_keys
+
+    def __repr__(self):
+        return '<{} {} documents>'.format(type(self).__name__, len(self))
+
+    def _key(self, key):
+        return int(key) if self._str_keys else key
+
+    def rekey(self, key_class):
+        """
+        Get a copy of this table using ``key_class`` for the document IDs.
+        The copy decodes documents using this table.
+        """
+        entries = {}
+        for key, value in self._entries.items():
+            entries[key_class(key)] = value if isinstance(value, dict) \
+                else None
+
+        return LazyTable(lambda key, _: self._get(int(key)), entries)
+
+    def stored(self):
+        """
+        Iterate over the ``int`` IDs and stored values without decoding.
+        """
+        return self._entries.items()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        try:
+            return self._key(key) in self._entries
+        except ValueError:
+            return False
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        if self._str_keys:
+            return (str(key) for key in self._entries)
+
+        return self._entries.keys()
+
+    def get(self, key, default=None):
+        try:
+            key = self._key(key)
+        except ValueError:
+            return default
+
+        return self._get(key, default)
+
+    def _get(self, key, default=None):
+        if key not in self._entries:
+            return default
+
+        value = self._entries[key]
+        if not isinstance(value, dict):
+            value = self._load(key, value)
+
+        return value
+
+    def items(self):
+        for key, value in self._entries.items():
+            if not isinstance(value, dict):
+                value = self._load(key, value)
+            yield (str(key) if self._str_keys else key), value
+
+    def values(self):
+        for _, value in self.items():
+            yield value
+
+    def __getitem__(self, key):
+        key = self._key(key)
+        value = self._entries[key]
+        if not isinstance(value, dict):
+            value = self._entries[key] = self._load(key, value)
+
+        return value
+
+    def __setitem__(self, key, document):
+        self._entries[self._key(key)] = document
+
+    def __delitem__(self, key):
+        del self._entries[self._key(key)]
+
+    def pop(self, key, *default):
+        try:
+            key = self._key(key)
+            value = self._entries.pop(key)
+        except (KeyError, ValueError):
+            if default:
+                return default[0]
+            raise KeyError(key)
+
+        if not isinstance(value, dict):
+            value = self._load(key, value)
+
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def forget(self, keys):
+        """
+        Drop the documents of a copy created by :meth:`rekey` so they are
+        decoded again when accessed.
+        """
+        for key in keys:
+            key = self._key(key)
+            if key in self._entries:
+                self._entries[key] = None
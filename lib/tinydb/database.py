@@ -164,7 +164,10 @@ class TinyDB:
         self.storage.write({})
 
         # After that we need to remeber to empty the ``_tables`` dict so we'll
-        # create new table instances when a table is accessed again.
+        # create new table instances when a table is accessed again. Table
+        # instances the user still holds have to forget their documents.
+        for table in self._tables.values():
+            table.reload()
         self._tables.clear()
 
     def drop_table(self, name: str) -> None:
@@ -177,7 +180,7 @@ class TinyDB:
         # If the table is currently opened, we need to forget the table class
         # instance
         if name in self._tables:
-            del self._tables[name]
+            self._tables.pop(name).reload()
 
         data = self.storage.read()
 
@@ -0,0 +1,281 @@
+"""
+Secondary indexes for tables.
+
+An index maps the value stored at a document path to the IDs of the
+documents holding that value, so a :class:`~tinydb.table.Table` can answer
+queries like ``where('sensor') == 'x'`` or ``where('t') > 25`` without
+evaluating the query against every document:
+
+>>> table.create_index('sensor')
+>>> table.create_index('t', kind='sorted')
+>>> table.search((where('sensor') == 'x') & (where('t') > 25))
+
+Index lookups return *candidate* IDs only. The table still evaluates the
+query on every candidate, so an index never changes the result of a query,
+only the number of documents that have to be looked at.
+"""
+
+from .utils import freeze
+
+__all__ = ('Index', 'HashIndex', 'SortedIndex')
+
+
+def _bisect(keys, key, right=False):
+    """
+    Find the insertion point for ``key`` in the sorted list ``keys``
+    (MicroPython has no ``bisect`` module).
+    """
+    lo, hi = 0, len(keys)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if keys[mid] < key or (right and keys[mid] == key):
+            lo = mid + 1
+        else:
+            hi = mid
+
+    return lo
+
+
+class Index:
+    """
+    The base class for all indexes.
+
+    :param path: The document path to index, e.g. ``('sensor',)``
+    """
+
+    #: The query operations this index can answer
+    operations = ()
+
+    def __init__(self, path):
+        self.path = path
+
+        # The indexed key of every document, needed to remove it again
+        self._keys = {}
+
+        # Documents whose value cannot be indexed. These are returned as
+        # candidates for every lookup so no match is ever missed.
+        self._unindexed = set()
+
+    def __len__(self):
+        return len(self._keys) + len(self._unindexed)
+
+    def resolve(self, document):
+        """
+        Get the value at the index path or raise ``KeyError`` if the document
+        does not have it (the same way a query resolves its path).
+        """
+        value = document
+        try:
+            for part in self.path:
+                value = value[part]
+        except (KeyError, TypeError):
+            raise KeyError(self.path)
+
+        return value
+
+    def add(self, doc_id, document) -> None:
+        """
+        Add a document to the index.
+        """
+        try:
+            value = self.resolve(document)
+        except KeyError:
+            # Queries on a missing path never match, so we don't need to
+            # remember documents without this field
+            return
+
+        key = self._make_key(value)
+        if key is None:
+            self._unindexed.add(doc_id)
+        else:
+            self._keys[doc_id] = key
+            self._insert(key, doc_id)
+
+    def remove(self, doc_id) -> None:
+        """
+        Remove a document from the index if it's present.
+        """
+        self._unindexed.discard(doc_id)
+        key = self._keys.pop(doc_id, None)
+        if key is not None:
+            self._delete(key, doc_id)
+
+    def rebuild(self, table) -> None:
+        """
+        Index all documents of a ``{doc_id: document}`` dict from scratch.
+        """
+        self.clear()
+        for doc_id, document in table.items():
+            self.add(doc_id, document)
+
+    def lookup(self, operation, rhs):
+        """
+        Get the IDs of all documents that may match ``value <operation> rhs``
+        or ``None`` if the index cannot answer this operation.
+        """
+        if operation not in self.operations:
+            return None
+
+        if operation == 'one_of':
+            # Iterating a generator would exhaust it for the query itself
+            if not isinstance(rhs, (tuple, list, set, frozenset)):
+                return None
+
+            ids = set()
+            for item in rhs:
+                found = self._find('==', item)
+                if found is None:
+                    return None
+                ids.update(found)
+        else:
+            ids = self._find(operation, rhs)
+            if ids is None:
+                return None
+
+        return ids | self._unindexed if self._unindexed else ids
+
+    def clear(self) -> None:
+        self._keys.clear()
+        self._unindexed.clear()
+
+    def _make_key(self, value):
+        raise NotImplementedError('To be overridden!')
+
+    def _insert(self, key, doc_id):
+        raise NotImplementedError('To be overridden!')
+
+    def _delete(self, key, doc_id):
+        raise NotImplementedError('To be overridden!')
+
+    def _find(self, operation, rhs):
+        raise NotImplementedError('To be overridden!')
+
+
+class HashIndex(Index):
+    """
+    An index for equality lookups (``==`` and ``one_of``).
+
+    Documents are grouped by their (frozen) value in a ``dict``, so a lookup
+    costs the same no matter how many documents the table holds.
+    """
+
+    operations = ('==', 'one_of')
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._buckets = {}
+
+    def _make_key(self, value):
+        key = freeze(value)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+
+        return key
+
+    def _insert(self, key, doc_id):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._buckets[key] = {doc_id}
+        else:
+            bucket.add(doc_id)
+
+    def _delete(self, key, doc_id):
+        bucket = self._buckets[key]
+        bucket.discard(doc_id)
+        if not bucket:
+            del self._buckets[key]
+
+    def _find(self, operation, rhs):
+        try:
+            return set(self._buckets.get(freeze(rhs), ()))
+        except TypeError:
+            return None
+
+    def clear(self) -> None:
+        super().clear()
+        self._buckets.clear()
+
+
+class SortedIndex(Index):
+    """
+    An index for range lookups (``<``, ``<=``, ``>``, ``>=``) that can also
+    answer equality lookups.
+
+    Numbers and strings are kept in a sorted list and found using binary
+    search. Documents with other values (``None``, lists, ...) are not
+    sorted and are always returned as candidates.
+    """
+
+    operations = ('==', '<', '<=', '>', '>=', 'one_of')
+
+    def __init__(self, path):
+        super().__init__(path)
+
+        # Two parallel lists sorted by key: the keys and the document IDs
+        self._sorted = []
+        self._ids = []
+
+    @staticmethod
+    def _make_key(value):
+        # Numbers and strings can't be compared with each other, so we sort
+        # them in separate groups
+        if isinstance(value, (int, float)):
+            if value != value:
+                # NaN can't be sorted
+                return None
+            return (0, value)
+        if isinstance(value, str):
+            return (1, value)
+
+        return None
+
+    def _insert(self, key, doc_id):
+        i = _bisect(self._sorted, key, right=True)
+        self._sorted.insert(i, key)
+        self._ids.insert(i, doc_id)
+
+    def _delete(self, key, doc_id):
+        i = _bisect(self._sorted, key)
+        while self._ids[i] != doc_id:
+            i += 1
+        del self._sorted[i]
+        del self._ids[i]
+
+    def _find(self, operation, rhs):
+        key = self._make_key(rhs)
+        if key is None:
+            return None
+
+        if operation == '==':
+            lo = _bisect(self._sorted, key)
+            hi = _bisect(self._sorted, key, right=True)
+            return set(self._ids[lo:hi])
+
+        # The range of the key group, e.g. all numbers
+        group = key[0]
+        group_lo = _bisect(self._sorted, (group,))
+        group_hi = _bisect(self._sorted, (group + 1,))
+
+        if operation == '<':
+            lo, hi = group_lo, _bisect(self._sorted, key)
+        elif operation == '<=':
+            lo, hi = group_lo, _bisect(self._sorted, key, right=True)
+        elif operation == '>':
+            lo, hi = _bisect(self._sorted, key, right=True), group_hi
+        else:
+            lo, hi = _bisect(self._sorted, key), group_hi
+
+        # Values of the other group can't be compared with ``rhs``. They stay
+        # candidates so the query raises the same error a full scan would.
+        ids = set(self._ids[lo:hi])
+        ids.update(self._ids[:group_lo])
+        ids.update(self._ids[group_hi:])
+
+        return ids
+
+    def clear(self) -> None:
+        super().clear()
+        self._sorted.clear()
+        self._ids.clear()
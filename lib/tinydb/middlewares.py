@@ -3,6 +3,23 @@ Contains the :class:`base class <tinydb.middlewares.Middleware>` for
 middlewares and implementations.
 """
 
+import json
+
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:
+    # CPython doesn't have the ticks functions
+    import time
+
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def ticks_diff(end, start):
+        return end - start
+
+
+_MISSING = object()
+
 
 class Middleware:
     """
@@ -69,26 +86,74 @@ class Middleware:
 
         return getattr(self.__dict__['storage'], name)
 
+    def write_table(self, data, table, doc_ids):
+        """
+        Write the whole state by default. Forwarding this call to the
+        underlying storage would bypass the middleware's ``write``.
+        """
+
+        self.write(data)
+
 
 class CachingMiddleware(Middleware):
     """
     Add some caching to TinyDB.
 
-    This Middleware aims to improve the performance of TinyDB by writing only
-    the last DB state every :attr:`WRITE_CACHE_SIZE` time and reading always
-    from cache.
+    This Middleware aims to improve the performance of TinyDB by reading
+    always from cache and writing the cached DB state to the storage only
+    when the flush policy says so. The cache is flushed once any of these
+    limits is reached (``None`` disables a limit):
+
+    - ``max_writes``: the number of cached write operations
+      (:attr:`WRITE_CACHE_SIZE` by default),
+    - ``max_age_ms``: the time since the oldest unwritten change,
+    - ``max_dirty_bytes``: an estimate of the JSON size of the changed
+      documents.
+
+    The number of writes and the dirty bytes are checked on every write. The
+    age of the changes also has to be checked while nothing is written,
+    either by running :meth:`flusher` as an asyncio task or by calling
+    :meth:`start_timer` to check from a ``machine.Timer``::
+
+        db = TinyDB('log.json', storage=CachingMiddleware(
+            JSONStorage, max_writes=100, max_age_ms=60000))
+        asyncio.create_task(db.storage.flusher())
+
+    If only one table has changed since the last flush, only its changed
+    documents are passed to the storage (see
+    :meth:`~tinydb.storages.Storage.write_table`), so a
+    :class:`~tinydb.storages.LogStorage` appends them instead of rewriting
+    the whole log.
     """
 
     #: The number of write operations to cache before writing to disc
     WRITE_CACHE_SIZE = 1000
 
-    def __init__(self, storage_cls):
+    def __init__(self, storage_cls, max_writes=_MISSING, max_age_ms=None,
+                 max_dirty_bytes=None):
         # Initialize the parent constructor
         super().__init__(storage_cls)
 
+        # The flush policy, ``None`` disables a limit
+        self.max_writes = self.WRITE_CACHE_SIZE if max_writes is _MISSING \
+            else max_writes
+        self.max_age_ms = max_age_ms
+        self.max_dirty_bytes = max_dirty_bytes
+
         # Prepare the cache
         self.cache = None
         self._cache_modified_count = 0
+        self._dirty_since = None
+        self._dirty_bytes = 0
+
+        # The changed document IDs by table (``None`` if the whole table has
+        # changed). ``None`` if the whole database has to be written.
+        self._dirty = {}
+
+        # Whether the cache is being flushed
+        self._flushing = False
+
+        self._timer = None
 
     def read(self):
         if self.cache is None:
@@ -101,22 +166,158 @@ class CachingMiddleware(Middleware):
     def write(self, data):
         # Store data in cache
         self.cache = data
+        self._dirty = None
+        self._mark_dirty(0)
+
+    def write_table(self, data, table, doc_ids):
+        # Store data in cache and remember which documents have changed
+        self.cache = data
+
+        # Estimating the size serializes the documents, so it's only done if
+        # the flush policy uses it
+        size = 0
+        if self.max_dirty_bytes is not None:
+            docs = data.get(table, {})
+            for doc_id in (docs if doc_ids is None else doc_ids):
+                size += len(doc_id) + len(json.dumps(docs.get(doc_id)))
+
+        if self._dirty is not None:
+            if doc_ids is None:
+                self._dirty[table] = None
+            elif table not in self._dirty:
+                self._dirty[table] = set(doc_ids)
+            elif self._dirty[table] is not None:
+                self._dirty[table].update(doc_ids)
+
+        self._mark_dirty(size)
+
+    def _mark_dirty(self, size):
         self._cache_modified_count += 1
+        self._dirty_bytes += size
+        if self._dirty_since is None:
+            self._dirty_since = ticks_ms()
 
         # Check if we need to flush the cache
-        if self._cache_modified_count >= self.WRITE_CACHE_SIZE:
+        self.flush_if_needed()
+
+    def flush_if_needed(self) -> bool:
+        """
+        Flush the cache if any limit of the flush policy has been reached.
+
+        :returns: whether the cache has been flushed
+        """
+        if not self._cache_modified_count or self._flushing:
+            return False
+
+        if (self.max_writes is not None and
+                self._cache_modified_count >= self.max_writes) or \
+                (self.max_dirty_bytes is not None and
+                 self._dirty_bytes >= self.max_dirty_bytes) or \
+                (self.max_age_ms is not None and
+                 ticks_diff(ticks_ms(), self._dirty_since) >= self.max_age_ms):
             self.flush()
+            return True
+
+        return False
 
     def flush(self):
         """
         Flush all unwritten data to disk.
+
+        A flush started while flushing (e.g. by the timer of
+        :meth:`start_timer`) returns at once. The running flush then also
+        writes the changes made in the meantime.
+        """
+        if self._flushing:
+            return
+
+        self._flushing = True
+        try:
+            while self._cache_modified_count > 0:
+                # Start tracking the changes made while writing
+                dirty = self._dirty
+                dirty_since = self._dirty_since
+                self._cache_modified_count = 0
+                self._dirty_since = None
+                self._dirty_bytes = 0
+                self._dirty = {}
+
+                try:
+                    # Force-flush the cache by writing the data to the
+                    # storage
+                    if dirty is not None and len(dirty) == 1:
+                        for table, doc_ids in dirty.items():
+                            self.storage.write_table(
+                                self.cache, table,
+                                None if doc_ids is None else list(doc_ids))
+                    else:
+                        self.storage.write(self.cache)
+                except BaseException:
+                    # Write the whole database next time
+                    self._cache_modified_count += 1
+                    self._dirty_since = dirty_since
+                    self._dirty = None
+                    raise
+        finally:
+            self._flushing = False
+
+    async def flusher(self, interval_ms=None):
+        """
+        Check the flush policy periodically. Start it as an asyncio task.
+
+        :param interval_ms: How often to check, by default a quarter of
+                            ``max_age_ms`` or once per second.
         """
-        if self._cache_modified_count > 0:
-            # Force-flush the cache by writing the data to the storage
-            self.storage.write(self.cache)
-            self._cache_modified_count = 0
+        import asyncio
+
+        if interval_ms is None:
+            interval_ms = self.max_age_ms // 4 if self.max_age_ms else 1000
+
+        while True:
+            self.flush_if_needed()
+            await asyncio.sleep(interval_ms / 1000)
+
+    def start_timer(self, timer_id=0, interval_ms=None):
+        """
+        Check the flush policy periodically from a ``machine.Timer``.
+
+        :param timer_id: The hardware timer to use.
+        :param interval_ms: How often to check, see :meth:`flusher`.
+        """
+        import machine
+        import micropython
+
+        if interval_ms is None:
+            interval_ms = self.max_age_ms // 4 if self.max_age_ms else 1000
+
+        def scheduled(_):
+            self.flush_if_needed()
+
+        def callback(_):
+            # Timer callbacks may run in an interrupt where writing files is
+            # not allowed, so the check is scheduled to run afterwards
+            try:
+                micropython.schedule(scheduled, None)
+            except RuntimeError:
+                # The schedule queue is full, we'll check next time
+                pass
+
+        self.stop_timer()
+        self._timer = machine.Timer(timer_id)
+        self._timer.init(period=interval_ms, mode=machine.Timer.PERIODIC,
+                         callback=callback)
+
+    def stop_timer(self):
+        """
+        Stop the timer started by :meth:`start_timer`.
+        """
+        if self._timer is not None:
+            self._timer.deinit()
+            self._timer = None
 
     def close(self):
+        self.stop_timer()
+
         # Flush potentially unwritten data
         self.flush()
 
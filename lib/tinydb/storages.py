@@ -3,11 +3,15 @@ Contains the :class:`base class <tinydb.storages.Storage>` for storages and
 implementations.
 """
 
-import io
 import json
 import os
+import struct
 
-__all__ = ('Storage', 'JSONStorage', 'MemoryStorage')
+from .binary import Codec, LazyTable, encode_value, decode_value, put_varint, \
+    get_varint
+
+__all__ = ('Storage', 'JSONStorage', 'MemoryStorage', 'LogStorage',
+           'BinaryStorage')
 
 
 def touch(path: str, create_dirs: bool):
@@ -30,6 +34,37 @@ def touch(path: str, create_dirs: bool):
         pass
 
 
+def exists(path: str) -> bool:
+    """
+    Check whether a file exists (MicroPython has no ``os.path``).
+    """
+    try:
+        os.stat(path)
+    except OSError:
+        return False
+
+    return True
+
+
+def replace(src: str, dst: str):
+    """
+    Replace the file ``dst`` by ``src``.
+
+    Renaming is atomic on most file systems, so ``dst`` either has its old
+    or its new contents even if power is lost in between.
+
+    :param src: The file with the new contents.
+    :param dst: The file to replace.
+    """
+    try:
+        os.rename(src, dst)
+    except OSError:
+        # FAT file systems don't rename onto an existing file. Readers
+        # have to look for ``src`` if ``dst`` is missing.
+        os.remove(dst)
+        os.rename(src, dst)
+
+
 class Storage():
     """
     The abstract base class for all Storages.
@@ -63,6 +98,22 @@ class Storage():
 
         raise NotImplementedError('To be overridden!')
 
+    def write_table(self, data, table: str, doc_ids) -> None:
+        """
+        Write the current state of the database after a table has changed.
+
+        Storages that can store single documents may override this to only
+        write the documents that have changed. By default, the whole state
+        is written.
+
+        :param data: The current state of the database.
+        :param table: The name of the changed table.
+        :param doc_ids: The IDs of the changed documents or ``None`` if the
+                        whole table has changed.
+        """
+
+        self.write(data)
+
     def close(self) -> None:
         """
         Optional: Close open file handles, etc.
@@ -74,6 +125,10 @@ class Storage():
 class JSONStorage(Storage):
     """
     Store the data in a JSON file.
+
+    The file is only parsed on the first read. After that, reads return the
+    state last read or written, so writing a table doesn't parse the whole
+    file again.
     """
 
     def __init__(self, path: str, create_dirs=False, encoding=None, access_mode='r+', **kwargs):
@@ -90,21 +145,37 @@ class JSONStorage(Storage):
         super().__init__()
 
         self._mode = access_mode
+        self._encoding = encoding
         self.kwargs = kwargs
         self.path = path
 
+        # The state last read or written
+        self._data = None
+
+        # A crash during a write on a FAT file system may leave only the
+        # temporary file (see ``replace``)
+        if not exists(path) and exists(path + '.tmp'):
+            os.rename(path + '.tmp', path)
+
         # Create the file if it doesn't exist and creating is allowed by the
         # access mode
-        if any([character in self._mode for character in ('+', 'w', 'a')]):  # any of the writing modes
+        if self._writable():
             touch(path, create_dirs=create_dirs)
 
         # Open the file for reading/writing
         self._handle = open(path, mode=self._mode, encoding=encoding)
 
+    def _writable(self) -> bool:
+        # any of the writing modes
+        return any([character in self._mode for character in ('+', 'w', 'a')])
+
     def close(self) -> None:
         self._handle.close()
 
     def read(self):
+        if self._data is not None:
+            return self._data
+
         # Get the file size by moving the cursor to the file end and reading
         # its location
         self._handle.seek(0, 2) # os.SEEK_END)
@@ -119,34 +190,32 @@ class JSONStorage(Storage):
             self._handle.seek(0)
 
             # Load the JSON contents of the file
-            return json.load(self._handle)
+            self._data = json.load(self._handle)
+            return self._data
 
     def write(self, data):
-        # Move the cursor to the beginning of the file just in case
-        
-        if self._mode=='r+':
-            self.close()
-            self._handle = open(self.path, mode='w')
+        if not self._writable():
+            raise IOError('Cannot write to the database. Access mode is "{0}"'.format(self._mode))
+
+        # The data may have been changed in place, so if writing fails, the
+        # file is read again
+        self._data = None
 
         # Serialize the database state using the user-provided arguments
         serialized = json.dumps(data, **self.kwargs)
 
-        # Write the serialized data to the file
-        try:
-            self._handle.write(serialized)
-        except io.UnsupportedOperation:
-            raise IOError('Cannot write to the database. Access mode is "{0}"'.format(self._mode))
+        # Write the serialized data to a temporary file and replace the
+        # database file with it, so a crash never leaves a truncated file
+        tmp = self.path + '.tmp'
+        with open(tmp, mode='w', encoding=self._encoding) as handle:
+            handle.write(serialized)
 
-        # Ensure the file has been writtens
-        self._handle.flush()
-        # os.fsync(self._handle.fileno())
+        self.close()
+        replace(tmp, self.path)
 
-        # Remove data that is behind the new cursor in case the file has
-        # gotten shorter
-        # self._handle.truncate()
-        if self._mode=='r+':
-            self.close()
-            self._handle = open(self.path, mode=self._mode)
+        # Reopen the new file. Opening it with 'w' again would truncate it.
+        self._handle = open(self.path, mode='r+', encoding=self._encoding)
+        self._data = data
 
 
 class MemoryStorage(Storage):
@@ -167,3 +236,687 @@ class MemoryStorage(Storage):
 
     def write(self, data):
         self.memory = data
+
+
+class LogStorage(Storage):
+    """
+    Store the data as an append-only log of JSON lines.
+
+    :class:`JSONStorage` rewrites the whole file on every change. This
+    storage appends one line for every inserted, updated or removed document
+    instead:
+
+    - ``[table, doc_id, document]`` stores a document,
+    - ``[table, doc_id]`` removes a document,
+    - ``[table]`` creates an empty table or empties an existing one.
+
+    The current state is rebuilt from the log when the storage is opened.
+    Old versions of documents pile up in the log, so once ``garbage_ratio``
+    of its lines are outdated the log is compacted: the current state is
+    written to a temporary file which then replaces the log. Compaction runs
+    in :meth:`compactor` if it has been started as an asyncio task, or else
+    directly in the write that reached the ratio.
+    """
+
+    #: Compact the log once this share of its lines is outdated
+    garbage_ratio = 0.5
+
+    #: Don't compact logs shorter than this number of lines
+    min_compact_lines = 100
+
+    def __init__(self, path: str, create_dirs=False, garbage_ratio=None):
+        """
+        Create a new instance.
+
+        Also creates the log file if it doesn't exist.
+
+        :param path: Where to store the log.
+        :param garbage_ratio: Overrides :attr:`garbage_ratio`.
+        """
+
+        super().__init__()
+
+        self.path = path
+        if garbage_ratio is not None:
+            self.garbage_ratio = garbage_ratio
+
+        self.data = None
+        self.lines = 0            # The number of lines in the log
+        self.bytes_written = 0    # All bytes written, including compaction
+        self.background = False   # Whether ``compactor`` is running
+        self._handle = None
+
+        # A crash during compaction on a FAT file system may leave only
+        # the temporary file (see ``replace``)
+        if not exists(path) and exists(path + '.tmp'):
+            os.rename(path + '.tmp', path)
+
+        touch(path, create_dirs=create_dirs)
+
+        damaged = self._load()
+        self._handle = open(path, 'a')
+
+        if damaged:
+            # Get rid of the damaged line before anything is appended to it
+            self.compact()
+
+    def _load(self) -> bool:
+        """
+        Rebuild the state from the log.
+
+        A power loss while appending can only tear the last line, which then
+        lacks its line break and is dropped. Other lines that can't be read
+        are skipped, so the valid records after them are kept.
+
+        :returns: whether the log ends with a damaged line
+        """
+        data = {}
+        lines = 0
+        damaged = False
+
+        with open(self.path) as handle:
+            while True:
+                line = handle.readline()
+                if not line:
+                    break
+
+                try:
+                    record = json.loads(line)
+                    name = record[0]
+                    if len(record) == 1:
+                        data[name] = {}
+                    elif len(record) == 2:
+                        data.get(name, {}).pop(record[1], None)
+                    else:
+                        data.setdefault(name, {})[record[1]] = record[2]
+                except (ValueError, TypeError, IndexError, KeyError):
+                    if not line.endswith('\n'):
+                        # The last line, torn while it was appended
+                        damaged = True
+                        break
+
+                    # A damaged line in the middle of the log. It's
+                    # garbage that the next compaction drops.
+
+                lines += 1
+                if not line.endswith('\n'):
+                    damaged = True
+
+        self.data = data if lines else None
+        self.lines = lines
+
+        return damaged
+
+    def read(self):
+        return self.data
+
+    def write(self, data):
+        # The whole state has changed, so we write a new log
+        self.data = data
+        self.compact()
+
+    def write_table(self, data, table, doc_ids):
+        self.data = data
+        docs = data.get(table, {})
+
+        if doc_ids is None:
+            records = [[table]]
+            records.extend([table, doc_id, doc]
+                           for doc_id, doc in docs.items())
+        else:
+            records = [
+                [table, doc_id, docs[doc_id]] if doc_id in docs
+                else [table, doc_id]
+                for doc_id in doc_ids
+            ]
+
+        self._append(records)
+
+        if not self.background and self.should_compact():
+            self.compact()
+
+    def _append(self, records):
+        text = ''.join([json.dumps(record) + '\n' for record in records])
+        self.bytes_written += self._handle.write(text)
+
+        # Make sure the records are on the flash before we return
+        self._handle.flush()
+
+        self.lines += len(records)
+
+    def should_compact(self) -> bool:
+        """
+        Check whether enough of the log is outdated to compact it.
+        """
+        if self.lines < self.min_compact_lines:
+            return False
+
+        data = self.data or {}
+        live = len(data) + sum([len(docs) for docs in data.values()])
+
+        return self.lines - live >= self.lines * self.garbage_ratio
+
+    def compact(self) -> None:
+        """
+        Rewrite the log with only the current state.
+        """
+        tmp = self.path + '.tmp'
+        lines = 0
+
+        with open(tmp, 'w') as handle:
+            for name, docs in (self.data or {}).items():
+                self.bytes_written += handle.write(json.dumps([name]) + '\n')
+                lines += 1
+
+                for doc_id, doc in docs.items():
+                    self.bytes_written += handle.write(
+                        json.dumps([name, doc_id, doc]) + '\n')
+                    lines += 1
+
+        if self._handle is not None:
+            self._handle.close()
+
+        replace(tmp, self.path)
+
+        self._handle = open(self.path, 'a')
+        self.lines = lines
+
+    async def compactor(self, interval=1):
+        """
+        Compact the log in the background instead of during writes.
+
+        Start it as an asyncio task next to the rest of the program::
+
+            asyncio.create_task(db.storage.compactor())
+
+        :param interval: How often to check the log, in seconds.
+        """
+        import asyncio
+
+        self.background = True
+        try:
+            while True:
+                if self.should_compact():
+                    self.compact()
+
+                await asyncio.sleep(interval)
+        finally:
+            self.background = False
+
+    def close(self) -> None:
+        self._handle.close()
+
+
+class BinaryStorage(Storage):
+    """
+    Store the data in a compact binary file and decode documents only when
+    they are accessed.
+
+    Documents are stored as typed binary records (see
+    :mod:`tinydb.binary`) with integer document IDs, so numeric tables take
+    much less space than as JSON text. The file starts with a header that
+    points to an index of the position of every document, grouped by table.
+    Opening the storage reads only this index, documents are read from the
+    file and decoded when a table accesses them.
+
+    Like :class:`LogStorage`, changes are appended as records after the
+    index:
+
+    - a document record stores a document,
+    - a delete record removes a document,
+    - a table record creates an empty table or empties an existing one,
+    - a shape record adds a shape (see :class:`~tinydb.binary.Codec`).
+
+    Opening the storage reads the headers of these records too. Once the
+    appended records reach ``tail_ratio`` of the indexed ones, the file is
+    compacted: the current documents and a new index are written to a
+    temporary file which then replaces the storage file. Records of
+    unchanged documents are copied without decoding them.
+
+    The IDs of the documents have to be integers.
+    """
+
+    #: Compact once the appended records reach this share of the indexed ones
+    tail_ratio = 0.5
+
+    #: Don't compact for fewer appended records than this
+    min_compact_records = 100
+
+    #: The magic bytes at the start of the file
+    MAGIC = b'TDB1'
+
+    # The header: magic bytes, position and length of the index
+    _HEADER = '<4sII'
+
+    # A record: kind, table number, document ID (or shape number) and length
+    # of the data. Longer data has the length 0xffff followed by the length
+    # packed as '<I'.
+    _RECORD = '<BBIH'
+    _RECORD_SIZE = struct.calcsize(_RECORD)
+
+    # How much to read at once to get a document record, most of them are
+    # shorter
+    _READ_SIZE = 64
+
+    # Record kinds
+    _DOC = 1
+    _DELETE = 2
+    _TABLE = 3
+    _SHAPE = 4
+
+    def __init__(self, path: str, create_dirs=False, max_shapes=256):
+        """
+        Create a new instance.
+
+        Also creates the storage file if it doesn't exist.
+
+        :param path: Where to store the data.
+        :param max_shapes: The number of shapes to remember, documents of
+                           other shapes are stored as generic values.
+        """
+
+        super().__init__()
+
+        self.path = path
+        self.codec = Codec(max_shapes)
+
+        self.data = None
+        self.records = 0          # The number of indexed documents
+        self.tail = 0             # The number of records appended after it
+        self.bytes_written = 0    # All bytes written, including compaction
+        self.docs_decoded = 0     # The number of documents read from the file
+        self.background = False   # Whether ``compactor`` is running
+
+        self._numbers = {}        # The table numbers by name
+        self._end = 0             # Where the next record is appended
+
+        # A crash during compaction on a FAT file system may leave only
+        # the temporary file (see ``replace``)
+        if not exists(path) and exists(path + '.tmp'):
+            os.rename(path + '.tmp', path)
+
+        touch(path, create_dirs=create_dirs)
+
+        self._handle = open(path, 'r+b')
+        if not self._load():
+            # The file is new or its last record has been torn by a power
+            # loss while it was appended
+            self.compact()
+
+    def _load(self) -> bool:
+        """
+        Read the index and the records appended after it.
+
+        A power loss while appending can only tear the last record, which
+        then ends after the end of the file and is dropped. Other records
+        that can't be used are skipped, so the valid records after them are
+        kept.
+
+        :returns: whether the file is complete
+        """
+        handle = self._handle
+        handle.seek(0, 2)
+        size = handle.tell()
+
+        if not size:
+            # A new file
+            self.data = None
+            return False
+
+        header_size = struct.calcsize(self._HEADER)
+        if size < header_size:
+            raise ValueError('Not a binary TinyDB file: ' + self.path)
+
+        handle.seek(0)
+        magic, pos, length = struct.unpack(self._HEADER,
+                                           handle.read(header_size))
+        if magic != self.MAGIC:
+            raise ValueError('Not a binary TinyDB file: ' + self.path)
+
+        handle.seek(pos)
+        names, tables = self._read_index(handle.read(length))
+        pos += length
+
+        self.records = sum([len(entries) for entries in tables.values()])
+        self.tail = 0
+        complete = True
+
+        while pos < size:
+            try:
+                kind, number, key, start, end = self._read_head(pos)
+            except ValueError:
+                complete = False
+                break
+
+            if end > size:
+                # The last record, torn while it was appended
+                complete = False
+                break
+
+            if kind == self._DOC and number in names:
+                tables[names[number]][key] = pos
+            elif kind == self._DELETE and number in names:
+                tables[names[number]].pop(key, None)
+            elif kind == self._TABLE:
+                handle.seek(start)
+                name = str(handle.read(end - start), 'utf-8')
+                names[number] = name
+                tables[name] = {}
+            elif kind == self._SHAPE:
+                # Later shapes are numbered after this one, so it can't be
+                # skipped
+                if key != len(self.codec.shapes) + 1:
+                    raise ValueError('Damaged shape record in ' + self.path)
+                handle.seek(start)
+                try:
+                    shape = decode_value(handle.read(end - start), 0)[0]
+                    self.codec.add_shape(shape)
+                except (ValueError, TypeError, IndexError, KeyError):
+                    raise ValueError('Damaged shape record in ' + self.path)
+            # Records of unknown kinds or tables are damaged. They are
+            # garbage that the next compaction drops.
+
+            self.tail += 1
+            pos = end
+
+        self._end = pos
+        self._numbers = {name: number for number, name in names.items()}
+        self.data = {
+            name: LazyTable(self._load_doc, entries, str_keys=True)
+            for name, entries in tables.items()
+        } or None
+
+        return complete
+
+    def _read_index(self, index):
+        """
+        Read the shapes and the document positions of all tables.
+
+        :returns: the table names by number and the document positions by
+                  document ID by table name
+        """
+        names = {}
+        tables = {}
+
+        if not index:
+            return names, tables
+
+        count, pos = get_varint(index, 0)
+        for _ in range(count):
+            shape, pos = decode_value(index, pos)
+            self.codec.add_shape(shape)
+
+        count, pos = get_varint(index, pos)
+        for number in range(count):
+            name, pos = decode_value(index, pos)
+            docs, pos = get_varint(index, pos)
+
+            entries = {}
+            if docs:
+                fmt = '<{}I'.format(docs)
+                doc_ids = struct.unpack_from(fmt, index, pos)
+                positions = struct.unpack_from(fmt, index, pos + 4 * docs)
+                pos += 8 * docs
+                entries = dict(zip(doc_ids, positions))
+
+            names[number] = name
+            tables[name] = entries
+
+        return names, tables
+
+    def _read_head(self, pos):
+        """
+        Read the head of the record at ``pos``.
+
+        :returns: the kind, table number and key of the record and where
+                  its data starts and ends
+        """
+        handle = self._handle
+        handle.seek(pos)
+
+        size = self._RECORD_SIZE
+        head = handle.read(size)
+        if len(head) < size:
+            raise ValueError('Torn record')
+
+        kind, number, key, length = struct.unpack(self._RECORD, head)
+        start = pos + size
+        if length == 0xffff:
+            head = handle.read(4)
+            if len(head) < 4:
+                raise ValueError('Torn record')
+            length = struct.unpack('<I', head)[0]
+            start += 4
+
+        return kind, number, key, start, start + length
+
+    def _read_data(self, pos):
+        """
+        Read the data of the record at ``pos`` without decoding it.
+        """
+        handle = self._handle
+        handle.seek(pos)
+
+        # Read the head along with the data of short records
+        chunk = handle.read(self._READ_SIZE)
+        length = struct.unpack_from(self._RECORD, chunk)[3]
+        start = self._RECORD_SIZE
+        if length == 0xffff:
+            length = struct.unpack_from('<I', chunk, start)[0]
+            start += 4
+
+        end = start + length
+        if end > len(chunk):
+            chunk += handle.read(end - len(chunk))
+
+        return chunk[start:end]
+
+    def _load_doc(self, doc_id, pos):
+        self.docs_decoded += 1
+        return self.codec.decode(self._read_data(pos))
+
+    def _record(self, buf, kind, number, key, data=b''):
+        """
+        Append a record to a ``bytearray``.
+        """
+        if len(data) < 0xffff:
+            buf += struct.pack(self._RECORD, kind, number, key, len(data))
+        else:
+            buf += struct.pack(self._RECORD, kind, number, key, 0xffff)
+            buf += struct.pack('<I', len(data))
+        buf += data
+
+    def _doc_record(self, buf, number, doc_id, document) -> int:
+        """
+        Append a document record to a ``bytearray``, after a shape record if
+        the document has a new shape.
+
+        :returns: where the document record starts in ``buf``
+        """
+        data, shape = self.codec.encode(document)
+        if shape is not None:
+            shape_data = bytearray()
+            encode_value(shape_data, shape)
+            self._record(buf, self._SHAPE, 0, len(self.codec.shapes),
+                         shape_data)
+
+        start = len(buf)
+        self._record(buf, self._DOC, number, int(doc_id), data)
+
+        return start
+
+    def read(self):
+        return self.data
+
+    def write(self, data):
+        # The whole state has changed, so we write a new file
+        self.data = data
+        self.compact()
+
+    def write_table(self, data, table, doc_ids):
+        self.data = data
+        docs = data.get(table, {})
+        if not isinstance(docs, LazyTable):
+            # A table created since the file has been opened. Its documents
+            # are read back from the file from now on.
+            docs = data[table] = LazyTable(
+                self._load_doc, {int(doc_id): doc
+                                 for doc_id, doc in docs.items()},
+                str_keys=True)
+
+        buf = bytearray()
+        records = 0
+
+        number = self._numbers.get(table)
+        if number is None or doc_ids is None:
+            if number is None:
+                number = len(self._numbers)
+                if number > 0xff:
+                    raise ValueError('Too many tables')
+                self._numbers[table] = number
+
+            self._record(buf, self._TABLE, number, 0, table.encode())
+            records += 1
+            doc_ids = list(docs.keys())
+
+        # Where the records of the documents will be
+        positions = []
+        for doc_id in doc_ids:
+            doc = docs.get(doc_id)
+            if doc is None:
+                self._record(buf, self._DELETE, number, int(doc_id))
+            else:
+                start = self._doc_record(buf, number, doc_id, doc)
+                positions.append((doc_id, self._end + start))
+            records += 1
+
+        self._append(buf)
+        self.tail += records
+
+        # The documents can be read back from the file now
+        for doc_id, pos in positions:
+            docs[doc_id] = pos
+
+        if not self.background and self.should_compact():
+            self.compact()
+
+    def _append(self, buf):
+        self._handle.seek(self._end)
+        self.bytes_written += self._handle.write(buf)
+
+        # Make sure the records are on the flash before we return
+        self._handle.flush()
+
+        self._end += len(buf)
+
+    def should_compact(self) -> bool:
+        """
+        Check whether enough records have been appended to compact the file.
+        """
+        return self.tail >= self.min_compact_records and \
+            self.tail >= self.records * self.tail_ratio
+
+    def compact(self) -> None:
+        """
+        Rewrite the file with only the current documents and a new index.
+        """
+        tmp = self.path + '.tmp'
+        tables = self.data or {}
+        if len(tables) > 0x100:
+            raise ValueError('Too many tables')
+
+        # The positions of the documents for the index and to update the
+        # tables afterwards
+        written = []
+
+        with open(tmp, 'wb') as handle:
+            header_size = struct.calcsize(self._HEADER)
+            handle.write(bytes(header_size))
+            pos = header_size
+
+            for number, (name, docs) in enumerate(tables.items()):
+                lazy = isinstance(docs, LazyTable)
+                doc_ids = []
+                positions = []
+
+                for doc_id, doc in (docs.stored() if lazy else docs.items()):
+                    if isinstance(doc, dict):
+                        data = self.codec.encode(doc)[0]
+                    else:
+                        # Copy the record without decoding the document
+                        data = self._read_data(doc)
+
+                    buf = bytearray()
+                    self._record(buf, self._DOC, number, int(doc_id), data)
+                    doc_ids.append(int(doc_id))
+                    positions.append(pos)
+                    pos += handle.write(buf)
+
+                written.append((name, docs, doc_ids, positions))
+
+            # New shapes are only stored in the index, which lists all shapes
+            index = bytearray()
+            put_varint(index, len(self.codec.shapes))
+            for shape in self.codec.shapes:
+                encode_value(index, shape)
+
+            put_varint(index, len(written))
+            for name, _, doc_ids, positions in written:
+                encode_value(index, name)
+                put_varint(index, len(doc_ids))
+                fmt = '<{}I'.format(len(doc_ids))
+                index += struct.pack(fmt, *doc_ids)
+                index += struct.pack(fmt, *positions)
+
+            handle.write(index)
+            handle.seek(0)
+            handle.write(struct.pack(self._HEADER, self.MAGIC, pos,
+                                     len(index)))
+
+        self.bytes_written += pos + len(index)
+
+        self._handle.close()
+        replace(tmp, self.path)
+        self._handle = open(self.path, 'r+b')
+
+        self._end = pos + len(index)
+        self._numbers = {}
+        self.records = 0
+        for number, (name, docs, doc_ids, positions) in enumerate(written):
+            self._numbers[name] = number
+            self.records += len(doc_ids)
+
+            # The documents can be read from the new file
+            if isinstance(docs, LazyTable):
+                for doc_id, position in zip(doc_ids, positions):
+                    docs[str(doc_id)] = position
+            else:
+                tables[name] = LazyTable(self._load_doc,
+                                         dict(zip(doc_ids, positions)),
+                                         str_keys=True)
+        self.tail = 0
+
+    async def compactor(self, interval=1):
+        """
+        Compact the file in the background instead of during writes.
+
+        Start it as an asyncio task next to the rest of the program::
+
+            asyncio.create_task(db.storage.compactor())
+
+        :param interval: How often to check the file, in seconds.
+        """
+        import asyncio
+
+        self.background = True
+        try:
+            while True:
+                if self.should_compact():
+                    self.compact()
+
+                await asyncio.sleep(interval)
+        finally:
+            self.background = False
+
+    def close(self) -> None:
+        self._handle.close()
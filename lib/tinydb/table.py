@@ -6,9 +6,15 @@ data in TinyDB.
 from .storages import Storage
 from .queries import Query
 from .utils import LRUCache
+from .index import HashIndex, SortedIndex
 
 __all__ = ('Document', 'Table')
 
+# The query operations that test the value at a path, their query hash is
+# ``(operation, path, ...)`` (see ``tinydb.queries``)
+_PATH_OPERATIONS = ('==', '!=', '<', '<=', '>', '>=', 'exists', 'matches',
+                    'search', 'test', 'any', 'all', 'one_of')
+
 
 class Document(dict):
     """
@@ -36,9 +42,35 @@ class Table:
         a normal ``dict``, but starts to remove the least-recently used entries
         once a threshold is reached.
 
-        The query cache is updated on every search operation. When writing
-        data, the whole cache is discareded as the query results may have
-        changed.
+        The query cache is updated on every search operation and stores the
+        IDs of the matching documents. Besides the number of cached queries,
+        the number of cached document IDs is limited by ``cache_docs``. When
+        writing data, only the cached queries on the fields the write has
+        touched are discarded. Queries that can't be analyzed this way
+        (e.g. ones using ``~``) are discarded on every write. Use
+        :meth:`~tinydb.table.Table.cache_stats` to check how well the cache
+        works.
+
+    .. admonition:: In-memory Table
+
+        The documents of a table are read from the storage once and then
+        kept in memory, keyed by the document ID class. Write operations
+        change this table in place and only convert the documents they
+        touched to the storage format, so a single ``insert`` doesn't cost
+        more on a large table than on a small one. Use
+        :meth:`~tinydb.table.Table.reload` if the storage has been changed
+        by other means. Storages like
+        :class:`~tinydb.storages.BinaryStorage` only keep the position of
+        every document in memory and decode documents when they are
+        accessed.
+
+    .. admonition:: Indexes
+
+        Fields that are queried often can be indexed using
+        :meth:`~tinydb.table.Table.create_index`. ``search``, ``get`` and
+        ``count`` then only evaluate the query against the documents the
+        index returns instead of scanning the whole table. Indexes are
+        kept up to date by every write operation of this table.
 
     .. admonition:: Customization
 
@@ -52,6 +84,10 @@ class Table:
           cache
         - ``default_query_cache_capacity`` defines the default capacity of
           the query cache
+        - ``default_query_cache_docs`` defines the default number of
+          document IDs the query cache may hold
+        - ``index_classes`` maps the index kinds accepted by
+          :meth:`~tinydb.table.Table.create_index` to index classes
 
         .. versionadded:: 4.0
 
@@ -59,6 +95,7 @@ class Table:
     :param storage: The storage instance to use for this table
     :param name: The table name
     :param cache_size: Maximum capacity of query cache
+    :param cache_docs: Maximum number of document IDs in the query cache
     """
 
     #: The class used to represent documents
@@ -81,11 +118,18 @@ class Table:
     #: .. versionadded:: 4.0
     default_query_cache_capacity = 10
 
+    #: The default number of document IDs the query cache may hold
+    default_query_cache_docs = 1000
+
+    #: The classes used for secondary indexes, by kind
+    index_classes = {'hash': HashIndex, 'sorted': SortedIndex}
+
     def __init__(
         self,
         storage: Storage,
         name: str,
-        cache_size: int = default_query_cache_capacity
+        cache_size: int = default_query_cache_capacity,
+        cache_docs: int = default_query_cache_docs
     ):
         """
         Create a table instance.
@@ -93,10 +137,24 @@ class Table:
 
         self._storage = storage
         self._name = name
-        self._query_cache = self.query_cache_class(capacity=cache_size)
+        self._query_cache = self.query_cache_class(capacity=cache_size,
+                                                   max_size=cache_docs)
 
         self._next_id = None
 
+        # The documents keyed by the document ID class (``None`` until they
+        # have been read from the storage) and the same documents keyed by
+        # ``str(doc_id)`` as they are written to the storage
+        self._table = None
+        self._raw_table = None
+
+        # Secondary indexes by document path, see ``create_index``
+        self._indexes = {}
+
+        # Counts the changes of the in-memory table so lazy iterators can
+        # detect them
+        self._version = 0
+
     def __repr__(self):
         args = [
             'name={!r}'.format(self.name),
@@ -154,7 +212,7 @@ class Table:
             table[doc_id] = dict(document)
 
         # See below for details on ``Table._update``
-        self._update_table(updater)
+        self._update_table(updater, [doc_id], set(document))
 
         return doc_id
 
@@ -166,6 +224,7 @@ class Table:
         :returns: a list containing the inserted documents' IDs
         """
         doc_ids = []
+        touched = set()
 
         def updater(table: dict):
             for document in documents:
@@ -181,31 +240,33 @@ class Table:
                 # Convert the document to a ``dict`` (see Table.insert) and
                 # store it
                 table[doc_id] = dict(document)
+                touched.update(document)
 
         # See below for details on ``Table._update``
-        self._update_table(updater)
+        self._update_table(updater, doc_ids, touched)
 
         return doc_ids
 
-    def all(self):
+    def all(self, offset: int = 0, limit: int = None):
         """
         Get all documents stored in the table.
 
+        :param offset: the number of documents to skip
+        :param limit: the maximum number of documents to return
         :returns: a list with all documents.
         """
 
-        # iter(self) (implemented in Table.__iter__ provides an iterator
-        # that returns all documents in this table. We use it to get a list
-        # of all documents by using the ``list`` constructor to perform the
-        # conversion.
+        # We walk the in-memory table directly (see ``Table._iter_docs``) and
+        # only create the documents we return
+        return list(self._iter_docs(None, offset, limit))
 
-        return list(iter(self))
-
-    def search(self, cond: Query):
+    def search(self, cond: Query, offset: int = 0, limit: int = None):
         """
         Search for all documents matching a 'where' cond.
 
         :param cond: the condition to check against
+        :param offset: the number of matching documents to skip
+        :param limit: the maximum number of documents to return
         :returns: list of matching documents
         """
 
@@ -213,15 +274,54 @@ class Table:
         # query
         cached_results = self._query_cache.get(cond)
         if cached_results is not None:
-            return cached_results[:]
+            table = self._read_table()
+            doc_ids = cached_results[0]
+            if offset or limit is not None:
+                end = None if limit is None else offset + limit
+                doc_ids = doc_ids[offset:end]
+            return [self.document_class(table.get(doc_id), doc_id)
+                    for doc_id in doc_ids]
+
+        if offset or limit is not None:
+            # Only a part of the results is looked for, so there is nothing
+            # to add to the query cache
+            return list(self._iter_docs(cond, offset, limit))
+
+        # Perform the search by applying the query to all documents, or only
+        # to the candidates found in the indexes
+        docs = list(self._iter_docs(cond))
+
+        # Update the query cache. We only keep the document IDs along with
+        # the fields the query depends on, see ``_invalidate_cache``.
+        self._query_cache.set(
+            cond,
+            ([doc.doc_id for doc in docs],
+             self._query_fields(getattr(cond, '_hash', None))),
+            len(docs)
+        )
 
-        # Perform the search by applying the query to all documents
-        docs = [doc for doc in self if cond(doc)]
+        return docs
+
+    def iter_search(self, cond: Query, offset: int = 0, limit: int = None):
+        """
+        Iterate over the documents matching a query.
 
-        # Update the query cache
-        self._query_cache[cond] = docs[:]
+        Unlike :meth:`~tinydb.table.Table.search`, the documents are found
+        one at a time while iterating, so stopping early or reading one page
+        using ``offset`` and ``limit`` only checks as many documents as
+        needed and the memory used doesn't grow with the table. The results
+        are not cached.
 
-        return docs
+        The table must not be changed while iterating, the iterator raises
+        a ``RuntimeError`` if it has been.
+
+        :param cond: the condition to check against
+        :param offset: the number of matching documents to skip
+        :param limit: the maximum number of documents to return
+        :returns: an iterator over the matching documents
+        """
+
+        return self._iter_docs(cond, offset, limit)
 
     def get(
         self,
@@ -251,10 +351,10 @@ class Table:
             return self.document_class(raw_doc, doc_id)
 
         elif cond is not None:
-            # Find a document specified by a query
-            for doc in self:
-                if cond(doc):
-                    return doc
+            # Find a document specified by a query, stopping at the first
+            # match
+            for doc in self._iter_docs(cond, limit=1):
+                return doc
 
             return None
 
@@ -276,7 +376,7 @@ class Table:
         """
         if doc_id is not None:
             # Documents specified by ID
-            return self.get(doc_id=doc_id) is not None
+            return doc_id in self._read_table()
 
         elif cond is not None:
             # Document specified by condition
@@ -306,11 +406,16 @@ class Table:
                 # Update documents by calling the update function provided by
                 # the user
                 fields(table[doc_id])
+
+            # We don't know which fields the function changes
+            touched = None
         else:
             def perform_update(table, doc_id):
                 # Update documents by setting all fields from the provided data
                 table[doc_id].update(fields)
 
+            touched = set(fields)
+
         if doc_ids is not None:
             # Perform the update operation for documents specified by a list
             # of document IDs
@@ -323,7 +428,7 @@ class Table:
                     perform_update(table, doc_id)
 
             # Perform the update operation (see _update_table for details)
-            self._update_table(updater)
+            self._update_table(updater, updated_ids, touched)
 
             return updated_ids
 
@@ -344,7 +449,7 @@ class Table:
                 for doc_id in list(table.keys()):
                     # Pass through all documents to find documents matching the
                     # query. Call the processing callback with the document ID
-                    if _cond(table[doc_id]):
+                    if _cond(table.get(doc_id)):
                         # Add ID to list of updated documents
                         updated_ids.append(doc_id)
 
@@ -352,7 +457,7 @@ class Table:
                         perform_update(table, doc_id)
 
             # Perform the update operation (see _update_table for details)
-            self._update_table(updater)
+            self._update_table(updater, updated_ids, touched)
 
             return updated_ids
 
@@ -371,7 +476,7 @@ class Table:
                     perform_update(table, doc_id)
 
             # Perform the update operation (see _update_table for details)
-            self._update_table(updater)
+            self._update_table(updater, updated_ids, touched)
 
             return updated_ids
 
@@ -398,8 +503,14 @@ class Table:
 
         # Perform the update operation for documents specified by a query
 
-        # Collect affected doc_ids
+        # Collect affected doc_ids and the fields that may change
         updated_ids = []
+        touched = set()
+        for fields, _ in updates:
+            if callable(fields):
+                touched = None
+                break
+            touched.update(fields)
 
         def updater(table: dict):
             # We need to convert the keys iterator to a list because
@@ -413,7 +524,7 @@ class Table:
 
                     # Pass through all documents to find documents matching the
                     # query. Call the processing callback with the document ID
-                    if _cond(table[doc_id]):
+                    if _cond(table.get(doc_id)):
                         # Add ID to list of updated documents
                         updated_ids.append(doc_id)
 
@@ -421,7 +532,7 @@ class Table:
                         perform_update(fields, table, doc_id)
 
         # Perform the update operation (see _update_table for details)
-        self._update_table(updater)
+        self._update_table(updater, updated_ids, touched)
 
         return updated_ids
 
@@ -478,6 +589,9 @@ class Table:
         :param doc_ids: a list of document IDs
         :returns: a list containing the removed documents' ID
         """
+        # The fields of the removed documents
+        touched = set()
+
         if cond is not None:
             removed_ids = []
 
@@ -496,15 +610,15 @@ class Table:
                 # result in an exception (RuntimeError: dictionary changed size
                 # during iteration)
                 for doc_id in list(table.keys()):
-                    if _cond(table[doc_id]):
+                    if _cond(table.get(doc_id)):
                         # Add document ID to list of removed document IDs
                         removed_ids.append(doc_id)
 
                         # Remove document from the table
-                        table.pop(doc_id)
+                        touched.update(table.pop(doc_id))
 
             # Perform the remove operation
-            self._update_table(updater)
+            self._update_table(updater, removed_ids, touched)
 
             return removed_ids
 
@@ -520,10 +634,10 @@ class Table:
 
             def updater(table: dict):
                 for doc_id in removed_ids:
-                    table.pop(doc_id)
+                    touched.update(table.pop(doc_id))
 
             # Perform the remove operation
-            self._update_table(updater)
+            self._update_table(updater, removed_ids, touched)
 
             return removed_ids
 
@@ -535,7 +649,7 @@ class Table:
         """
 
         # Update the table by resetting all data
-        self._update_table(lambda table: table.clear())
+        self._update_table(lambda table: table.clear(), None, None)
 
         # Reset document ID counter
         self._next_id = None
@@ -556,25 +670,73 @@ class Table:
 
         self._query_cache.clear()
 
-    def __len__(self):
+    def cache_stats(self) -> dict:
         """
-        Count the total number of documents in this table.
+        Get statistics of the query cache to help choosing its size.
+
+        :returns: a dict with the number of ``hits``, ``misses`` and
+                  ``evictions``, the ``hit_rate``, and the number of cached
+                  ``queries`` and document IDs (``docs``)
         """
 
-        # Using self._read_table() will convert all documents into
-        # the document class. But for counting the number of documents
-        # this conversion is not necessary, thus we read the storage
-        # directly here
+        cache = self._query_cache
 
-        tables = self._storage.read()
+        return {
+            'hits': cache.hits,
+            'misses': cache.misses,
+            'hit_rate': cache.hit_rate,
+            'evictions': cache.evictions,
+            'queries': len(cache),
+            'docs': cache.size,
+        }
 
-        if tables is None:
-            return 0
+    def reload(self) -> None:
+        """
+        Forget the in-memory table so the documents are read from the storage
+        again on the next access.
+        """
 
-        try:
-            return len(tables[self.name])
-        except KeyError:
-            return 0
+        self._table = None
+        self._raw_table = None
+        self._next_id = None
+        self._version += 1
+        self.clear_cache()
+
+    def create_index(self, field, kind: str = 'hash') -> None:
+        """
+        Create a secondary index on a document field.
+
+        A ``'hash'`` index answers equality queries (``==``, ``one_of``),
+        a ``'sorted'`` index also answers range queries (``<``, ``<=``,
+        ``>``, ``>=``). Queries combined with ``&`` use an index if any
+        part of them does, queries combined with ``|`` only if all parts do.
+
+        :param field: the field name, or a tuple of names for nested fields
+        :param kind: the kind of index, a key of :attr:`index_classes`
+        """
+
+        path = tuple(field) if isinstance(field, (tuple, list)) else (field,)
+
+        index = self.index_classes[kind](path)
+        index.rebuild(self._read_table())
+        self._indexes[path] = index
+
+    def drop_index(self, field) -> None:
+        """
+        Remove the index on a document field.
+
+        :param field: the field name, or a tuple of names for nested fields
+        """
+
+        path = tuple(field) if isinstance(field, (tuple, list)) else (field,)
+        del self._indexes[path]
+
+    def __len__(self):
+        """
+        Count the total number of documents in this table.
+        """
+
+        return len(self._read_table())
 
     def __iter__(self):
         """
@@ -583,11 +745,189 @@ class Table:
         :returns: an iterator over all documents.
         """
 
-        # Iterate all documents and their IDs
-        for doc_id, doc in self._read_table().items():
-            # Convert documents to the document class
+        # Iterate all documents and their IDs. We iterate over a snapshot of
+        # the IDs as the in-memory table may change while the caller consumes
+        # the documents.
+        table = self._read_table()
+        for doc_id in list(table):
+            doc = table.get(doc_id)
+            if doc is not None:
+                # Convert documents to the document class
+                yield self.document_class(doc, doc_id)
+
+    def _iter_docs(self, cond=None, offset=0, limit=None):
+        """
+        Iterate over the documents matching a query (or all documents if
+        ``cond`` is ``None``) in ID order if an index is used, in table order
+        otherwise.
+
+        We walk the in-memory table in place, evaluate the query on the
+        stored ``dict`` and only convert matches after ``offset`` to the
+        document class.
+        """
+
+        if limit is not None and limit <= 0:
+            return
+
+        table = self._read_table()
+        version = self._version
+
+        # Use an index to narrow down the documents to check if possible
+        doc_ids = None if cond is None else self._index_lookup(cond)
+        if doc_ids is None:
+            items = table.items()
+        else:
+            items = ((doc_id, table.get(doc_id)) for doc_id in sorted(doc_ids))
+
+        for doc_id, doc in items:
+            if cond is not None and not cond(doc):
+                continue
+
+            if offset:
+                offset -= 1
+                continue
+
             yield self.document_class(doc, doc_id)
 
+            # The caller may have changed the table while we were suspended
+            if self._version != version:
+                raise RuntimeError('Table changed during iteration')
+
+            if limit is not None:
+                limit -= 1
+                if not limit:
+                    return
+
+    def _index_lookup(self, cond):
+        """
+        Get the IDs of all documents that may match a query using the
+        indexes, or ``None`` if the query can't be answered by an index.
+        """
+
+        if not self._indexes:
+            return None
+
+        return self._lookup_hash(getattr(cond, '_hash', None))
+
+    def _lookup_hash(self, hashval):
+        # The query hash describes the query, e.g. ``('==', ('sensor',), 'x')``
+        # or ``('and', frozenset([...]))`` (see ``tinydb.queries``)
+        if not isinstance(hashval, tuple) or not hashval:
+            return None
+
+        operation = hashval[0]
+
+        if operation == 'and':
+            # Any indexed part of an AND query narrows down the candidates
+            result = None
+            for part in hashval[1]:
+                doc_ids = self._lookup_hash(part)
+                if doc_ids is not None:
+                    result = doc_ids if result is None else result & doc_ids
+            return result
+
+        if operation == 'or':
+            # An OR query can only use indexes if every part can
+            result = set()
+            for part in hashval[1]:
+                doc_ids = self._lookup_hash(part)
+                if doc_ids is None:
+                    return None
+                result |= doc_ids
+            return result
+
+        if operation == 'fragment':
+            # Only a fragment of the whole document tests its top-level
+            # fields
+            if hashval[1]:
+                return None
+
+            result = None
+            for key, value in hashval[2].items():
+                index = self._indexes.get((key,))
+                doc_ids = None if index is None else index.lookup('==', value)
+                if doc_ids is not None:
+                    result = doc_ids if result is None else result & doc_ids
+            return result
+
+        if len(hashval) != 3:
+            return None
+
+        index = self._indexes.get(hashval[1])
+        if index is None:
+            return None
+
+        return index.lookup(operation, hashval[2])
+
+    def _query_fields(self, hashval):
+        """
+        Get the top-level fields a query depends on from its hash, or
+        ``None`` if they can't be determined.
+
+        A document can only match a query that tests fields it has, so
+        neither inserting or removing a document nor changing its other
+        fields changes the result. This doesn't hold for queries using ``~``
+        or ``noop``, so these depend on every field.
+        """
+
+        if not isinstance(hashval, tuple) or not hashval:
+            return None
+
+        operation = hashval[0]
+
+        if operation in ('and', 'or'):
+            fields = set()
+            for part in hashval[1]:
+                part_fields = self._query_fields(part)
+                if part_fields is None:
+                    return None
+                fields |= part_fields
+            return fields
+
+        if operation == 'fragment':
+            # A fragment of a field reads that field. A fragment of the whole
+            # document reads the fragment's fields, but an empty one matches
+            # every document.
+            if hashval[1]:
+                return {hashval[1][0]}
+            return set(hashval[2]) or None
+
+        if operation in _PATH_OPERATIONS and len(hashval) > 1 and \
+                isinstance(hashval[1], tuple) and hashval[1]:
+            return {hashval[1][0]}
+
+        return None
+
+    def _invalidate_cache(self, fields) -> None:
+        """
+        Discard the cached queries whose results a write to the given
+        top-level fields may have changed (all of them if ``fields`` is
+        ``None``).
+        """
+
+        if fields is None:
+            self.clear_cache()
+            return
+
+        cache = self._query_cache
+        for cond in list(cache):
+            query_fields = cache.peek(cond)[1]
+            if query_fields is None or not query_fields.isdisjoint(fields):
+                del cache[cond]
+
+    def _update_indexes(self, doc_ids, table) -> None:
+        """
+        Update the indexes for documents that have been inserted, updated or
+        removed.
+        """
+
+        for index in self._indexes.values():
+            for doc_id in doc_ids:
+                index.remove(doc_id)
+                doc = table.get(doc_id)
+                if doc is not None:
+                    index.add(doc_id, doc)
+
     def _get_next_id(self):
         """
         Return the ID for a newly inserted document.
@@ -625,7 +965,8 @@ class Table:
 
     def _read_table(self):
         """
-        Read the table data from the underlying storage.
+        Get the in-memory table, reading it from the underlying storage on
+        first use.
 
         Here we read the data from the underlying storage and convert all
         IDs to the document ID class. Documents themselves are NOT yet
@@ -633,75 +974,127 @@ class Table:
         *all* documents when returning only one document for example.
         """
 
+        if self._table is not None:
+            return self._table
+
         # Retrieve the tables from the storage
         tables = self._storage.read()
 
-        if tables is None:
-            # The database is empty
-            return {}
+        # Retrieve the current table's data. ``None`` means that the database
+        # is empty or the table does not exist yet.
+        raw_table = None if tables is None else tables.get(self.name)
 
-        # Retrieve the current table's data
-        try:
-            table = tables[self.name]
-        except KeyError:
-            # The table does not exist yet, so it is empty
-            return {}
+        # Convert all document IDs to the correct document ID class. Tables
+        # of storages that decode documents on access (see
+        # ``tinydb.binary.LazyTable``) do this without decoding them.
+        self._raw_table = raw_table
+        if hasattr(raw_table, 'rekey'):
+            self._table = raw_table.rekey(self.document_id_class)
+        else:
+            self._table = {
+                self.document_id_class(doc_id): doc
+                for doc_id, doc in (raw_table or {}).items()
+            }
 
-        # Convert all document IDs to the correct document ID class and return
-        # the table data dict
-        return {
-            self.document_id_class(doc_id): doc
-            for doc_id, doc in table.items()
-        }
+        for index in self._indexes.values():
+            index.rebuild(self._table)
+
+        return self._table
 
-    def _update_table(self, updater):
+    def _update_table(self, updater, doc_ids, fields):
         """
         Perform an table update operation.
 
         The storage interface used by TinyDB only allows to read/write the
         complete database data, but not modifying only portions of it. Thus
-        to only update portions of the table data, we first perform a read
-        operation, perform the update on the table data and then write
-        the updated data back to the storage.
-
-        As a further optimization, we don't convert the documents into the
-        document class, as the table data will *not* be returned to the user.
+        we perform the update on the in-memory table and then write the whole
+        database back to the storage.
+
+        ``doc_ids`` lists the IDs of the documents the updater changes (the
+        updater may still fill the list while it runs) or is ``None`` if the
+        updater may change any document. Only these documents are converted
+        to the storage format and re-indexed.
+
+        ``fields`` is the set of top-level fields the updater may change
+        (filled while it runs like ``doc_ids``) or ``None`` if unknown. Only
+        cached queries on these fields are discarded. A document that is
+        inserted or removed touches all of its fields.
         """
 
+        table = self._read_table()
+
+        # The storage may hold other tables too, so we write them back along
+        # with this one
         tables = self._storage.read()
 
         if tables is None:
             # The database is empty
             tables = {}
 
-        try:
-            raw_table = tables[self.name]
-        except KeyError:
-            # The table does not exist yet, so it is empty
-            raw_table = {}
-
-        # Convert the document IDs to the document ID class.
-        # This is required as the rest of TinyDB expects the document IDs
-        # to be an instance of ``self.document_id_class`` but the storage
-        # might convert dict keys to strings.
-        table = {
-            self.document_id_class(doc_id): doc
-            for doc_id, doc in raw_table.items()
-        }
+        # A storage that decodes documents on access may have replaced the
+        # table we have written with one that reads them from its file (see
+        # ``tinydb.storages.BinaryStorage``), so we don't keep them in memory
+        stored = tables.get(self.name)
+        if stored is not self._raw_table and hasattr(stored, 'rekey'):
+            self._raw_table = stored
+            self._table = table = stored.rekey(self.document_id_class)
+
+        self._version += 1
 
         # Perform the table update operation
-        updater(table)
-
-        # Convert the document IDs back to strings.
-        # This is required as some storages (most notably the JSON file format)
-        # don't support IDs other than strings.
-        tables[self.name] = {
-            str(doc_id): doc
-            for doc_id, doc in table.items()
-        }
+        try:
+            updater(table)
+        except Exception:
+            # The updater failed half way through, so the in-memory table
+            # no longer matches the storage
+            self.reload()
+            raise
+
+        # Convert the document IDs of the changed documents to strings.
+        # This is required as some storages (most notably the JSON file
+        # format) don't support IDs other than strings.
+        raw_table = self._raw_table
+        if raw_table is None:
+            raw_table = self._raw_table = {}
+
+        if doc_ids is None:
+            raw_table.clear()
+            for doc_id, doc in table.items():
+                raw_table[str(doc_id)] = doc
+            raw_ids = None
+        else:
+            raw_ids = []
+            for doc_id in doc_ids:
+                raw_id = str(doc_id)
+                raw_ids.append(raw_id)
+                doc = table.get(doc_id)
+                if doc is None:
+                    raw_table.pop(raw_id, None)
+                else:
+                    raw_table[raw_id] = doc
+
+        tables[self.name] = raw_table
+
+        # Write the newly updated data back to the storage, telling it which
+        # documents have changed so it may write only these
+        try:
+            self._storage.write_table(tables, self.name, raw_ids)
+        except Exception:
+            self.reload()
+            raise
+
+        # Update the indexes for the changed documents
+        if self._indexes:
+            if doc_ids is None:
+                for index in self._indexes.values():
+                    index.rebuild(table)
+            else:
+                self._update_indexes(doc_ids, table)
 
-        # Write the newly updated data back to the storage
-        self._storage.write(tables)
+        # Discard the cached queries whose results may have changed
+        self._invalidate_cache(fields)
 
-        # Clear the query cache, as the table contents have changed
-        self.clear_cache()
+        # Documents the storage decodes on access can be read back from it,
+        # so we don't need to keep the changed ones in memory
+        if doc_ids is not None and hasattr(table, 'forget'):
+            table.forget(doc_ids)
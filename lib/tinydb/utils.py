@@ -8,6 +8,10 @@ from collections import OrderedDict
 __all__ = ('LRUCache', 'freeze')
 
 
+# Marks a missing cache entry, as ``None`` may be a cached value
+_MISSING = object()
+
+
 class LRUCache():
     """
     A least-recently used (LRU) cache with a fixed cache size.
@@ -17,14 +21,32 @@ class LRUCache():
     entry will be discareded.
 
     This is implemented using an ``OrderedDict``. On every access the accessed
-    entry is moved to the front by re-inserting it into the ``OrderedDict``.
-    When adding an entry and the cache size is exceeded, the last entry will
+    entry is moved to the end by re-inserting it into the ``OrderedDict``.
+    When adding an entry and the cache size is exceeded, the first entry will
     be discareded.
+
+    Every entry can also be given a size (e.g. the number of documents of a
+    cached query result). If ``max_size`` is set, least-recently used entries
+    are discarded until the sizes of all entries add up to no more than
+    ``max_size``, so a few large entries can't use up all the memory.
+
+    The ``hits`` and ``misses`` of ``get`` are counted to help choosing the
+    capacity, see :attr:`hit_rate`.
     """
 
-    def __init__(self, capacity=None):
+    def __init__(self, capacity=None, max_size=None):
         self.capacity = capacity
-        self.cache = OrderedDict() 
+        self.max_size = max_size
+        self.cache = OrderedDict()
+
+        # The size of every entry and of all entries together
+        self._sizes = {}
+        self.size = 0
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
     @property
     def lru(self):
@@ -34,8 +56,23 @@ class LRUCache():
     def length(self) -> int:
         return len(self.cache)
 
+    @property
+    def hit_rate(self) -> float:
+        """
+        The share of ``get`` calls that found an entry.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
     def clear(self) -> None:
         self.cache.clear()
+        self._sizes.clear()
+        self.size = 0
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
     def __len__(self) -> int:
         return self.length
@@ -48,10 +85,11 @@ class LRUCache():
 
     def __delitem__(self, key) -> None:
         del self.cache[key]
+        self.size -= self._sizes.pop(key)
 
     def __getitem__(self, key):
-        value = self.get(key)
-        if value is None:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
             raise KeyError(key)
 
         return value
@@ -64,28 +102,48 @@ class LRUCache():
         del self.cache[key]
         self.cache[key] = temp
 
-    def get(self, key, default = None):
-        value = self.cache.get(key)
+    def peek(self, key, default=None):
+        """
+        Get an entry without marking it as used or counting the lookup.
+        """
+        return self.cache.get(key, default)
 
-        if value is not None:
+    def get(self, key, default=None):
+        value = self.cache.get(key, _MISSING)
+
+        if value is not _MISSING:
+            self.hits += 1
             self.move_to_end(key)
 
             return value
 
-        return default
+        self.misses += 1
 
-    def set(self, key, value):
-        if self.cache.get(key):
-            self.move_to_end(key)
-
-        else:
-            self.cache[key] = value
+        return default
 
-            # Check, if the cache is full and we have to remove old items
-            # If the queue is of unlimited size, self.capacity is NaN and
-            # x > NaN is always False in Python and the cache won't be cleared.
-            if self.capacity is not None and self.length > self.capacity:
-                del self.cache[list(self.cache.keys())[0]]
+    def set(self, key, value, size=1):
+        if key in self.cache:
+            # Remove the old entry, the new one is added as the most recently
+            # used one
+            del self[key]
+
+        if self.max_size is not None and size > self.max_size:
+            # Evicting all other entries would not make room for this one
+            return
+
+        self.cache[key] = value
+        self._sizes[key] = size
+        self.size += size
+
+        # Check, if the cache is full and we have to remove old items. The
+        # first entry is the least-recently used one and we get it without
+        # copying all keys.
+        while self.cache and (
+                (self.capacity is not None and
+                 self.length > self.capacity) or
+                (self.max_size is not None and self.size > self.max_size)):
+            del self[next(iter(self.cache))]
+            self.evictions += 1
 
 
 class FrozenDict(dict):
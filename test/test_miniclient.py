@@ -0,0 +1,497 @@
+import sys
+sys.path.append('lib')  # 在电脑上从仓库根目录运行时查找驱动
+
+import asyncio
+import json
+import threading
+import time
+from miniweb import Miniweb
+from miniclient import HTTPClient, JSONParser, urlsplit
+
+
+def create_app():
+    app = Miniweb()
+
+    @app.get('/')
+    async def index(request):
+        return 'hello'
+
+    @app.post('/echo')
+    async def echo(request):
+        return request.json
+
+    @app.get('/chunked')
+    async def chunked(request):
+        def body():
+            for i in range(10):
+                yield 'line {}\n'.format(i)
+        return body()
+
+    @app.get('/big')
+    async def big(request):
+        return b'x' * 20000
+
+    @app.get('/slow')
+    async def slow(request):
+        await asyncio.sleep(1)
+        return 'late'
+
+    @app.post('/v1/chat/completions')
+    async def completions(request):
+        if request.headers.get('Authorization') != 'Bearer test-key':
+            return {'error': 'invalid key'}, 401
+        question = request.json['messages'][-1]['content']
+        return {'choices': [{'message': {'role': 'assistant',
+                                         'content': 'echo: ' + question}}]}
+
+    @app.post('/v4/drug_shape_code/query')
+    async def drug(request):
+        name = '阿莫西林胶囊' if request.args.get('code') == '6921793020362' \
+            else ''
+
+        def body():
+            # 和真实接口一样使用 chunked 编码，并故意拆开多字节字符
+            data = json.dumps({'data': {'info': {'name': name}}},
+                              ensure_ascii=False).encode()
+            for i in range(0, len(data), 7):
+                yield data[i:i + 7]
+        return body(), 200, {'Content-Type': 'application/json'}
+
+    return app
+
+
+async def start_app(app):
+    task = asyncio.create_task(app.start_server(host='127.0.0.1', port=0))
+    while app.server is None:
+        await asyncio.sleep(0.01)
+    return task, app.server.sockets[0].getsockname()[1]
+
+
+async def stop_app(app, task):
+    app.shutdown()
+    await task
+
+
+class ThreadServer:
+    """在后台线程中运行服务器，供同步接口（ChatBot、query_drug）测试使用"""
+    def __init__(self, app):
+        self.app = app
+        self.loop = None
+        self.thread = threading.Thread(target=asyncio.run, args=(self.main(),))
+        self.thread.start()
+        while app.server is None:
+            time.sleep(0.01)
+        self.port = app.server.sockets[0].getsockname()[1]
+
+    async def main(self):
+        self.loop = asyncio.get_running_loop()
+        await self.app.start_server(host='127.0.0.1', port=0)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.app.shutdown)
+        self.thread.join()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_urlsplit():
+    assert urlsplit('http://example.com') == ('http', 'example.com', 80, '/')
+    assert urlsplit('https://api.deepseek.com/v1/chat/completions') == \
+        ('https', 'api.deepseek.com', 443, '/v1/chat/completions')
+    assert urlsplit('127.0.0.1:8080/a?b=1') == \
+        ('http', '127.0.0.1', 8080, '/a?b=1')
+
+
+SAMPLE_JSON = {
+    'data': {'info': {'name': '阿莫西林胶囊', 'spec': '0.25g*24粒',
+                      'note': 'say "hi"\\ \r\n\t\u00e9 😀 }]'},
+             'list': [1, -2.5, 3e-3, 1E2, True, False, None, [], {}, ''],
+             '': 'empty key'},
+    'code': 0,
+}
+
+
+def test_json_parser():
+    text = json.dumps(SAMPLE_JSON, ensure_ascii=False)
+    for data in [text.encode(), json.dumps(SAMPLE_JSON).encode()]:
+        # 按任意位置切块送入，结果都和一次性解析相同
+        for size in range(1, 40):
+            parser = JSONParser()
+            for i in range(0, len(data), size):
+                parser.feed(data[i:i + size])
+            assert parser.result() == SAMPLE_JSON, size
+
+    for data in [b'42', b' "x" ', b'[]', b'null']:
+        parser = JSONParser()
+        parser.feed(data)
+        assert parser.result() == json.loads(data)
+
+    for data in [b'{"a": [1, 2}', b'{"a": 1', b'[tru]', b'1 2', b'"abc']:
+        parser = JSONParser()
+        try:
+            parser.feed(data)
+            parser.result()
+            assert False, data
+        except ValueError:
+            pass
+
+
+async def start_raw_server(response, piece=3, close=False):
+    """只会按原样回复 response 的 socket 服务器，每次写出 piece 字节"""
+    async def handle(reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            length = 0
+            while line not in (b'\r\n', b''):
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+                line = await reader.readline()
+            await reader.readexactly(length)
+            for i in range(0, len(response), piece):
+                writer.write(response[i:i + piece])
+                await writer.drain()
+            if close:
+                break
+        writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def test_chunked_decoder():
+    data = json.dumps(SAMPLE_JSON, ensure_ascii=False).encode()
+    # chunk 内容里有 CRLF、chunk 扩展、最后有 trailer，多字节字符被拆开
+    body = b''
+    for i in range(0, len(data), 10):
+        chunk = data[i:i + 10]
+        body += b'%x;ext=1\r\n%s\r\n' % (len(chunk), chunk)
+    body += b'4\r\n\r\n\r\n\r\n0\r\nX-Trailer: 1\r\n\r\n'
+    chunked = b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n' + body
+
+    async def main():
+        server, port = await start_raw_server(chunked)
+        client = HTTPClient()
+        url = 'http://127.0.0.1:{}/'.format(port)
+        response = await client.post(url, data='{}')
+        assert await response.read() == data + b'\r\n\r\n'
+        response = await client.post(url, data='{}')
+        assert await response.json() == SAMPLE_JSON
+        assert client.connections == 1
+        await client.close()
+        server.close()
+
+        sized = b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s' % (
+            len(data), data)
+        server, port = await start_raw_server(sized, piece=7)
+        url = 'http://127.0.0.1:{}/'.format(port)
+        response = await client.get(url)
+        assert await response.json() == SAMPLE_JSON
+        response = await client.get(url)
+        assert await response.read() == data
+        assert client.connections == 2
+        await client.close()
+        server.close()
+
+        # 没有长度信息时一直读到服务器关闭连接
+        server, port = await start_raw_server(
+            b'HTTP/1.0 200 OK\r\n\r\n' + data, close=True)
+        response = await client.get('http://127.0.0.1:{}/'.format(port))
+        assert not response.keep_alive
+        assert await response.json() == SAMPLE_JSON
+        server.close()
+    run(main())
+
+
+def test_keep_alive_pool():
+    async def main():
+        app = create_app()
+        task, port = await start_app(app)
+        client = HTTPClient()
+        url = 'http://127.0.0.1:{}'.format(port)
+        for i in range(5):
+            response = await client.get(url + '/')
+            assert response.status == 200
+            assert await response.text() == 'hello'
+            response = await client.post(url + '/echo', json={'i': i})
+            assert await response.json() == {'i': i}
+        # 10 个请求只建立了一个连接
+        assert client.connections == 1
+
+        # 并发请求各用各的连接，结束后最多保留 max_idle 个空闲连接
+        responses = await asyncio.gather(
+            *[client.get(url + '/') for _ in range(4)])
+        for response in responses:
+            assert await response.read() == b'hello'
+        assert len(client.pool[('http', '127.0.0.1', port)]) == \
+            client.max_idle
+
+        await client.close()
+        assert not client.pool[('http', '127.0.0.1', port)]
+        await stop_app(app, task)
+    run(main())
+
+
+def test_response_bodies():
+    async def main():
+        app = create_app()
+        task, port = await start_app(app)
+        client = HTTPClient()
+        url = 'http://127.0.0.1:{}'.format(port)
+
+        response = await client.get(url + '/chunked')
+        assert response.chunked
+        expected = ''.join('line {}\n'.format(i) for i in range(10))
+        assert await response.text() == expected
+
+        response = await client.get(url + '/big')
+        assert response.length == 20000
+        assert await response.read() == b'x' * 20000
+
+        # 流式读取：每块不超过指定大小，读完后连接回到连接池
+        response = await client.get(url + '/big')
+        sizes = []
+        while True:
+            chunk = await response.read_chunk(4096)
+            if not chunk:
+                break
+            sizes.append(len(chunk))
+        assert sum(sizes) == 20000 and max(sizes) <= 4096
+        response = await client.get(url + '/chunked')
+        assert b''.join([chunk async for chunk in response]) == \
+            expected.encode()
+
+        response = await client.request('HEAD', url + '/big')
+        assert response.status == 200 and response.done
+        response = await client.get(url + '/missing')
+        assert response.status == 404
+        await response.read()
+
+        assert client.connections == 1
+        await client.close()
+        await stop_app(app, task)
+    run(main())
+
+
+def test_server_closes_connection():
+    async def main():
+        app = create_app()
+        app.keep_alive_timeout = 0.1
+        task, port = await start_app(app)
+        client = HTTPClient()
+        url = 'http://127.0.0.1:{}/'.format(port)
+
+        response = await client.get(url)
+        assert await response.text() == 'hello'
+        # 服务器已关闭空闲连接，客户端自动换新连接重试
+        await asyncio.sleep(0.3)
+        response = await client.get(url)
+        assert await response.text() == 'hello'
+        assert client.connections == 2
+
+        # 服务器不再保持连接后，除了第一次复用池中的连接，每次都新建连接
+        app.keep_alive_timeout = 0
+        for _ in range(3):
+            response = await client.get(url)
+            assert await response.text() == 'hello'
+            assert not response.keep_alive
+        assert client.connections == 4
+        assert not client.pool[('http', '127.0.0.1', port)]
+
+        await client.close()
+        await stop_app(app, task)
+    run(main())
+
+
+def test_timeout():
+    async def main():
+        app = create_app()
+        task, port = await start_app(app)
+        client = HTTPClient(timeout=0.2)
+        url = 'http://127.0.0.1:{}'.format(port)
+        try:
+            await client.get(url + '/slow')
+            assert False, 'should time out'
+        except asyncio.TimeoutError:
+            pass
+        # 超时的连接不会放回连接池
+        response = await client.get(url + '/')
+        assert await response.text() == 'hello'
+        assert client.connections == 2
+        await client.close()
+        await asyncio.sleep(1)
+        await stop_app(app, task)
+    run(main())
+
+
+def test_chatbot():
+    from chatbot import ChatBot, escape_unicode
+    server = ThreadServer(create_app())
+    try:
+        url = 'http://127.0.0.1:{}/v1/chat/completions'.format(server.port)
+        bot = ChatBot('test-key', url=url)
+        assert bot.is_valid is None and bot.validate()
+        # ChatBot 发送前会把中文转义成 \uXXXX，模拟接口原样返回
+        assert bot.chat('你好') == 'echo: ' + escape_unicode('你好')
+        assert bot.chat('again') == 'echo: again'
+        # 同步调用之间复用同一个连接
+        assert bot.client.connections == 1
+        bot.close()
+        assert not ChatBot('wrong-key', url=url).validate()
+
+        # 在运行中的事件循环里创建，第一次对话前验证 API Key
+        async def create():
+            other = ChatBot('test-key', url=url)
+            answer = await other.chat_async('hi')
+            await other.client.close()
+            return other.is_valid, answer
+        assert run(create()) == (True, 'echo: hi')
+
+        # 在 asyncio 程序中多轮对话复用同一个连接
+        async def chat():
+            bot.client.connections = 0
+            for text in ['one', 'two', 'three']:
+                assert await bot.chat_async(text) == 'echo: ' + text
+            await bot.client.close()
+            return bot.client.connections
+        assert run(chat()) == 1
+    finally:
+        server.stop()
+
+
+def test_query_drug():
+    from query_drug import client, http_post, query_drug
+    server = ThreadServer(create_app())
+    try:
+        client.connections = 0
+        body = http_post('127.0.0.1', '/echo',
+                         {'Content-Type': 'application/json'}, '{"a": 1}',
+                         port=server.port)
+        assert json.loads(body) == {'a': 1}
+        info = query_drug('6921793020362', host='127.0.0.1',
+                          port=server.port)
+        assert info['data']['info']['name'] == '阿莫西林胶囊'
+        assert client.connections == 1
+        client.run(client.close())
+    finally:
+        server.stop()
+
+
+def bench_pooled_requests(n=500):
+    async def main():
+        app = create_app()
+        task, port = await start_app(app)
+        url = 'http://127.0.0.1:{}/echo'.format(port)
+        payload = {'model': 'deepseek-chat',
+                   'messages': [{'role': 'user', 'content': 'hello'}]}
+
+        # 旧的做法：每次请求新建连接并带 Connection: close
+        start = time.time()
+        for _ in range(n):
+            client = HTTPClient()
+            response = await client.post(url, json=payload,
+                                         headers={'Connection': 'close'})
+            await response.json()
+        close_rps = n / (time.time() - start)
+
+        start = time.time()
+        client = HTTPClient()
+        for _ in range(n):
+            response = await client.post(url, json=payload)
+            await response.json()
+        pooled_rps = n / (time.time() - start)
+        connections = client.connections
+        await client.close()
+
+        await stop_app(app, task)
+        return close_rps, pooled_rps, connections
+
+    close_rps, pooled_rps, connections = run(main())
+    print('  ➡️ 每次请求新建连接：{:.0f} 请求/秒'.format(close_rps))
+    print('  ➡️ 连接池复用连接：{:.0f} 请求/秒（{} 个请求共 {} 个连接）'.format(
+        pooled_rps, n, connections))
+
+
+def json_peak_memory(records, streaming):
+    import tracemalloc
+
+    async def main():
+        data = json.dumps([dict(SAMPLE_JSON['data']['info'], id=i)
+                           for i in range(records)]).encode()
+        server, port = await start_raw_server(
+            b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n' +
+            b''.join(b'%x\r\n%s\r\n' % (len(data[i:i + 1024]),
+                                       data[i:i + 1024])
+                     for i in range(0, len(data), 1024)) + b'0\r\n\r\n',
+            piece=4096)
+        client = HTTPClient()
+        response = await client.get('http://127.0.0.1:{}/'.format(port))
+        tracemalloc.start()
+        if streaming:
+            result = await response.json()
+        else:
+            result = json.loads(await response.read())
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert len(result) == records
+        await client.close()
+        server.close()
+        return len(data), peak
+    return run(main())
+
+
+def bench_json_memory(records=(100, 1000)):
+    for n in records:
+        size, whole = json_peak_memory(n, False)
+        _, streaming = json_peak_memory(n, True)
+        print('  ➡️ 响应体 {:.0f} KB：整体读取后解析峰值 {:.0f} KB，'
+              '增量解析峰值 {:.0f} KB'.format(
+                  size / 1024, whole / 1024, streaming / 1024))
+
+
+if __name__ == '__main__':
+    print('''
+【Miniclient 测试程序】
+──────────────────────────────────────────────
+在电脑上从仓库根目录运行：python test/test_miniclient.py
+──────────────────────────────────────────────''')
+
+    print("🚩 开始测试 HTTPClient 功能...")
+
+    print("🔍 正在测试 URL 拆分")
+    test_urlsplit()
+
+    print("🧮 正在测试增量 JSON 解析器")
+    test_json_parser()
+
+    print("🧩 正在测试 chunked 解码（原始 socket 服务器）")
+    test_chunked_decoder()
+
+    print("🔗 正在测试 keep-alive 连接池")
+    test_keep_alive_pool()
+
+    print("🧩 正在测试 chunked、Content-Length 与流式读取")
+    test_response_bodies()
+
+    print("🔌 正在测试服务器关闭连接后自动重连")
+    test_server_closes_connection()
+
+    print("⏱️ 正在测试请求超时")
+    test_timeout()
+
+    print("🤖 正在测试 ChatBot（本地模拟接口）")
+    test_chatbot()
+
+    print("💊 正在测试药品查询（本地模拟接口）")
+    test_query_drug()
+
+    print("📈 正在对比连接池与每次新建连接的吞吐量")
+    bench_pooled_requests()
+
+    print("📈 正在对比整体读取与增量解析 JSON 的内存峰值")
+    bench_json_memory()
+
+    print("✅ 全部测试通过！")
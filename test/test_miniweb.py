@@ -0,0 +1,1714 @@
+import sys
+sys.path.append('lib')  # 在电脑上从仓库根目录运行时查找驱动
+
+import asyncio
+import json
+import os
+import time
+from miniweb import (Miniweb, Request, Response, FormDataIter, FileUpload,
+                     AsyncBytesIO, RateLimiter, with_form_data, with_sse)
+
+
+def create_app():
+    app = Miniweb()
+
+    @app.get('/')
+    async def index(request):
+        return 'hello'
+
+    @app.get('/status')
+    async def status(request):
+        return {'temp': 25, 'humidity': 60}
+
+    return app
+
+
+async def start_app(app):
+    task = asyncio.create_task(app.start_server(host='127.0.0.1', port=0))
+    while app.server is None:
+        await asyncio.sleep(0.01)
+    return task, app.server.sockets[0].getsockname()[1]
+
+
+async def stop_app(app, task):
+    app.shutdown()
+    await task
+
+
+async def read_response(reader, head=False):
+    status = await reader.readline()
+    headers = {}
+    while True:
+        line = (await reader.readline()).strip().decode()
+        if not line:
+            break
+        header, value = line.split(':', 1)
+        headers[header.lower()] = value.strip()
+    if head or status.startswith(b'HTTP/1.1 304') or \
+            status.startswith(b'HTTP/1.0 304'):
+        body = b''
+    elif headers.get('transfer-encoding') == 'chunked':
+        body = b''
+        while True:
+            size = int(await reader.readline(), 16)
+            body += (await reader.readexactly(size + 2))[:size]
+            if not size:
+                break
+    else:
+        length = int(headers.get('content-length', 0))
+        body = await reader.readexactly(length) if length else b''
+    return status.decode().strip(), headers, body
+
+
+def request(path, keep_alive=True, version='1.1'):
+    return 'GET {} HTTP/{}\r\nHost: localhost\r\nConnection: {}\r\n\r\n'.format(
+        path, version, 'keep-alive' if keep_alive else 'close').encode()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_keep_alive():
+    async def main():
+        app = create_app()
+        task, port = await start_app(app)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for path in ['/', '/status', '/']:
+            writer.write(request(path))
+            await writer.drain()
+            status, headers, body = await read_response(reader)
+            assert status == 'HTTP/1.1 200 OK'
+            assert headers['connection'] == 'keep-alive'
+        writer.write(request('/', keep_alive=False))
+        await writer.drain()
+        status, headers, body = await read_response(reader)
+        assert status == 'HTTP/1.0 200 OK' and body == b'hello'
+        assert await reader.read() == b''
+        writer.close()
+        await stop_app(app, task)
+    run(main())
+
+
+def test_pipelining():
+    async def main():
+        app = create_app()
+        task, port = await start_app(app)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(request('/') + request('/status') + request('/nope'))
+        await writer.drain()
+        assert (await read_response(reader))[2] == b'hello'
+        assert b'"temp"' in (await read_response(reader))[2]
+        assert (await read_response(reader))[0].startswith('HTTP/1.1 404')
+        writer.close()
+        await stop_app(app, task)
+    run(main())
+
+
+def test_http10_and_limits():
+    async def main():
+        app = create_app()
+        app.max_keep_alive_requests = 2
+        task, port = await start_app(app)
+
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET / HTTP/1.0\r\n\r\n')
+        await writer.drain()
+        assert (await read_response(reader))[0] == 'HTTP/1.0 200 OK'
+        assert await reader.read() == b''
+        writer.close()
+
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(request('/') + request('/'))
+        await writer.drain()
+        assert (await read_response(reader))[0] == 'HTTP/1.1 200 OK'
+        assert (await read_response(reader))[0] == 'HTTP/1.0 200 OK'
+        assert await reader.read() == b''
+        writer.close()
+
+        app.keep_alive_timeout = 0.1
+        app.max_keep_alive_requests = 100
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(request('/'))
+        await writer.drain()
+        await read_response(reader)
+        assert await reader.read() == b''
+        writer.close()
+        await stop_app(app, task)
+    run(main())
+
+
+class FakeRequest:
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+
+
+class CountingStream:
+    def __init__(self, keep=False):
+        self.writes = 0
+        self.size = 0
+        self.data = b'' if keep else None
+
+    async def awrite(self, data):
+        self.writes += 1
+        self.size += len(data)
+        if self.data is not None:
+            self.data += bytes(data)
+
+
+def linear_find_route(app, req):
+    for methods, pattern, handler, _, _ in app.url_map:
+        args = pattern.match(req.path)
+        if args is not None and req.method in methods:
+            return handler, args
+    return None, None
+
+
+def create_routes_app(n):
+    app = Miniweb()
+    for i in range(n):
+        app.route('/sensor{}/<int:id>'.format(i))(lambda req, id: id)
+        app.route('/page{}'.format(i), methods=['GET', 'POST'])(
+            lambda req: 'page')
+    return app
+
+
+BROWSER_REQUEST = (
+    b'GET /sensor/1?unit=c&limit=10 HTTP/1.1\r\n'
+    b'Host: 192.168.4.1\r\n'
+    b'User-Agent: Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+    b'AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36\r\n'
+    b'Accept: text/html,application/xhtml+xml,application/xml;q=0.9,'
+    b'*/*;q=0.8\r\n'
+    b'Accept-Language: zh-CN,zh;q=0.9,en;q=0.8\r\n'
+    b'Accept-Encoding: gzip, deflate\r\n'
+    b'Cookie: session=abc123; theme=dark\r\n'
+    b'Referer: http://192.168.4.1/\r\n'
+    b'Connection: keep-alive\r\n\r\n')
+
+
+def test_lazy_request_parsing():
+    async def main():
+        req = await Request.create(None, AsyncBytesIO(BROWSER_REQUEST),
+                                   None, None)
+        assert req.path == '/sensor/1'
+        assert req.connection == 'keep-alive'
+        assert req.content_length == 0 and req.content_type is None
+        assert req._headers is None and req._args is None
+        assert req.args['unit'] == 'c' and req.args.get('limit', type=int) == 10
+        assert req.cookies == {'session': 'abc123', 'theme': 'dark'}
+        assert req.headers['accept-encoding'] == 'gzip, deflate'
+        assert req.headers['Host'] == '192.168.4.1'
+
+        body = b'{"a": 1}'
+        raw = (b'POST /data HTTP/1.1\r\nContent-Type: application/json\r\n'
+               b'content-length: 8\r\n\r\n' + body)
+        req = await Request.create(None, AsyncBytesIO(raw), None, None)
+        assert req.args == {} and req.cookies == {}
+        assert req.content_length == 8 and req.json == {'a': 1}
+
+        try:
+            await Request.create(None, AsyncBytesIO(
+                b'GET / HTTP/1.1\r\nbroken\r\n\r\n'), None, None)
+            assert False, 'invalid header accepted'
+        except ValueError:
+            pass
+
+    run(main())
+
+
+def test_route_index():
+    app = Miniweb()
+    for pattern, methods in [
+            ('/', ['GET']),
+            ('/users', ['GET']),
+            ('/users', ['POST']),
+            ('/users/<int:id>', ['GET']),
+            ('/users/<name>', ['GET', 'DELETE']),
+            ('/users/<int:id>/posts/<slug>', ['GET']),
+            ('/files/<path:path>', ['GET']),
+            ('/hex/<re:[0-9a-f]+:value>', ['GET']),
+            ('/<a>/<b>/', ['PUT'])]:
+        app.route(pattern, methods=methods)(
+            (lambda p: lambda req, **kwargs: p)(pattern))
+
+    for method, path in [
+            ('GET', '/'), ('GET', '/users'), ('POST', '/users'),
+            ('GET', '/users/42'), ('GET', '/users/-1'), ('GET', '/users/bob'),
+            ('DELETE', '/users/42'), ('GET', '/users/42/posts/hello'),
+            ('GET', '/files/a/b/c.txt'), ('GET', '/hex/ff0'),
+            ('GET', '/hex/xyz'), ('PUT', '/x/y/'), ('GET', '/x/y/'),
+            ('GET', '/users/'), ('GET', '/nope'), ('GET', '//')]:
+        req = FakeRequest(method, path)
+        f, _, _ = app.find_route(req)
+        handler, args = linear_find_route(app, req)
+        if handler is None:
+            assert not callable(f), path
+        else:
+            assert f is handler and req.url_args == args, path
+
+    assert app.find_route(FakeRequest('PATCH', '/users'))[0] == 405
+    assert app.find_route(FakeRequest('GET', '/missing/x/y'))[0] == 404
+    allow = app.default_options_handler(FakeRequest('OPTIONS', '/users'))
+    assert allow['Allow'] == 'GET, POST, HEAD, OPTIONS'
+
+
+def create_mounted_app(calls):
+    def hook(name):
+        async def before(request):
+            calls.append(name)
+
+        async def after(request, response):
+            calls.append(name + '.after')
+        return before, after
+
+    users = Miniweb()
+
+    @users.get('/')
+    async def list_users(request):
+        return 'users'
+
+    @users.route('/<int:id>', methods=['GET', 'DELETE'])
+    async def user(request, id):
+        return 'user {} via {}'.format(id, request.url_prefix)
+
+    api = Miniweb()
+    api.mount(users, '/users', local=True)
+
+    @api.get('/version')
+    async def version(request):
+        return 'v1'
+
+    app = Miniweb()
+
+    @app.get('/')
+    async def index(request):
+        return 'index'
+
+    @app.get('/api/version')
+    async def app_version(request):
+        return 'app'
+
+    app.mount(api, '/api/', local=True)
+    for name, subapp in (('app', app), ('api', api), ('users', users)):
+        before, after = hook(name)
+        subapp.before_request(before)
+        subapp.after_request(after)
+    return app, api, users
+
+
+def test_mount():
+    calls = []
+    app, api, users = create_mounted_app(calls)
+    assert len(app.url_map) == 2 and len(api.url_map) == 1
+
+    req = FakeRequest('GET', '/api/users/42')
+    f, prefix, subapp = app.find_route(req)
+    assert f is users.url_map[1][2] and prefix == '/api/users'
+    assert subapp is users and req.subapps == (api, users)
+    assert req.url_args == {'id': 42} and req.route == '/api/users/<int:id>'
+    assert app.find_route(FakeRequest('GET', '/api/users'))[0] is \
+        users.url_map[0][2]
+    assert app.find_route(FakeRequest('GET', '/api/version'))[0] is \
+        app.url_map[1][2]
+    assert app.find_route(FakeRequest('GET', '/api/users/x'))[0] == 404
+    assert app.find_route(FakeRequest('GET', '/apix/users'))[0] == 404
+    f, prefix, subapp = app.find_route(FakeRequest('POST', '/api/users/1'))
+    assert f == 405 and subapp is users
+    allow = app.default_options_handler(FakeRequest('OPTIONS', '/api/users/1'))
+    assert allow['Allow'] == 'GET, DELETE, HEAD, OPTIONS'
+
+    async def main():
+        task, port = await start_app(app)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for path, expected, hooks in [
+                ('/api/users/7', b'user 7 via /api/users',
+                 ['app', 'api', 'users', 'users.after', 'api.after',
+                  'app.after']),
+                ('/api/version', b'app', ['app', 'app.after']),
+                ('/', b'index', ['app', 'app.after'])]:
+            calls.clear()
+            writer.write(request(path))
+            await writer.drain()
+            assert (await read_response(reader))[2] == expected
+            assert calls == hooks, path
+        writer.close()
+        await stop_app(app, task)
+
+    run(main())
+
+    merged = Miniweb()
+    sub = Miniweb()
+    sub.before_request(lambda request: None)
+    merged.mount(sub, '/sub')
+    assert len(merged.before_request_handlers) == 1
+    assert sub.before_request_handlers == []
+
+    # 挂载之后注册的通配路由不会遮住子应用的路由
+    @app.get('/<path:path>')
+    async def catch_all(request, path):
+        return path
+
+    assert app.find_route(FakeRequest('GET', '/api/users/1'))[0] is \
+        users.url_map[1][2]
+    assert app.find_route(FakeRequest('GET', '/api/version'))[0] is \
+        app.url_map[1][2]
+    assert app.find_route(FakeRequest('GET', '/api/other'))[0] is catch_all
+    assert app.find_route(FakeRequest('GET', '/other'))[0] is catch_all
+
+
+def test_response_serialization():
+    async def write(res):
+        stream = CountingStream(keep=True)
+        await res.write(stream)
+        return stream
+
+    res = Response({'ok': True})
+    res.keep_alive = True
+    stream = run(write(res))
+    assert stream.writes == 1
+    assert stream.data.startswith(
+        b'HTTP/1.1 200 OK\r\nContent-Type: application/json; charset=UTF-8'
+        b'\r\nContent-Length: 11\r\nConnection: keep-alive\r\n\r\n')
+    assert json.loads(stream.data.split(b'\r\n\r\n', 1)[1]) == {'ok': True}
+
+    res = Response('teapot', 418, {'X-Device': 'esp32'}, reason="I'm a teapot")
+    res.set_cookie('a', '1')
+    res.set_cookie('b', '2', http_only=True)
+    stream = run(write(res))
+    assert stream.writes == 1 and stream.data == (
+        b"HTTP/1.0 418 I'm a teapot\r\nX-Device: esp32\r\n"
+        b'Set-Cookie: a=1\r\nSet-Cookie: b=2; HttpOnly\r\n'
+        b'Content-Length: 6\r\nContent-Type: text/plain; charset=UTF-8\r\n'
+        b'\r\nteapot')
+
+    res = Response(b'x' * (Response.max_merged_body + 1))
+    stream = run(write(res))
+    assert stream.writes == 2 and stream.data.endswith(b'\r\n\r\n' + res.body)
+    res = Response('x' * 5000)
+    res.is_head = True
+    stream = run(write(res))
+    assert stream.writes == 1 and stream.data.endswith(
+        b'Content-Length: 5000\r\n'
+        b'Content-Type: text/plain; charset=UTF-8\r\n\r\n')
+
+
+def chunked(data, size):
+    body = b''
+    for i in range(0, len(data), size):
+        body += '{:x}\r\n'.format(len(data[i:i + size])).encode() + \
+            data[i:i + size] + b'\r\n'
+    return body + b'0\r\nX-Trailer: 1\r\n\r\n'
+
+
+def test_chunked():
+    async def main():
+        app = Miniweb()
+
+        @app.get('/sync')
+        async def sync_stream(request):
+            def generate():
+                for i in range(3):
+                    yield 'line {}\n'.format(i)
+                yield ''
+            return generate()
+
+        @app.get('/async')
+        async def async_stream(request):
+            async def generate():
+                for i in range(3):
+                    yield b'x' * 1000
+            return generate()
+
+        @app.post('/echo')
+        async def echo(request):
+            if request.body:
+                return {'body': len(request.body), 'json': request.json}
+            return {'stream': len(await request.stream.read())}
+
+        task, port = await start_app(app)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+        writer.write(request('/sync') + request('/async'))
+        await writer.drain()
+        status, headers, body = await read_response(reader)
+        assert headers['transfer-encoding'] == 'chunked'
+        assert body == b'line 0\nline 1\nline 2\n'
+        assert (await read_response(reader))[2] == b'x' * 3000
+
+        data = b'{"r": 255, "g": 0, "b": 8}'
+        writer.write(b'POST /echo HTTP/1.1\r\nTransfer-Encoding: chunked\r\n'
+                     b'Content-Type: application/json\r\n\r\n' +
+                     chunked(data, 5))
+        await writer.drain()
+        status, headers, body = await read_response(reader)
+        assert headers['connection'] == 'keep-alive'
+        assert json.loads(body) == {'body': 26,
+                                    'json': {'r': 255, 'g': 0, 'b': 8}}
+
+        data = b'0123456789' * 5000
+        Request.max_content_length = 64 * 1024
+        try:
+            writer.write(b'POST /echo HTTP/1.1\r\n'
+                         b'Transfer-Encoding: chunked\r\n\r\n' +
+                         chunked(data, 3000))
+            await writer.drain()
+            status, headers, body = await read_response(reader)
+            assert json.loads(body) == {'stream': 50000}
+
+            # 超过 max_content_length 的分块请求体：读取时返回 413
+            writer.write(b'POST /echo HTTP/1.1\r\n'
+                         b'Transfer-Encoding: chunked\r\n\r\n' +
+                         chunked(data * 2, 3000))
+            await writer.drain()
+            status, headers, body = await read_response(reader)
+            assert status.startswith('HTTP/1.0 413')
+        finally:
+            Request.max_content_length = 16 * 1024
+        writer.close()
+
+        # 默认限制下不读取请求体直接返回 413，与 Content-Length 一致
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'POST /echo HTTP/1.1\r\nTransfer-Encoding: chunked\r\n'
+                     b'\r\n' + chunked(data * 4, 3000))
+        await writer.drain()
+        status, headers, body = await read_response(reader)
+        assert status.startswith('HTTP/1.0 413')
+        writer.close()
+
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /sync HTTP/1.0\r\n\r\n')
+        await writer.drain()
+        status, headers, body = await read_response(reader)
+        assert 'transfer-encoding' not in headers
+        assert await reader.read() == b'line 0\nline 1\nline 2\n'
+        writer.close()
+        await stop_app(app, task)
+    run(main())
+
+
+def ws_frame(opcode, data, fin=True):
+    mask = b'\x12\x34\x56\x78'
+    header = bytes([(0x80 if fin else 0) | opcode])
+    if len(data) < 126:
+        header += bytes([0x80 | len(data)])
+    else:
+        header += bytes([0x80 | 126]) + len(data).to_bytes(2, 'big')
+    return header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+
+
+async def ws_read(reader):
+    header = await reader.readexactly(2)
+    length = header[1] & 0x7f
+    if length == 126:
+        length = int.from_bytes(await reader.readexactly(2), 'big')
+    return header[0] & 0x0f, await reader.readexactly(length)
+
+
+def test_websocket():
+    async def main():
+        app = Miniweb()
+
+        @app.websocket('/ws/<name>')
+        async def echo(request, ws, name):
+            while True:
+                message = await ws.receive()
+                await ws.send(message if isinstance(message, bytes)
+                              else name + ': ' + message)
+
+        task, port = await start_app(app)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /ws/snake HTTP/1.1\r\nUpgrade: websocket\r\n'
+                     b'Connection: Upgrade\r\n'
+                     b'Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n'
+                     b'Sec-WebSocket-Version: 13\r\n\r\n')
+        await writer.drain()
+        status, headers, _ = await read_response(reader)
+        assert status == 'HTTP/1.1 101 Switching Protocols'
+        assert headers['sec-websocket-accept'] == \
+            's3pPLMBiTxaQ9kYGzzhZRbK+xOo='
+
+        writer.write(ws_frame(1, b'left'))
+        assert await ws_read(reader) == (1, b'snake: left')
+        writer.write(ws_frame(9, b'hi'))
+        assert await ws_read(reader) == (10, b'hi')
+        writer.write(ws_frame(2, b'\x00' * 200, fin=False) +
+                     ws_frame(0, b'\x01' * 200))
+        assert await ws_read(reader) == (2, b'\x00' * 200 + b'\x01' * 200)
+        writer.write(ws_frame(8, b'\x03\xe8'))
+        assert await ws_read(reader) == (8, b'\x03\xe8')
+        assert await reader.read() == b''
+        writer.close()
+
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(request('/ws/snake'))
+        await writer.drain()
+        assert (await read_response(reader))[0].startswith('HTTP/1.1 400')
+        writer.close()
+        await stop_app(app, task)
+    run(main())
+
+
+def test_sse():
+    async def main():
+        app = Miniweb()
+
+        @app.get('/events')
+        @with_sse
+        async def events(request, sse):
+            await sse.send('hello')
+            await sse.send({'temp': 25}, event='sensor', event_id=2)
+            await sse.send('a\nb')
+
+        task, port = await start_app(app)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(request('/events'))
+        await writer.drain()
+        status, headers, _ = await read_response(reader)
+        assert headers['content-type'] == 'text/event-stream'
+        events = (await reader.read()).decode().split('\n\n')
+        assert events[0] == 'data: hello'
+        assert events[1].startswith('id: 2\nevent: sensor\ndata: {')
+        assert events[2:] == ['data: a\ndata: b', '']
+        writer.close()
+        await stop_app(app, task)
+    run(main())
+
+
+def test_static_files():
+    import gzip
+    import tempfile
+
+    async def main(tmp):
+        with open(os.path.join(tmp, 'index.html'), 'wb') as f:
+            f.write(b'<html>' + b'x' * 5000 + b'</html>')
+        with open(os.path.join(tmp, 'app.js'), 'wb') as f:
+            f.write(b'let a = 1;' * 100)
+        with open(os.path.join(tmp, 'app.js.gz'), 'wb') as f:
+            f.write(gzip.compress(b'let a = 1;' * 100))
+
+        app = Miniweb()
+        app.static('/static', tmp, max_age=60)
+        task, port = await start_app(app)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+        async def get(path, *headers):
+            writer.write('GET {} HTTP/1.1\r\n{}\r\n'.format(
+                path, ''.join(h + '\r\n' for h in headers)).encode())
+            await writer.drain()
+            return await read_response(reader)
+
+        status, headers, body = await get('/static/index.html')
+        assert status == 'HTTP/1.1 200 OK' and len(body) == 5013
+        assert headers['content-type'] == 'text/html'
+        assert headers['cache-control'] == 'max-age=60'
+        etag, modified = headers['etag'], headers['last-modified']
+
+        status, headers, body = await get('/static/index.html',
+                                          'If-None-Match: ' + etag)
+        assert status == 'HTTP/1.1 304 N/A' and body == b''
+        status, _, _ = await get('/static/index.html',
+                                 'If-Modified-Since: ' + modified)
+        assert status == 'HTTP/1.1 304 N/A'
+        status, _, _ = await get('/static/index.html',
+                                 'If-None-Match: "other"',
+                                 'If-Modified-Since: ' + modified)
+        assert status == 'HTTP/1.1 200 OK'
+
+        status, headers, body = await get('/static/index.html',
+                                          'Range: bytes=0-5')
+        assert status == 'HTTP/1.1 206 N/A' and body == b'<html>'
+        assert headers['content-range'] == 'bytes 0-5/5013'
+        status, headers, body = await get('/static/index.html',
+                                          'Range: bytes=-7')
+        assert body == b'</html>'
+        status, headers, body = await get('/static/index.html',
+                                          'Range: bytes=4000-')
+        assert len(body) == 1013 and body.endswith(b'</html>')
+        status, headers, _ = await get('/static/index.html',
+                                       'Range: bytes=9000-')
+        assert status.startswith('HTTP/1.1 416')
+        assert headers['content-range'] == 'bytes */5013'
+
+        status, headers, body = await get('/static/app.js',
+                                          'Accept-Encoding: gzip, br')
+        assert headers['content-encoding'] == 'gzip'
+        assert headers['content-type'] == 'application/javascript'
+        assert gzip.decompress(body) == b'let a = 1;' * 100
+        status, headers, body = await get('/static/app.js')
+        assert 'content-encoding' not in headers and len(body) == 1000
+
+        assert (await get('/static/../x'))[0].startswith('HTTP/1.1 404')
+        assert (await get('/static/missing.txt'))[0].startswith(
+            'HTTP/1.1 404')
+        writer.close()
+        await stop_app(app, task)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        run(main(tmp))
+
+
+def create_cached_app(calls):
+    app = Miniweb()
+
+    @app.get('/status')
+    @app.cached(ttl=0.2)
+    async def status(request):
+        calls.append(request.path)
+        return {'temp': 25, 'calls': len(calls)}
+
+    @app.get('/page/<int:n>')
+    @app.cached(ttl=10, key=lambda request: request.args.get('lang', 'zh'))
+    async def page(request, n):
+        calls.append(request.path)
+        return '<p>{}</p>'.format(n) * 50, {'Content-Type': 'text/html'}
+
+    @app.get('/login')
+    @app.cached(ttl=10)
+    async def login(request):
+        calls.append(request.path)
+        res = Response('ok')
+        res.set_cookie('session', 'abc')
+        return res
+
+    @app.after_request
+    async def server_header(request, response):
+        response.headers['X-Calls'] = str(len(calls))
+
+    return app
+
+
+def test_response_cache():
+    async def main():
+        calls = []
+        hooks = []
+        app = create_cached_app(calls)
+        app.response_cache.max_bytes = 2048
+
+        @app.after_request
+        async def count_hooks(request, response):
+            hooks.append(request.path)
+
+        task, port = await start_app(app)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+        async def get(path, *headers, method='GET'):
+            writer.write('{} {} HTTP/1.1\r\n{}\r\n'.format(
+                method, path, ''.join(h + '\r\n' for h in headers)).encode())
+            await writer.drain()
+            return await read_response(reader, method == 'HEAD')
+
+        status, headers, body = await get('/status')
+        assert status == 'HTTP/1.1 200 OK' and json.loads(body)['calls'] == 1
+        assert headers['connection'] == 'keep-alive'
+        etag = headers['etag']
+        for _ in range(3):
+            status, cached, body = await get('/status')
+            assert json.loads(body)['calls'] == 1 and cached == headers
+        assert len(calls) == 1 and app.response_cache.hits == 3
+
+        # 命中缓存时不执行 after_request，原样返回第一次请求时它们设置的响应头
+        assert hooks == ['/status'] and cached['x-calls'] == '1'
+
+        status, headers, body = await get('/status', 'If-None-Match: ' + etag)
+        assert status == 'HTTP/1.1 304 Not Modified' and body == b''
+        assert headers['etag'] == etag
+        status, headers, body = await get('/status', method='HEAD')
+        assert status == 'HTTP/1.1 200 OK' and len(calls) == 1
+
+        await asyncio.sleep(0.25)
+        status, headers, body = await get('/status', 'If-None-Match: ' + etag)
+        assert len(calls) == 2 and status == 'HTTP/1.1 200 OK'
+        assert json.loads(body)['calls'] == 2 and headers['etag'] != etag
+
+        _, headers, body = await get('/page/1')
+        assert headers['content-type'] == 'text/html' and len(body) == 400
+        await get('/page/1?utm=x')
+        await get('/page/1?lang=en')
+        assert calls.count('/page/1') == 2
+
+        await get('/page/2')
+        await get('/page/3')
+        await get('/page/4')
+        assert app.response_cache.size <= 2048
+        assert len(app.response_cache.entries) < 5
+        calls.clear()
+        await get('/page/4')
+        await get('/page/1')
+        assert calls == ['/page/1']
+
+        await get('/login')
+        await get('/login')
+        assert calls.count('/login') == 2
+
+        writer.close()
+        await stop_app(app, task)
+
+    run(main())
+
+
+SENSOR_LOG = [{'time': 1700000000 + i, 'temp': 20 + i % 7, 'humidity': 55,
+               'device': 'esp32-greenhouse'} for i in range(40)]
+INDEX_PAGE = '<html><body>{}</body></html>'.format(''.join(
+    '<div class="card"><h2>传感器 {0}</h2><p id="v{0}">--</p></div>'.format(i)
+    for i in range(60)))
+
+
+def create_compressed_app(cache_dir=None):
+    app = Miniweb()
+    app.enable_compression(min_size=256, cache_dir=cache_dir)
+
+    @app.get('/status')
+    async def status(request):
+        return {'temp': 25}
+
+    @app.get('/log')
+    async def log(request):
+        return SENSOR_LOG
+
+    @app.get('/')
+    async def index(request):
+        return INDEX_PAGE, {'Content-Type': 'text/html; charset=UTF-8'}
+
+    @app.get('/stream')
+    async def stream(request):
+        def lines():
+            for i in range(100):
+                yield 'line {}\n'.format(i)
+        return lines()
+
+    @app.get('/cached')
+    @app.cached(ttl=10)
+    async def cached(request):
+        return SENSOR_LOG
+
+    return app
+
+
+def test_compression():
+    import gzip
+    import tempfile
+    import zlib
+
+    async def main(tmp):
+        with open(os.path.join(tmp, 'app.js'), 'wb') as f:
+            f.write(b'let a = 1;' * 100)
+        app = create_compressed_app(os.path.join(tmp, 'gz'))
+        app.static('/static', tmp)
+        task, port = await start_app(app)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+        async def get(path, *headers, method='GET'):
+            writer.write('{} {} HTTP/1.1\r\n{}\r\n'.format(
+                method, path, ''.join(h + '\r\n' for h in headers)).encode())
+            await writer.drain()
+            return await read_response(reader, method == 'HEAD')
+
+        _, headers, body = await get('/status', 'Accept-Encoding: gzip')
+        assert 'content-encoding' not in headers and 'vary' not in headers
+
+        _, headers, body = await get('/log', 'Accept-Encoding: gzip, deflate')
+        assert headers['content-encoding'] == 'gzip'
+        assert headers['vary'] == 'Accept-Encoding'
+        assert int(headers['content-length']) == len(body)
+        assert json.loads(gzip.decompress(body)) == SENSOR_LOG
+        _, headers, body = await get('/log', 'Accept-Encoding: gzip;q=0, deflate')
+        assert headers['content-encoding'] == 'deflate'
+        assert json.loads(zlib.decompress(body)) == SENSOR_LOG
+        _, headers, body = await get('/log')
+        assert 'content-encoding' not in headers and json.loads(body) == SENSOR_LOG
+        assert headers['vary'] == 'Accept-Encoding'
+
+        _, headers, body = await get('/stream', 'Accept-Encoding: gzip')
+        assert headers['transfer-encoding'] == 'chunked'
+        assert gzip.decompress(body) == ''.join(
+            'line {}\n'.format(i) for i in range(100)).encode()
+
+        _, headers, body = await get('/cached', 'Accept-Encoding: gzip')
+        assert json.loads(gzip.decompress(body)) == SENSOR_LOG
+        _, headers, body = await get('/cached')
+        assert json.loads(body) == SENSOR_LOG
+        _, headers, body = await get('/cached', 'Accept-Encoding: gzip')
+        assert headers['content-encoding'] == 'gzip'
+        assert app.response_cache.hits == 1
+
+        _, headers, body = await get('/static/app.js', 'Accept-Encoding: gzip')
+        assert headers['content-encoding'] == 'gzip'
+        assert gzip.decompress(body) == b'let a = 1;' * 100
+        cached, = os.listdir(os.path.join(tmp, 'gz'))
+        assert cached.endswith('-app.js.gz')
+        etag = headers['etag']
+        _, headers, body = await get('/static/app.js', 'Accept-Encoding: gzip')
+        assert headers['etag'] == etag
+        _, headers, body = await get('/static/app.js')
+        assert 'content-encoding' not in headers and len(body) == 1000
+
+        # 没有 .gz 文件时由 Compression 压缩，带压缩后的 ETag 也能返回 304
+        app.compression.cache_dir = None
+        _, headers, body = await get('/static/app.js', 'Accept-Encoding: gzip')
+        assert headers['content-encoding'] == 'gzip'
+        etag = headers['etag']
+        assert etag.endswith('-gzip"')
+        status, headers, body = await get(
+            '/static/app.js', 'Accept-Encoding: gzip',
+            'If-None-Match: ' + etag)
+        assert status.startswith('HTTP/1.1 304') and body == b''
+        assert headers['etag'] == etag
+        status, headers, body = await get('/static/app.js',
+                                          'If-None-Match: ' + etag)
+        assert status.startswith('HTTP/1.1 200') and len(body) == 1000
+        writer.close()
+        await stop_app(app, task)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        run(main(tmp))
+
+
+def test_background_tasks():
+    import threading
+
+    async def main():
+        app = Miniweb()
+        app.max_background_tasks = 2
+        done = []
+        release = asyncio.Event()
+
+        def blocking_write(color):
+            time.sleep(0.05)
+            done.append((color, threading.current_thread().name))
+
+        async def slow(name):
+            await release.wait()
+            done.append(name)
+
+        @app.post('/color/<color>')
+        async def color(request, color):
+            request.defer(blocking_write, color)
+            return 'ok'
+
+        @app.get('/slow/<name>')
+        async def slow_route(request, name):
+            request.defer(slow(name))
+            return 'queued'
+
+        task, port = await start_app(app)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+        async def send(method, path):
+            writer.write('{} {} HTTP/1.1\r\n\r\n'.format(
+                method, path).encode())
+            await writer.drain()
+            return await read_response(reader)
+
+        start = time.time()
+        status, _, body = await send('POST', '/color/red')
+        assert status == 'HTTP/1.1 200 OK' and body == b'ok'
+        assert time.time() - start < 0.05 and done == []
+        await asyncio.sleep(0.1)
+        assert done[0][0] == 'red'
+        assert done[0][1] != threading.current_thread().name
+
+        done.clear()
+        assert (await send('GET', '/slow/a'))[0] == 'HTTP/1.1 200 OK'
+        assert (await send('GET', '/slow/b'))[0] == 'HTTP/1.1 200 OK'
+        assert (await send('GET', '/slow/c'))[0] == 'HTTP/1.1 200 OK'
+        status, _, body = await send('GET', '/slow/d')
+        assert status == 'HTTP/1.1 503 N/A' and body == b'Busy'
+        release.set()
+        await asyncio.sleep(0.05)
+        assert done == ['a', 'b', 'c']
+
+        calls = []
+
+        async def executor(f, *args):
+            calls.append(args)
+            return f(*args)
+
+        app.executor = executor
+        await send('POST', '/color/blue')
+        await asyncio.sleep(0.1)
+        assert calls == [('blue',)] and done[-1][0] == 'blue'
+        assert done[-1][1] == threading.current_thread().name
+        writer.close()
+        await stop_app(app, task)
+
+    run(main())
+
+
+def test_rate_limiter(clients=5000):
+    limiter = RateLimiter(rate=2, burst=3, max_clients=1000)
+    for i in range(clients):
+        ip = '10.{}.{}.{}'.format(i >> 16, (i >> 8) & 255, i & 255)
+        assert [limiter.acquire(ip, 2, 3, now=0) for _ in range(4)] == \
+            [0, 0, 0, 0.5]
+        limiter.acquire('10.0.0.0', 2, 3, now=0)
+    assert len(limiter.buckets) == 1000
+    assert '10.0.0.0' in limiter.buckets and '10.0.0.1' not in limiter.buckets
+    assert limiter.limited == 2 * clients
+
+    assert limiter.acquire('10.0.0.0', 2, 3, now=250) == 0.25
+    assert limiter.acquire('10.0.0.0', 2, 3, now=750) == 0
+    assert limiter.acquire('10.0.0.0', 2, 3, now=10000) == 0
+    assert limiter.buckets['10.0.0.0'][0] == 2
+
+    async def main():
+        app = create_app()
+
+        @app.get('/strip/color')
+        async def color(request):
+            return 'ok'
+
+        limiter = app.rate_limit(1, burst=2)
+        limiter.limit('/strip/color', 0.5, burst=1)
+        task, port = await start_app(app)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+        async def get(path):
+            writer.write(request(path))
+            await writer.drain()
+            return await read_response(reader)
+
+        assert (await get('/'))[0] == 'HTTP/1.1 200 OK'
+        assert (await get('/status'))[0] == 'HTTP/1.1 200 OK'
+        status, headers, body = await get('/')
+        assert status == 'HTTP/1.1 429 N/A' and body == b'Too many requests'
+        assert headers['retry-after'] == '1'
+        assert (await get('/strip/color'))[0] == 'HTTP/1.1 200 OK'
+        status, headers, _ = await get('/strip/color')
+        assert status == 'HTTP/1.1 429 N/A' and headers['retry-after'] == '2'
+        await asyncio.sleep(1.05)
+        assert (await get('/'))[0] == 'HTTP/1.1 200 OK'
+        writer.close()
+        await stop_app(app, task)
+
+    run(main())
+
+
+def create_log_db(rows):
+    from tinydb import TinyDB
+    from tinydb.storages import MemoryStorage
+
+    db = TinyDB(storage=MemoryStorage)
+    db.table('log').insert_multiple(
+        {'time': 1700000000 + i, 'temp': 20 + i % 7, 'note': 'ok'}
+        for i in range(rows))
+    return db
+
+
+def test_stream_json():
+    from miniweb import iter_json, stream_json
+
+    data = {'name': 'greenhouse', 'empty': {}, 'tags': [], 'nested': {
+        'rows': (row for row in [{'a': 1}, {'b': [1, 2.5, None, True]}]),
+        'n': 3}, 'sensors': ['temp', {'id': 1, 'ok': False}]}
+    chunks = list(iter_json(data, chunk_size=8))
+    assert all(isinstance(chunk, bytes) for chunk in chunks)
+    assert len(chunks) > 1
+    assert json.loads(b''.join(chunks)) == {
+        'name': 'greenhouse', 'empty': {}, 'tags': [], 'nested': {
+            'rows': [{'a': 1}, {'b': [1, 2.5, None, True]}], 'n': 3},
+        'sensors': ['temp', {'id': 1, 'ok': False}]}
+    assert b''.join(iter_json(iter([]))) == b'[]'
+
+    db = create_log_db(2000)
+
+    async def main():
+        app = Miniweb()
+
+        @app.get('/log')
+        async def log(request):
+            return stream_json(db.table('log'))
+
+        @app.get('/export')
+        async def export(request):
+            return stream_json({'device': 'esp32', 'rows': (
+                row for row in db.table('log') if row['temp'] > 24)})
+
+        task, port = await start_app(app)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(request('/log'))
+        await writer.drain()
+        _, headers, body = await read_response(reader)
+        assert headers['transfer-encoding'] == 'chunked'
+        assert headers['content-type'] == 'application/json; charset=UTF-8'
+        assert json.loads(body) == db.table('log').all()
+        writer.write(request('/export'))
+        await writer.drain()
+        _, _, body = await read_response(reader)
+        assert len(json.loads(body)['rows']) == sum(
+            1 for i in range(2000) if i % 7 > 4)
+        writer.close()
+        await stop_app(app, task)
+
+    run(main())
+
+
+def test_metrics():
+    async def main():
+        app = create_app()
+        metrics = app.enable_metrics()
+        records = []
+
+        @metrics.hook
+        def hook(req, res, timings):
+            records.append((req.path, res.status_code, timings))
+
+        @app.get('/fail')
+        async def fail(request):
+            raise RuntimeError('boom')
+
+        @app.get('/sensor/<int:id>')
+        async def sensor(request, id):
+            await asyncio.sleep(0.03)
+            return str(id)
+
+        task, port = await start_app(app)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(request('/') + request('/sensor/1') +
+                     request('/sensor/2') + request('/fail') +
+                     request('/nope'))
+        await writer.drain()
+        for _ in range(5):
+            await read_response(reader)
+        writer.write(request('/metrics'))
+        await writer.drain()
+        status, headers, body = await read_response(reader)
+        writer.close()
+        await stop_app(app, task)
+
+        text = body.decode()
+        assert headers['content-type'].startswith('text/plain; version=0.0.4')
+        assert 'miniweb_requests_total{method="GET",route="/sensor/<int:id>",' \
+            'status="200"} 2' in text
+        assert 'miniweb_requests_total{method="GET",route="-",' \
+            'status="404"} 1' in text
+        assert 'miniweb_errors_total{route="/fail"} 1' in text
+        assert 'miniweb_request_duration_seconds_bucket{route="/sensor/' \
+            '<int:id>",phase="handler",le="0.025"} 0' in text
+        assert 'miniweb_request_duration_seconds_bucket{route="/sensor/' \
+            '<int:id>",phase="handler",le="0.05"} 2' in text
+        assert 'miniweb_request_duration_seconds_count{route="/",' \
+            'phase="write"} 1' in text
+        assert 'miniweb_active_connections 1' in text
+        assert metrics.bytes_in > 0 and metrics.bytes_out > 0
+        assert [r[:2] for r in records] == [
+            ('/', 200), ('/sensor/1', 200), ('/sensor/2', 200),
+            ('/fail', 500), ('/nope', 404), ('/metrics', 200)]
+        assert records[1][2][1] >= 0.03
+    run(main())
+
+
+def multipart_body(boundary, fields, files):
+    body = b'preamble\r\n'
+    for name, value in fields:
+        body += ('--{}\r\nContent-Disposition: form-data; name="{}"\r\n'
+                 '\r\n'.format(boundary, name)).encode() + value + b'\r\n'
+    for name, filename, value in files:
+        body += ('--{}\r\nContent-Disposition: form-data; name="{}"; '
+                 'filename="{}"\r\nContent-Type: application/octet-stream'
+                 '\r\n\r\n'.format(boundary, name, filename)).encode() + \
+            value + b'\r\n'
+    return body + '--{}--\r\n'.format(boundary).encode()
+
+
+def test_multipart_parser():
+    async def main():
+        boundary = 'xYzZY'
+        data = bytes(range(256)) * 20 + b'\r\n--xYzZ\r\n' * 10
+        body = multipart_body(boundary, [('name', b'sensor'), ('n', b'')],
+                              [('file', 'a.bin', data), ('empty', 'b', b'')])
+        for chunk_size in [1, 7, 64, 1024]:
+            FormDataIter.chunk_size = chunk_size
+            req = Request(None, None, 'POST', '/', '1.1', {},
+                          stream=AsyncBytesIO(body))
+            req.content_type = 'multipart/form-data; boundary=' + boundary
+            req.content_length = len(body)
+            parts = []
+            async for name, value in FormDataIter(req):
+                if isinstance(value, FileUpload):
+                    value = (value.filename, await value.read())
+                parts.append((name, value))
+            assert parts == [('name', 'sensor'), ('n', ''),
+                             ('file', ('a.bin', data)), ('empty', ('b', b''))]
+        FormDataIter.chunk_size = 512
+    run(main())
+
+
+def test_multipart_upload(size=256 * 1024):
+    import tempfile
+
+    async def main(tmp):
+        FileUpload.spool_prefix = os.path.join(tmp, 'upload')
+        Request.max_content_length = 2 * size
+        app = Miniweb()
+
+        @app.post('/upload')
+        @with_form_data
+        async def upload(request):
+            await request.files['file'].save(os.path.join(tmp, 'fw.bin'))
+            return request.form['name']
+
+        task, port = await start_app(app)
+        boundary = 'b0undary'
+        body = multipart_body(boundary, [('name', b'firmware')],
+                              [('file', 'fw.bin', b'\xa5' * size)])
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(('POST /upload HTTP/1.1\r\nContent-Length: {}\r\n'
+                      'Content-Type: multipart/form-data; boundary={}\r\n'
+                      '\r\n'.format(len(body), boundary)).encode() + body)
+        await writer.drain()
+        status, _, res = await read_response(reader)
+        writer.close()
+        await stop_app(app, task)
+        Request.max_content_length = 16 * 1024
+        FileUpload.spool_prefix = '/upload'
+
+        assert status == 'HTTP/1.0 200 OK' and res == b'firmware'
+        with open(os.path.join(tmp, 'fw.bin'), 'rb') as f:
+            assert f.read() == b'\xa5' * size
+        assert os.listdir(tmp) == ['fw.bin']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        run(main(tmp))
+
+
+class UploadStream:
+    def __init__(self, head, size, tail):
+        self.parts = [tail, b'\xa5', head]
+        self.size = size
+
+    async def read(self, n=-1):
+        if len(self.parts) == 2 and self.size:
+            n = min(n, self.size)
+            self.size -= n
+            return self.parts[1] * n
+        if len(self.parts) == 2:
+            self.parts.pop()
+        return self.parts.pop() if self.parts else b''
+
+
+def multipart_peak_memory(size):
+    import tracemalloc
+
+    class Sink:
+        def write(self, data):
+            pass
+
+    async def main():
+        head = b'--bb\r\nContent-Disposition: form-data; name="f"; ' \
+            b'filename="x"\r\n\r\n'
+        tail = b'\r\n--bb--\r\n'
+        req = Request(None, None, 'POST', '/', '1.1', {},
+                      stream=UploadStream(head, size, tail))
+        req.content_type = 'multipart/form-data; boundary=bb'
+        req.content_length = len(head) + size + len(tail)
+        tracemalloc.start()
+        async for name, upload in FormDataIter(req):
+            await upload.copy_to(Sink())
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+    return run(main())
+
+
+def test_multipart_memory():
+    small = multipart_peak_memory(64 * 1024)
+    large = multipart_peak_memory(4 * 1024 * 1024)
+    assert large < small + 8 * FormDataIter.chunk_size
+
+
+def load_clients(port, clients, results):
+    async def client():
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            start = time.time()
+            writer.write(request('/slow', keep_alive=False))
+            await writer.drain()
+            status = (await read_response(reader))[0].split()[1]
+            writer.close()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return 'reset', 0
+        return status, time.time() - start
+
+    async def main():
+        return await asyncio.gather(*[client() for _ in range(clients)])
+    results.put(run(main()))
+
+
+def overload(max_connections, clients=200, delay=0.05):
+    import multiprocessing
+    import tracemalloc
+
+    async def main():
+        app = Miniweb()
+        app.max_connections = max_connections
+        app.backlog = clients
+        active = [0, 0]
+
+        @app.get('/slow')
+        async def slow(request):
+            active[0] += 1
+            active[1] = max(active)
+            await asyncio.sleep(delay)
+            active[0] -= 1
+            return 'x' * 1024
+
+        task, port = await start_app(app)
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=load_clients,
+                                          args=(port, clients, queue))
+        tracemalloc.start()
+        process.start()
+        results = await asyncio.get_running_loop().run_in_executor(
+            None, queue.get)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        process.join()
+        await stop_app(app, task)
+
+        latencies = sorted(t for status, t in results if status == '200')
+        statuses = {}
+        for status, _ in results:
+            statuses[status] = statuses.get(status, 0) + 1
+        return statuses, active[1], peak, latencies
+    return run(main())
+
+
+def test_max_connections():
+    statuses, max_active, _, _ = overload(4, clients=50)
+    assert max_active <= 4
+    assert set(statuses) <= {'200', '503'} and statuses['503'] > 0
+    assert sum(statuses.values()) == 50
+
+
+def test_idle_keep_alive():
+    async def main():
+        app = Miniweb()
+        app.max_connections = 8
+
+        @app.get('/')
+        async def index(request):
+            return 'ok'
+
+        task, port = await start_app(app)
+        clients = []
+        for _ in range(8):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request('/'))
+            await writer.drain()
+            assert (await read_response(reader))[0] == 'HTTP/1.1 200 OK'
+            clients.append((reader, writer))
+
+        # 8 个空闲的 keep-alive 连接占满上限时，关闭最早的空闲连接
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(request('/'))
+        await writer.drain()
+        assert (await read_response(reader))[0] == 'HTTP/1.1 200 OK'
+        assert await asyncio.wait_for(clients[0][0].read(), 1) == b''
+
+        # 其它空闲连接仍然可以继续使用
+        clients[1][1].write(request('/'))
+        await clients[1][1].drain()
+        assert (await read_response(clients[1][0]))[0] == 'HTTP/1.1 200 OK'
+        await asyncio.sleep(0.01)
+        assert app.connections == 8
+
+        for _, client in clients + [(reader, writer)]:
+            client.close()
+        await stop_app(app, task)
+    run(main())
+
+
+def bench_overload(clients=(50, 200, 400)):
+    for max_connections in [0, 8]:
+        for n in clients:
+            statuses, max_active, peak, latencies = overload(
+                max_connections, clients=n)
+            p95 = latencies[int(len(latencies) * 0.95) - 1] \
+                if latencies else 0
+            print('  ➡️ 连接上限 {}，{} 个并发客户端：同时处理 {} 个请求，'
+                  '结果 {}，内存峰值 {:.0f} KB，成功请求 p95 延迟 {:.0f} 毫秒'
+                  .format(max_connections or '无', n, max_active, statuses,
+                          peak / 1024, p95 * 1000))
+
+
+def bench_request_parsing(n=2000):
+    import gc
+    import tracemalloc
+
+    async def parse(count):
+        readers = [AsyncBytesIO(BROWSER_REQUEST) for _ in range(count)]
+        return [await Request.create(None, reader, None, None)
+                for reader in readers]
+
+    async def main():
+        start = time.time()
+        for _ in range(n // 100):
+            await parse(100)
+        elapsed_us = (time.time() - start) * 1e6 / n
+
+        tracemalloc.start()
+        requests = await parse(100)
+        retained = tracemalloc.get_traced_memory()[0] / 100
+        tracemalloc.stop()
+        assert requests[0].path == '/sensor/1'
+
+        garbage = None
+        if hasattr(gc, 'mem_alloc'):
+            readers = [AsyncBytesIO(BROWSER_REQUEST) for _ in range(100)]
+            gc.collect()
+            gc.disable()
+            before = gc.mem_alloc()
+            for reader in readers:
+                await Request.create(None, reader, None, None)
+            garbage = (gc.mem_alloc() - before) / 100
+            gc.enable()
+        return elapsed_us, retained, garbage
+
+    elapsed_us, retained, garbage = run(main())
+    print('  ➡️ 解析耗时 {:.1f} 微秒/次，每个请求对象占用 {:.0f} 字节'.format(
+        elapsed_us, retained))
+    if garbage is not None:
+        print('  ➡️ 每个请求产生垃圾 {:.0f} 字节'.format(garbage))
+
+
+def bench_keep_alive(n=500):
+    async def main():
+        app = create_app()
+        task, port = await start_app(app)
+
+        start = time.time()
+        for _ in range(n):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request('/status', keep_alive=False))
+            await writer.drain()
+            await read_response(reader)
+            writer.close()
+        close_rps = n / (time.time() - start)
+
+        start = time.time()
+        reader, writer = None, None
+        for i in range(n):
+            if i % app.max_keep_alive_requests == 0:
+                if writer:
+                    writer.close()
+                reader, writer = await asyncio.open_connection(
+                    '127.0.0.1', port)
+            writer.write(request('/status'))
+            await writer.drain()
+            await read_response(reader)
+        writer.close()
+        keep_alive_rps = n / (time.time() - start)
+
+        await stop_app(app, task)
+        return close_rps, keep_alive_rps
+
+    close_rps, keep_alive_rps = run(main())
+    print('  ➡️ 每次请求新建连接：{:.0f} 请求/秒'.format(close_rps))
+    print('  ➡️ keep-alive 长连接：{:.0f} 请求/秒'.format(keep_alive_rps))
+
+
+def bench_response_cache(n=1000):
+    async def main():
+        app = create_cached_app([])
+        app.max_keep_alive_requests = 2 * n
+
+        @app.get('/plain/<int:n>')
+        async def plain(request, n):
+            return '<p>{}</p>'.format(n) * 50, {'Content-Type': 'text/html'}
+
+        task, port = await start_app(app)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        results = []
+        for path in ('/plain/1', '/page/1'):
+            start = time.time()
+            for _ in range(n):
+                writer.write(request(path))
+                await writer.drain()
+                await read_response(reader)
+            results.append(n / (time.time() - start))
+        writer.close()
+        await stop_app(app, task)
+        return results
+
+    uncached_rps, cached_rps = run(main())
+    print('  ➡️ 每次执行处理函数：{:.0f} 请求/秒'.format(uncached_rps))
+    print('  ➡️ 命中响应缓存：{:.0f} 请求/秒'.format(cached_rps))
+
+
+def bench_compression(n=200):
+    async def main():
+        app = create_compressed_app()
+        app.max_keep_alive_requests = 4 * n
+        task, port = await start_app(app)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        results = []
+        for path in ('/log', '/'):
+            for encoding in ('identity', 'gzip'):
+                start = time.time()
+                for _ in range(n):
+                    writer.write('GET {} HTTP/1.1\r\nAccept-Encoding: {}'
+                                 '\r\n\r\n'.format(path, encoding).encode())
+                    await writer.drain()
+                    _, _, body = await read_response(reader)
+                results.append((path, encoding, len(body),
+                                (time.time() - start) * 1000 / n))
+        writer.close()
+        await stop_app(app, task)
+        return results
+
+    for path, encoding, size, latency in run(main()):
+        print('  ➡️ {} {}：{} 字节，本机延迟 {:.2f} 毫秒，'
+              '1 Mbps 链路传输约 {:.1f} 毫秒'.format(
+                  path, encoding, size, latency, size * 8 / 1000))
+
+
+def bench_mount(modules=20, routes=25, n=2000):
+    flat = Miniweb()
+    app = Miniweb()
+    for i in range(modules):
+        module = Miniweb()
+        for j in range(routes):
+            handler = (lambda req, id: id)
+            module.route('/item{}/<int:id>'.format(j))(handler)
+            flat.route('/module{}/item{}/<int:id>'.format(i, j))(handler)
+        app.mount(module, '/module{}'.format(i), local=True)
+    app.compile_routes()
+    flat.compile_routes()
+    paths = ['/module{}/item{}/7'.format(i % modules, i % routes)
+             for i in range(n)]
+    results = []
+    for target in (flat, app):
+        reqs = [FakeRequest('GET', path) for path in paths]
+        start = time.time()
+        for req in reqs:
+            target.find_route(req)
+        results.append((time.time() - start) * 1e6 / n)
+    print('  ➡️ {} 个子应用 × {} 条路由：单层路由表 {:.1f} 微秒/次，'
+          '分层挂载 {:.1f} 微秒/次'.format(modules, routes, *results))
+
+
+def bench_rate_limiter(clients=10000, n=100000):
+    import tracemalloc
+
+    class Client:
+        route = '/strip/color'
+
+        def __init__(self, i):
+            self.client_addr = ('10.{}.{}.{}'.format(
+                i >> 16, (i >> 8) & 255, i & 255), 50000)
+
+    limiter = RateLimiter(rate=5, burst=10, max_clients=1024)
+    reqs = [Client(i % clients) for i in range(n)]
+
+    async def main():
+        tracemalloc.start()
+        start = time.time()
+        for req in reqs:
+            await limiter.check(req)
+        elapsed_us = (time.time() - start) * 1e6 / n
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return elapsed_us, memory
+
+    elapsed_us, memory = run(main())
+    print('  ➡️ {} 个客户端轮流请求：限流检查 {:.1f} 微秒/次，'
+          '保留 {} 个客户端状态占用 {:.0f} KB'.format(
+              clients, elapsed_us, len(limiter.buckets), memory / 1024))
+
+
+def bench_response_write(n=5000):
+    import gc
+
+    def responses():
+        res = Response({'temp': 25, 'humidity': 60})
+        res.keep_alive = True
+        yield 'JSON', res
+        res = Response('<p>hello</p>', headers={
+            'Content-Type': 'text/html; charset=UTF-8',
+            'Cache-Control': 'no-cache', 'X-Device': 'esp32'})
+        res.set_cookie('session', 'abc123')
+        yield 'HTML', res
+        res = Response(b'x' * 4096, headers={
+            'Content-Type': 'application/octet-stream'})
+        yield '4 KB', res
+
+    async def main():
+        results = []
+        for name, template in responses():
+            def fresh():
+                res = Response(template.body, template.status_code,
+                               dict(template.headers))
+                res.keep_alive = template.keep_alive
+                return res
+            stream = CountingStream()
+            batch = [fresh() for _ in range(n)]
+            start = time.time()
+            for res in batch:
+                await res.write(stream)
+            elapsed_us = (time.time() - start) * 1e6 / n
+            garbage = None
+            if hasattr(gc, 'mem_alloc'):
+                batch = [fresh() for _ in range(100)]
+                gc.collect()
+                gc.disable()
+                before = gc.mem_alloc()
+                for res in batch:
+                    await res.write(stream)
+                garbage = (gc.mem_alloc() - before) / 100
+                gc.enable()
+            results.append((name, stream.writes / n, elapsed_us, garbage))
+        return results
+
+    for name, writes, elapsed_us, garbage in run(main()):
+        print('  ➡️ {} 响应：每次 {:.0f} 次写入，耗时 {:.1f} 微秒{}'.format(
+            name, writes, elapsed_us, '' if garbage is None
+            else '，产生垃圾 {:.0f} 字节'.format(garbage)))
+
+
+def bench_stream_json(rows=(1000, 5000)):
+    import tracemalloc
+    from miniweb import stream_json
+
+    for n in rows:
+        db = create_log_db(n)
+        table = db.table('log')
+        table.all()
+        results = []
+        for make in (lambda: Response(table.all()),
+                     lambda: stream_json(table)):
+            stream = CountingStream()
+            tracemalloc.start()
+            run(make().write(stream))
+            results.append(tracemalloc.get_traced_memory()[1] / 1024)
+            tracemalloc.stop()
+        print('  ➡️ {} 条记录：一次性序列化峰值 {:.0f} KB，'
+              '流式序列化峰值 {:.0f} KB'.format(n, *results))
+
+
+def bench_routes(counts=(10, 100, 500), n=2000):
+    for count in counts:
+        app = create_routes_app(count // 2)
+        app.compile_routes()
+        paths = ['/sensor{}/7'.format(count // 2 - 1), '/page0', '/missing']
+        reqs = [FakeRequest('GET', paths[i % 3]) for i in range(n)]
+
+        start = time.time()
+        for req in reqs:
+            linear_find_route(app, req)
+        linear_us = (time.time() - start) * 1e6 / n
+
+        start = time.time()
+        for req in reqs:
+            app.find_route(req)
+        index_us = (time.time() - start) * 1e6 / n
+
+        print('  ➡️ {} 条路由：线性扫描 {:.1f} 微秒/次，路由索引 {:.1f} 微秒/次'.format(
+            count, linear_us, index_us))
+
+
+if __name__ == '__main__':
+    print('''
+【Miniweb 测试程序】
+──────────────────────────────────────────────
+在电脑上从仓库根目录运行：python test/test_miniweb.py
+──────────────────────────────────────────────''')
+
+    print("🚩 开始测试 Miniweb 功能...")
+
+    print("🔗 正在测试 keep-alive 长连接")
+    test_keep_alive()
+
+    print("📦 正在测试请求流水线 (pipelining)")
+    test_pipelining()
+
+    print("⏱️ 正在测试 HTTP/1.0、请求上限与空闲超时")
+    test_http10_and_limits()
+
+    print("🧾 正在测试请求头按需解析")
+    test_lazy_request_parsing()
+
+    print("🧭 正在测试路由索引")
+    test_route_index()
+
+    print("🪆 正在测试子应用分层挂载")
+    test_mount()
+
+    print("📨 正在测试响应头一次性写出")
+    test_response_serialization()
+
+    print("🧩 正在测试 chunked 分块传输编码")
+    test_chunked()
+
+    print("💾 正在测试响应缓存")
+    test_response_cache()
+
+    print("🗜️ 正在测试 gzip/deflate 响应压缩")
+    test_compression()
+
+    print("⏳ 正在测试后台任务")
+    test_background_tasks()
+
+    print("🚧 正在测试令牌桶限流")
+    test_rate_limiter()
+
+    print("🧱 正在测试流式 JSON 输出")
+    test_stream_json()
+
+    print("📊 正在测试性能统计 /metrics")
+    test_metrics()
+
+    print("🔌 正在测试 WebSocket")
+    test_websocket()
+
+    print("📡 正在测试 SSE 服务器推送")
+    test_sse()
+
+    print("🗂️ 正在测试静态文件（304、Range、gzip）")
+    test_static_files()
+
+    print("📎 正在测试 multipart/form-data 解析")
+    test_multipart_parser()
+
+    print("📤 正在测试文件流式上传")
+    test_multipart_upload()
+    for size in [64 * 1024, 1024 * 1024, 4 * 1024 * 1024]:
+        print('  ➡️ 上传 {} KB，解析器内存峰值 {:.1f} KB'.format(
+            size // 1024, multipart_peak_memory(size) / 1024))
+
+    print("🚦 正在测试并发连接上限")
+    test_max_connections()
+    test_idle_keep_alive()
+
+    print("📈 正在对比过载时有无连接上限的内存与延迟")
+    bench_overload()
+
+    print("📈 正在对比 keep-alive 与每次新建连接的吞吐量")
+    bench_keep_alive()
+
+    print("📈 正在对比路由索引与线性扫描的查找耗时")
+    bench_routes()
+
+    print("📈 正在对比命中响应缓存与每次执行处理函数的吞吐量")
+    bench_response_cache()
+
+    print("📈 正在对比压缩前后的传输字节数与延迟")
+    bench_compression()
+
+    print("📈 正在对比分层挂载与单层路由表的查找耗时")
+    bench_mount()
+
+    print("📈 正在测量大量客户端下的限流开销")
+    bench_rate_limiter()
+
+    print("📈 正在测量响应写出的写入次数与耗时")
+    bench_response_write()
+
+    print("📈 正在对比一次性与流式 JSON 序列化的内存峰值")
+    bench_stream_json()
+
+    print("📈 正在测量请求解析的耗时与内存分配")
+    bench_request_parsing()
+
+    print("🎉 所有 Miniweb 测试完成！")
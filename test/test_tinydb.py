@@ -0,0 +1,924 @@
+import sys
+sys.path.append('lib')  # 在电脑上从仓库根目录运行时查找驱动
+
+import asyncio
+import json
+import os
+import time
+from tinydb import TinyDB, Query, where
+from tinydb.storages import MemoryStorage, LogStorage, JSONStorage, \
+    BinaryStorage
+from tinydb.binary import Codec, LazyTable
+from tinydb.middlewares import CachingMiddleware
+from tinydb.utils import LRUCache
+
+
+def sensor_rows(n):
+    rows = []
+    for i in range(n):
+        row = {'sensor': 's{}'.format(i % 50), 't': i % 1000,
+               'pos': {'room': i % 7}, 'label': i}
+        if i % 13 == 0:
+            row['t'] += 0.5
+        if i % 97 == 0:
+            row['label'] = None  # 不能排序的值
+        if i % 89 == 0:
+            row['label'] = 'x{}'.format(i)  # 字符串和数字混在同一个字段
+        if i % 83 == 0:
+            del row['sensor']  # 缺少字段
+        rows.append(row)
+    return rows
+
+
+def create_db(rows, indexed=True):
+    db = TinyDB(storage=MemoryStorage)
+    table = db.table('log', cache_size=0)
+    table.insert_multiple(rows)
+    if indexed:
+        table.create_index('sensor')
+        table.create_index('t', kind='sorted')
+        table.create_index(('pos', 'room'))
+        table.create_index('label', kind='sorted')
+    return db, table
+
+
+QUERIES = [
+    where('sensor') == 's7',
+    where('sensor') == 'missing',
+    where('sensor').one_of(['s1', 's2', 's3']),
+    where('t') == 10,
+    where('t') == 10.0,
+    where('t') < 20,
+    where('t') <= 20,
+    where('t') > 980,
+    where('t') >= 980,
+    where('t') > 500.5,
+    where('label') == 5,
+    where('label') == 'x89',
+    where('label') == None,
+    where('label') > 100,
+    where('label') < 'x5',
+    (where('sensor') == 's7') & (where('t') > 500),
+    (where('sensor') == 's7') | (where('sensor') == 's8'),
+    (where('sensor') == 's7') | (where('t') != 5),
+    where('pos').room == 3,
+    (where('pos').room == 3) & (where('t') < 100),
+    where('sensor').fragment({'sensor': 's9', 't': 9}),
+    Query().fragment({'sensor': 's9', 't': 9}),
+    where('pos').fragment({'room': 3}),
+    ~(where('sensor') == 's7'),
+]
+
+
+def outcome(method, query):
+    try:
+        return method(query)
+    except TypeError:
+        # 字符串和数字比较时全表扫描会出错，用索引时也要一样
+        return TypeError
+
+
+def check_queries(table, plain):
+    """有索引的表和没有索引的表查询结果相同"""
+    for query in QUERIES:
+        for name in ('search', 'count', 'get'):
+            expected = outcome(getattr(plain, name), query)
+            assert outcome(getattr(table, name), query) == expected, \
+                (name, query)
+
+
+def test_index_search():
+    rows = sensor_rows(2000)
+    db, table = create_db(rows)
+    plain = db.table('plain', cache_size=0)
+    plain.insert_multiple(rows)
+    check_queries(table, plain)
+
+    # 有索引时只对候选文档执行查询
+    checked = []
+
+    def counter(value):
+        checked.append(value)
+        return True
+    table.search(where('t').test(counter) & (where('sensor') == 's7'))
+    assert len(checked) == len(plain.search(where('sensor') == 's7'))
+
+    table.drop_index('sensor')
+    del checked[:]
+    table.search(where('t').test(counter) & (where('sensor') == 's7'))
+    assert len(checked) > 1000
+
+    # 嵌套字段上的 fragment 不使用顶层字段的索引
+    nested = db.table('nested', cache_size=0)
+    nested.insert_multiple([{'a': {'b': 1}}, {'b': 1}])
+    nested.create_index('b')
+    assert nested.search(Query().a.fragment({'b': 1})) == [{'a': {'b': 1}}]
+    assert nested.search(Query().fragment({'b': 1})) == [{'b': 1}]
+    assert Query().a.fragment({'b': 1}) != Query().fragment({'b': 1})
+
+
+def test_index_maintenance():
+    rows = sensor_rows(300)
+    db, table = create_db(rows)
+    plain = db.table('plain', cache_size=0)
+    plain.insert_multiple(rows)
+
+    for t in (table, plain):
+        t.insert({'sensor': 's7', 't': 501})
+        t.insert_multiple([{'sensor': 's8', 't': 999}, {'t': 5}])
+        t.update({'t': 600}, where('sensor') == 's7')
+        t.update(lambda doc: doc.update(sensor='s9'), doc_ids=[1, 2, 3])
+        t.update({'pos': {'room': 3}}, doc_ids=[10])
+        t.update_multiple([({'t': 998}, where('sensor') == 's8')])
+        t.upsert({'sensor': 'new', 't': 1}, where('sensor') == 'new')
+        t.remove_to(where('t') < 10)
+        t.remove_to(doc_ids=[20, 21])
+    check_queries(table, plain)
+
+    # 写入失败时索引保持不变
+    try:
+        table.insert_multiple([{'sensor': 's7'}, 'not a document'])
+    except ValueError:
+        pass
+    check_queries(table, plain)
+
+    table.truncate()
+    assert table.search(where('sensor') == 's7') == []
+    table.insert({'sensor': 's7', 't': 1})
+    assert table.search(where('t') < 5) == [{'sensor': 's7', 't': 1}]
+
+
+def test_lru_cache():
+    cache = LRUCache(capacity=3, max_size=10)
+    cache['empty'] = []
+    assert cache.get('empty') == []  # 空结果也算命中
+    assert cache.hits == 1 and cache.misses == 0
+    assert cache.get('missing') is None and cache.misses == 1
+
+    cache.set('a', 'A', 4)
+    cache.set('b', 'B', 4)
+    assert cache.lru == ['empty', 'a', 'b']
+    cache.get('empty')
+    cache.set('c', 'C', 1)  # 超过容量，淘汰最久没用的 a
+    assert cache.lru == ['b', 'empty', 'c']
+    cache.set('d', 'D', 6)  # 超过文档数预算，淘汰 b
+    assert cache.lru == ['empty', 'c', 'd'] and cache.size == 8
+    cache.set('huge', 'H', 11)  # 一个条目就超过预算时不缓存
+    assert 'huge' not in cache and cache.evictions == 2
+    cache.set('c', 'C2', 2)
+    assert cache['c'] == 'C2' and cache.size == 9
+    del cache['d']
+    assert cache.size == 3 and cache.hit_rate == 3 / 4
+
+
+def test_query_cache():
+    rows = sensor_rows(300)
+    db, table = create_db(rows, indexed=False)
+    table = db.table('cached', cache_size=100)
+    plain = db.table('plain', cache_size=0)
+    table.insert_multiple(rows)
+    plain.insert_multiple(rows)
+
+    def check():
+        for query in QUERIES:
+            assert outcome(table.search, query) == \
+                outcome(plain.search, query), query
+
+    check()
+    check()
+    hits = table.cache_stats()['hits']
+    assert hits > 0
+
+    # 写入后缓存的结果和重新查询的结果相同
+    for t in (table, plain):
+        t.insert({'sensor': 's7', 't': 501})
+        t.insert_multiple([{'sensor': 's8', 't': 999}, {'t': 5}])
+    check()
+    for t in (table, plain):
+        t.update({'t': 600}, where('sensor') == 's7')
+        t.update({'color': 'red'}, where('sensor') == 's7')
+    check()
+    for t in (table, plain):
+        t.update(lambda doc: doc.update(sensor='s9'), doc_ids=[1, 2, 3])
+        t.update({'pos': {'room': 3}}, doc_ids=[10])
+        t.update_multiple([({'t': 998}, where('sensor') == 's8')])
+    check()
+    for t in (table, plain):
+        t.upsert({'sensor': 'new', 't': 1}, where('sensor') == 'new')
+        t.remove_to(where('t') < 10)
+        t.remove_to(doc_ids=[20, 21])
+    check()
+
+    # 只修改查询没有用到的字段时保留缓存，但返回的是修改后的文档
+    query = where('sensor') == 's7'
+    table.search(query)
+    hits = table.cache_stats()['hits']
+    table.update({'color': 'blue'}, query)
+    docs = table.search(query)
+    assert table.cache_stats()['hits'] == hits + 1
+    assert docs and all(doc['color'] == 'blue' for doc in docs)
+    docs[0]['sensor'] = 'changed'  # 修改返回的文档不影响缓存
+    assert table.search(query)[0]['sensor'] == 's7'
+
+    # 空结果也会被缓存
+    hits = table.cache_stats()['hits']
+    assert table.search(where('sensor') == 'missing') == []
+    assert table.cache_stats()['hits'] == hits + 1
+
+    # 嵌套字段上的 fragment 在这个字段改变后重新查询
+    nested = db.table('nested')
+    nested.insert({'a': {'b': 1}})
+    query = Query().a.fragment({'b': 1})
+    assert len(nested.search(query)) == 1
+    nested.update({'a': {'b': 3}}, doc_ids=[1])
+    assert nested.search(query) == []
+
+    stats = db.table('limited', cache_docs=5).cache_stats()
+    assert stats['queries'] == 0 and stats['docs'] == 0
+
+
+def iter_peak_memory(table, query, lazy):
+    import tracemalloc
+
+    tracemalloc.start()
+    if lazy:
+        for doc in table.iter_search(query):
+            pass
+    else:
+        for doc in table.search(query):
+            pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def test_lazy_search():
+    rows = sensor_rows(500)
+    db, table = create_db(rows)
+    plain = db.table('plain', cache_size=0)
+    plain.insert_multiple(rows)
+    cached = db.table('cached')
+    cached.insert_multiple(rows)
+
+    for query in QUERIES:
+        expected = outcome(plain.search, query)
+        if expected is TypeError:
+            continue
+        for t in (table, plain, cached):
+            assert list(t.iter_search(query)) == expected, query
+            t.search(query)  # 第二次从缓存分页
+            for offset, limit in ((0, 5), (3, 4), (10, None), (600, 5)):
+                end = None if limit is None else offset + limit
+                page = expected[offset:end]
+                assert list(t.iter_search(query, offset, limit)) == page
+                assert t.search(query, offset=offset, limit=limit) == page
+    assert plain.all(offset=498) == plain.all()[498:]
+    assert plain.all(limit=0) == []
+
+    # 找到需要的文档后就停止检查
+    checked = []
+
+    def counter(value):
+        checked.append(value)
+        return True
+    assert plain.get(where('t').test(counter)).doc_id == 1
+    assert plain.contains(where('t').test(counter))
+    assert len(list(plain.iter_search(where('t').test(counter), 2, 3))) == 3
+    assert len(checked) == 7
+    assert plain.contains(doc_id=500) and not plain.contains(doc_id=501)
+
+    # 遍历时修改表会出错
+    found = plain.iter_search(where('sensor') == 's7')
+    next(found)
+    plain.insert({'sensor': 's7'})
+    try:
+        next(found)
+    except RuntimeError:
+        pass
+    else:
+        assert False, 'iter_search() ignored a change of the table'
+
+    # 逐个返回文档时内存峰值不随结果数量增长
+    query = where('t') >= 0
+    assert iter_peak_memory(plain, query, True) * 20 < \
+        iter_peak_memory(plain, query, False)
+
+
+def test_in_memory_table():
+    import tempfile
+
+    db = TinyDB(storage=MemoryStorage)
+    table = db.table('log')
+    other = db.table('other')
+    table.insert_multiple(sensor_rows(100))
+    other.insert({'a': 1})
+    table.update({'t': -1}, doc_ids=[5])
+    table.remove_to(doc_ids=[6])
+    table.insert({'sensor': 's1'})
+
+    # 存储中的文档 ID 是字符串，和内存中的表一致，两个表互不覆盖
+    raw = db.storage.read()
+    assert sorted(raw['log'], key=int) == [str(i) for i in range(1, 102)
+                                           if i != 6]
+    assert raw['log']['5']['t'] == -1
+    assert raw['other'] == {'1': {'a': 1}}
+    assert len(table) == 100 and table.get(doc_id=101) == {'sensor': 's1'}
+
+    # 写入失败时内存中的表回到存储中的状态
+    try:
+        table.insert_multiple([{'sensor': 's2'}, 'not a document'])
+    except ValueError:
+        pass
+    assert len(table) == 100 and table.get(doc_id=102) is None
+    assert table.insert({'sensor': 's3'}) == 102
+
+    # 遍历时写入不受影响
+    for doc in table:
+        if doc.doc_id == 1:
+            table.insert({'sensor': 'loop'})
+    assert table.count(where('sensor') == 'loop') == 1
+
+    # 仍持有的表对象在 drop_tables 后不会返回旧数据
+    db.drop_tables()
+    assert table.all() == [] and len(table) == 0
+    table.insert({'sensor': 's1'})
+    assert db.table('log').all() == [{'sensor': 's1'}]
+
+    # JSON 文件：重新打开后数据相同
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'db.json')
+        db = TinyDB(path)
+        table = db.table('log')
+        table.insert_multiple(sensor_rows(20))
+        table.update({'t': 99}, where('sensor') == 's3')
+        table.remove_to(doc_ids=[1])
+        expected = table.all()
+        db.close()
+        db = TinyDB(path)
+        assert db.table('log').all() == expected
+        assert [doc.doc_id for doc in db.table('log')] == list(range(2, 21))
+
+        # 写入时不再重新解析整个 JSON 文件
+        load = json.load
+        loads = []
+        json.load = lambda handle: loads.append(1) or load(handle)
+        try:
+            for i in range(10):
+                db.table('log').insert({'t': i})
+                db.table('other').insert({'t': i})
+        finally:
+            json.load = load
+        assert loads == []
+        db.close()
+        db = TinyDB(path)
+        assert len(db.table('other')) == 10
+        db.close()
+
+
+def log_records(path):
+    with open(path) as handle:
+        return [json.loads(line) for line in handle]
+
+
+def test_log_storage():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'db.jsonl')
+        db = TinyDB(path, storage=LogStorage)
+        table = db.table('log')
+        other = db.table('other')
+        table.insert_multiple(sensor_rows(10))
+        other.insert({'a': 1})
+
+        # 每次写入只追加一行
+        count = len(log_records(path))
+        table.insert({'sensor': 's1', 't': 1})
+        table.update({'t': 2}, doc_ids=[3])
+        table.remove_to(doc_ids=[4])
+        other.truncate()
+        records = log_records(path)
+        assert len(records) == count + 4
+        assert records[-4:] == [['log', '11', {'sensor': 's1', 't': 1}],
+                                ['log', '3', table.get(doc_id=3)],
+                                ['log', '4'], ['other']]
+
+        # 重新打开时从日志恢复数据
+        expected = table.all()
+        db.close()
+        db = TinyDB(path, storage=LogStorage)
+        assert db.table('log').all() == expected
+        assert [doc.doc_id for doc in db.table('log')] == \
+            [1, 2, 3, 5, 6, 7, 8, 9, 10, 11]
+        assert db.tables() == {'log', 'other'} and db.table('other').all() == []
+
+        # 掉电时写了一半的最后一行被丢弃
+        db.close()
+        with open(path, 'a') as handle:
+            handle.write('["log", "99", {"sens')
+        db = TinyDB(path, storage=LogStorage)
+        assert db.table('log').all() == expected
+        assert len(log_records(path)) == 12
+
+        # 中间损坏的行被跳过，后面的记录仍然保留
+        db.close()
+        with open(path) as handle:
+            lines = handle.readlines()
+        lines[4] = lines[4][:20] + '\n'
+        with open(path, 'w') as handle:
+            handle.write(''.join(lines))
+        db = TinyDB(path, storage=LogStorage)
+        assert [doc.doc_id for doc in db.table('log')] == \
+            [1, 2, 3, 6, 7, 8, 9, 10, 11]
+        db.close()
+        with open(path) as handle:
+            assert len(handle.readlines()) == 12
+        db = TinyDB(path, storage=LogStorage)
+        assert len(db.table('log')) == 9
+
+        # 过期的行达到比例后压缩日志
+        table = db.table('log')
+        for i in range(200):
+            table.update({'t': i}, doc_ids=[1])
+        assert db.storage.lines <= LogStorage.min_compact_lines
+        assert not os.path.exists(path + '.tmp')
+        db.close()
+        db = TinyDB(path, storage=LogStorage)
+        assert db.table('log').get(doc_id=1)['t'] == 199
+
+        # 后台压缩：写入时不压缩，由 asyncio 任务完成
+        async def main():
+            task = asyncio.create_task(db.storage.compactor(interval=0.01))
+            await asyncio.sleep(0)
+            for i in range(300):
+                db.table('log').update({'t': i}, doc_ids=[2])
+            assert db.storage.lines > 300
+            await asyncio.sleep(0.05)
+            assert db.storage.lines < 20
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        asyncio.run(main())
+        assert not db.storage.background
+
+        db.drop_tables()
+        assert log_records(path) == []
+        db.close()
+
+
+def telemetry_rows(n):
+    return [{'ts': 1700000000 + i * 60, 'temp': 20 + i % 100 / 10,
+             'hum': 40 + i % 50, 'co2': 400 + i % 300, 'ok': i % 7 != 0}
+            for i in range(n)]
+
+
+def change_tables(db):
+    table = db.table('log')
+    table.insert_multiple(sensor_rows(300))
+    table.insert({'sensor': 's7', 'text': '温度 😀', 'big': -2 ** 70})
+    table.update({'t': 600.25}, where('sensor') == 's7')
+    table.update(lambda doc: doc.update(sensor='s9'), doc_ids=[1, 2, 3])
+    table.remove_to(where('t') < 10)
+    table.remove_to(doc_ids=[20, 21])
+    db.table('empty').insert({'x': 1})
+    db.table('empty').truncate()
+    db.table('dropped').insert({'x': 1})
+    db.drop_table('dropped')
+    db.table('telemetry').insert_multiple(telemetry_rows(200))
+
+
+def all_tables(db):
+    return {name: db.table(name).all() for name in db.tables()}
+
+
+def test_binary_storage():
+    import tempfile
+
+    codec = Codec(max_shapes=2)
+    for doc in ({'a': None, 'b': True, 'c': -5, 'd': 2 ** 40, 'e': 0.1,
+                 'f': 1e300, 'g': float('inf'), 'h': 'x' * 70000,
+                 'i': [1, [2.5, {'j': False}]], 'k': 10 ** 30, 'l': {}},
+                {'a': 1}, {'b': 2}, {'c': '😀', 'd': (1, 2)}):
+        data, _ = codec.encode(doc)
+        assert codec.decode(bytes(data)) == json.loads(json.dumps(doc))
+    assert len(codec.shapes) == 2  # 形状数量达到上限后按通用格式保存
+
+    # 整数的大小不影响形状，数值跨过位宽时不会产生新形状
+    codec = Codec()
+    for value in (0, -1, 127, 300, -70000, 2 ** 40, -2 ** 63, 10 ** 30):
+        data, _ = codec.encode({'ts': value, 'ok': True, 't': 0.5})
+        assert codec.decode(bytes(data)) == {'ts': value, 'ok': True, 't': 0.5}
+    assert len(codec.shapes) == 1
+
+    # 浮点数的精度也不影响形状，每个值选择自己的宽度
+    for t, h in ((0.5, 0.1), (0.1, 0.5), (0.5, 2.25), (0.1, 1e300)):
+        doc = {'ts': 1, 'ok': True, 't': t, 'h': h}
+        data, _ = codec.encode(doc)
+        assert codec.decode(bytes(data)) == doc
+    assert len(codec.shapes) == 2
+    assert len(codec.encode({'ts': 5, 'ok': True, 't': 0.5})[0]) == 8
+
+    expected = TinyDB(storage=MemoryStorage)
+    change_tables(expected)
+    expected = all_tables(expected)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'db.bin')
+        db = TinyDB(path, storage=BinaryStorage)
+        change_tables(db)
+        assert all_tables(db) == expected
+        db.close()
+
+        # 打开时只读取索引，访问文档时才解码
+        db = TinyDB(path, storage=BinaryStorage)
+        table = db.table('log')
+        assert len(table) == len(expected['log'])
+        assert db.storage.docs_decoded == 0
+        first = expected['log'][0]
+        assert table.get(doc_id=first.doc_id) == first
+        assert db.storage.docs_decoded == 1
+        assert all_tables(db) == expected
+        assert table.get(doc_id=301) == {'sensor': 's7', 'text': '温度 😀',
+                                         'big': -2 ** 70, 't': 600.25}
+
+        # 追加的记录多了以后压缩文件
+        db.storage.min_compact_records = 10
+        db.storage.tail_ratio = 0.05
+        telemetry = db.table('telemetry')
+        for i in range(30):
+            telemetry.update({'co2': i}, doc_ids=[1])
+        assert db.storage.tail < 10
+        telemetry.update({'co2': 1234}, doc_ids=[2])
+        expected['telemetry'][0]['co2'] = 29
+        expected['telemetry'][1]['co2'] = 1234
+        assert all_tables(db) == expected
+        db.close()
+
+        # 追加到一半断电：丢掉不完整的记录
+        size = os.stat(path)[6]
+        with open(path, 'ab') as handle:
+            handle.write(b'\x01\x02\x03')
+        db = TinyDB(path, storage=BinaryStorage)
+        assert all_tables(db) == expected
+        assert os.stat(path)[6] <= size
+
+        # 中间损坏的记录被跳过，后面的记录仍然保留
+        telemetry = db.table('telemetry')
+        pos = os.stat(path)[6]
+        telemetry.update({'co2': 1}, doc_ids=[1])
+        telemetry.update({'co2': 2}, doc_ids=[2])
+        db.close()
+        with open(path, 'r+b') as handle:
+            handle.seek(pos)
+            handle.write(b'\xff')
+        db = TinyDB(path, storage=BinaryStorage)
+        assert db.table('telemetry').get(doc_id=1)['co2'] == 29
+        assert db.table('telemetry').get(doc_id=2)['co2'] == 2
+        db.close()
+
+        # 打开文件后新建的表也只在访问时解码文档，不在内存中保留
+        db = TinyDB(path, storage=BinaryStorage)
+        events = db.table('events')
+        for i in range(300):
+            events.insert({'ts': i})
+        assert type(db.storage.data['events']) is LazyTable
+        assert all(doc is None for _, doc in events._table.stored())
+        db.storage.compact()
+        db.table('fresh').insert({'a': 1})
+        db.storage.data['fresh2'] = {'1': {'b': 2}}
+        db.storage.compact()
+        assert type(db.storage.data['fresh2']) is LazyTable
+        assert db.table('fresh2').get(doc_id=1) == {'b': 2}
+        decoded = db.storage.docs_decoded
+        assert events.get(doc_id=300) == {'ts': 299}
+        assert db.storage.docs_decoded == decoded + 1
+        for name in ('events', 'fresh', 'fresh2'):
+            db.drop_table(name)
+        db.close()
+
+        # 和 CachingMiddleware 一起使用
+        db = TinyDB(path, storage=CachingMiddleware(BinaryStorage))
+        db.table('log').truncate()
+        db.table('telemetry').insert({'ts': 1})
+        db.close()
+        db = TinyDB(path, storage=BinaryStorage)
+        assert db.table('log').all() == []
+        assert db.table('telemetry').get(doc_id=201) == {'ts': 1}
+        db.close()
+
+
+def load_cost(storage, path, rows):
+    db = TinyDB(path, storage=storage)
+    db.table('telemetry').insert_multiple(rows)
+    db.close()
+    size = os.stat(path)[6]
+
+    import tracemalloc
+
+    start = time.time()
+    db = TinyDB(path, storage=storage)
+    table = db.table('telemetry')
+    table.get(doc_id=len(rows))
+    loaded = (time.time() - start) * 1e3
+
+    # 打开数据库后占用的内存
+    db.close()
+    tracemalloc.start()
+    db = TinyDB(path, storage=storage)
+    table = db.table('telemetry')
+    table.get(doc_id=len(rows))
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.time()
+    table.search(where('co2') == 500)
+    scanned = (time.time() - start) * 1e3
+    db.close()
+    return size, loaded, memory, scanned
+
+
+def bench_binary_storage(sizes=(1000, 10000, 50000)):
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            rows = telemetry_rows(size)
+            results = [load_cost(storage, os.path.join(tmp, name), rows)
+                       for storage, name in ((JSONStorage, 'db.json'),
+                                             (BinaryStorage, 'db.bin'))]
+            print('  ➡️ {} 条文档：'.format(size))
+            for name, (size, loaded, memory, scanned) in zip(
+                    ('JSON', '二进制'), results):
+                print('    {}：文件 {:.0f} KB，打开并读取一条 {:.1f} ms、'
+                      '占用内存 {:.0f} KB，全表查询 {:.1f} ms'.format(
+                          name, size / 1024, loaded, memory / 1024, scanned))
+
+
+def read_json(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def test_caching_flush_policy():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'db.json')
+
+        # 达到写入次数上限时写入文件
+        db = TinyDB(path, storage=CachingMiddleware(JSONStorage, max_writes=3))
+        table = db.table('log')
+        table.insert({'t': 1})
+        table.insert({'t': 2})
+        assert os.path.getsize(path) == 0
+        table.insert({'t': 3})
+        assert len(read_json(path)['log']) == 3
+        table.insert({'t': 4})
+        db.close()
+        assert len(read_json(path)['log']) == 4
+
+        # 达到估计的脏数据字节数时写入文件
+        db = TinyDB(path, storage=CachingMiddleware(
+            JSONStorage, max_dirty_bytes=200))
+        table = db.table('log')
+        table.insert({'text': 'x' * 100})
+        assert len(read_json(path)['log']) == 4
+        table.insert({'text': 'x' * 100})
+        assert len(read_json(path)['log']) == 6
+        db.close()
+
+        # 没有设置 max_dirty_bytes 时不估计字节数
+        db = TinyDB(storage=CachingMiddleware(MemoryStorage))
+        db.table('log').insert({'text': 'x' * 100})
+        assert db.storage._dirty_bytes == 0
+
+        # 没有写入时由 asyncio 任务按时间写入文件
+        async def main():
+            db = TinyDB(path, storage=CachingMiddleware(
+                JSONStorage, max_age_ms=50))
+            task = asyncio.create_task(db.storage.flusher(interval_ms=10))
+            db.table('log').insert({'t': 7})
+            await asyncio.sleep(0.02)
+            assert len(read_json(path)['log']) == 6
+            await asyncio.sleep(0.08)
+            assert len(read_json(path)['log']) == 7
+            task.cancel()
+            db.close()
+        asyncio.run(main())
+
+        # 写入失败时旧文件保持完整，不留下临时文件
+        db = TinyDB(path)
+        try:
+            db.table('log').insert({'bad': object()})
+        except TypeError:
+            pass
+        assert len(read_json(path)['log']) == 7
+        assert not os.path.exists(path + '.tmp')
+        db.close()
+
+        # FAT 文件系统上替换到一半断电：只剩临时文件
+        os.rename(path, path + '.tmp')
+        db = TinyDB(path)
+        assert len(db.table('log')) == 7
+        db.close()
+
+        # 只有一个表改变时，LogStorage 只追加改变的文档
+        path = os.path.join(tmp, 'db.jsonl')
+        db = TinyDB(path, storage=CachingMiddleware(LogStorage, max_writes=5))
+        table = db.table('log')
+        for i in range(5):
+            table.insert({'t': i})
+        table.update({'t': -1}, doc_ids=[1])
+        table.update({'t': -2}, doc_ids=[1])
+        db.close()
+        assert len(log_records(path)) == 6
+        assert TinyDB(path, storage=LogStorage).table('log').get(
+            doc_id=1) == {'t': -2}
+
+    # max_writes=None 时不按写入次数写入
+    writes = []
+
+    class TimerStorage(MemoryStorage):
+        def write(self, data):
+            writes.append(len(data['log']))
+            if len(writes) == 1:
+                # 模拟写入期间定时器触发：再次 flush 直接返回，
+                # 这时的改变由正在进行的 flush 一并写入
+                db.storage.flush()
+                db.table('log').insert({'t': 'timer'})
+            super().write(data)
+
+    db = TinyDB(storage=CachingMiddleware(TimerStorage, max_writes=None))
+    db.table('log').insert_multiple({'t': i} for i in range(10))
+    for i in range(CachingMiddleware.WRITE_CACHE_SIZE):
+        db.table('log').update({'t': i}, doc_ids=[1])
+    assert writes == []
+    db.storage.flush()
+    assert writes == [10, 11] and not db.storage.flush_if_needed()
+    db.close()
+    assert writes == [10, 11]
+
+
+def search_time(table, query, n):
+    start = time.time()
+    for _ in range(n):
+        table.search(query)
+    return (time.time() - start) / n * 1e3
+
+
+def bench_index(sizes=(1000, 10000, 100000)):
+    for size in sizes:
+        rows = sensor_rows(size)
+        _, plain = create_db(rows, indexed=False)
+        _, table = create_db(rows)
+        n = max(1, 20000 // size)
+        for name, query in [
+                ("where('sensor') == 's7'", where('sensor') == 's7'),
+                ("where('t') >= 995", where('t') >= 995)]:
+            scan = search_time(plain, query, n)
+            indexed = search_time(table, query, n)
+            print('  ➡️ {} 条文档 {}：全表扫描 {:.2f} ms，索引 {:.2f} ms'.format(
+                size, name, scan, indexed))
+
+
+def write_rate(size, n=200):
+    _, table = create_db(sensor_rows(size), indexed=False)
+    start = time.time()
+    for i in range(n):
+        table.insert({'sensor': 's1', 't': i})
+    insert_rate = n / (time.time() - start)
+    start = time.time()
+    for i in range(n):
+        table.update({'t': i}, doc_ids=[i + 1])
+    update_rate = n / (time.time() - start)
+    return insert_rate, update_rate
+
+
+def bench_write(sizes=(1000, 10000, 50000)):
+    for size in sizes:
+        insert_rate, update_rate = write_rate(size)
+        print('  ➡️ {} 条文档：insert {:.0f} 次/秒，update {:.0f} 次/秒'.format(
+            size, insert_rate, update_rate))
+
+
+def storage_write_cost(storage, path, size, n):
+    db = TinyDB(path, storage=storage)
+    table = db.table('log')
+    table.insert_multiple(sensor_rows(size))
+    written = 0
+    start = time.time()
+    for i in range(n):
+        before = getattr(db.storage, 'bytes_written', 0)
+        table.insert({'sensor': 's1', 't': i})
+        if storage is LogStorage:
+            written += db.storage.bytes_written - before
+        else:
+            # JSONStorage 每次都重写整个文件
+            written += os.stat(path)[6]
+    rate = n / (time.time() - start)
+    db.close()
+    return rate, written / n
+
+
+def cache_hit_rate(clear, n=500):
+    db = TinyDB(storage=MemoryStorage)
+    table = db.table('status')
+    table.insert_multiple(
+        {'sensor': 's{}'.format(i % 20), 'value': i} for i in range(2000))
+    start = time.time()
+    for i in range(n):
+        # 查询传感器的同时不断更新读数
+        table.update({'value': i}, doc_ids=[i % 2000 + 1])
+        if clear:
+            table.clear_cache()  # 原来每次写入都清空整个缓存
+        table.search(where('sensor') == 's{}'.format(i % 5))
+    return table.cache_stats()['hit_rate'], (time.time() - start) / n * 1e3
+
+
+def bench_query_cache():
+    for name, clear in (('每次写入清空缓存', True), ('按字段失效', False)):
+        hit_rate, ms = cache_hit_rate(clear)
+        print('  ➡️ {}：命中率 {:.0%}，每次更新加查询 {:.2f} ms'.format(
+            name, hit_rate, ms))
+
+
+def bench_lazy_search(sizes=(1000, 10000, 50000)):
+    for size in sizes:
+        db, table = create_db(sensor_rows(size), indexed=False)
+        query = where('t') >= 0
+        table.all()
+        print('  ➡️ {} 条文档：search {:.0f} KB，iter_search {:.1f} KB'.format(
+            size, iter_peak_memory(table, query, False) / 1024,
+            iter_peak_memory(table, query, True) / 1024))
+
+
+def bench_log_storage(sizes=(100, 1000, 5000), n=100):
+    import tempfile
+    from tinydb.storages import JSONStorage
+
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            json_rate, json_bytes = storage_write_cost(
+                JSONStorage, os.path.join(tmp, 'db.json'), size, n)
+            log_rate, log_bytes = storage_write_cost(
+                LogStorage, os.path.join(tmp, 'db.jsonl'), size, n)
+        print('  ➡️ {} 条文档：JSONStorage {:.0f} 次/秒、每次写入 {:.0f} 字节，'
+              'LogStorage {:.0f} 次/秒、每次写入 {:.0f} 字节'.format(
+                  size, json_rate, json_bytes, log_rate, log_bytes))
+
+
+if __name__ == '__main__':
+    print('''
+【TinyDB 测试程序】
+──────────────────────────────────────────────
+在电脑上从仓库根目录运行：python test/test_tinydb.py
+──────────────────────────────────────────────''')
+
+    print("🚩 开始测试 TinyDB 功能...")
+
+    print("🔎 正在测试索引查询")
+    test_index_search()
+
+    print("🔁 正在测试写入时增量维护索引")
+    test_index_maintenance()
+
+    print("🧠 正在测试查询缓存")
+    test_lru_cache()
+    test_query_cache()
+
+    print("🚶 正在测试逐个返回文档的查询和分页")
+    test_lazy_search()
+
+    print("💾 正在测试内存中的表与存储同步")
+    test_in_memory_table()
+
+    print("📜 正在测试追加写入的日志存储 LogStorage")
+    test_log_storage()
+
+    print("⏲️ 正在测试 CachingMiddleware 写入策略与原子写入")
+    test_caching_flush_policy()
+
+    print("🧱 正在测试二进制存储 BinaryStorage")
+    test_binary_storage()
+
+    print("📈 正在对比索引查询与全表扫描的耗时")
+    bench_index()
+
+    print("📈 正在对比查询缓存的命中率")
+    bench_query_cache()
+
+    print("📈 正在对比 search 与 iter_search 的内存峰值")
+    bench_lazy_search()
+
+    print("📈 正在测试不同表大小下的写入速度")
+    bench_write()
+
+    print("📈 正在对比 JSONStorage 与 LogStorage 的写入速度和写入字节数")
+    bench_log_storage()
+
+    print("📈 正在对比 JSONStorage 与 BinaryStorage 的文件大小和打开速度")
+    bench_binary_storage()
+
+    print("✅ 全部测试通过！")